@@ -0,0 +1,13 @@
+from datetime import datetime
+
+from pydantic import BaseModel
+
+from utils.export import ExportFormat
+
+
+class AbsenceExportQuery(BaseModel):
+    subject_id: int | None = None
+    student_id: int | None = None
+    date_from: datetime | None = None
+    date_to: datetime | None = None
+    format: ExportFormat = ExportFormat.NDJSON
@@ -0,0 +1,25 @@
+from sqlalchemy import select, Select
+
+from absences.models import Absence
+from absences.schemas import AbsenceExportQuery
+
+
+def export_absences_statement(query: AbsenceExportQuery) -> Select:
+    statement = select(
+        Absence.id,
+        Absence.student_id,
+        Absence.subject_id,
+        Absence.date,
+        Absence.is_excused,
+    )
+
+    if query.subject_id is not None:
+        statement = statement.where(Absence.subject_id == query.subject_id)
+    if query.student_id is not None:
+        statement = statement.where(Absence.student_id == query.student_id)
+    if query.date_from is not None:
+        statement = statement.where(Absence.date >= query.date_from)
+    if query.date_to is not None:
+        statement = statement.where(Absence.date < query.date_to)
+
+    return statement.order_by(Absence.id)
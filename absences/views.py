@@ -1,4 +1,25 @@
-from fastapi import APIRouter
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
 from starlette import status
 
-router = APIRouter(prefix="/absences", tags=["absences"])
\ No newline at end of file
+from absences.schemas import AbsenceExportQuery
+from absences.service import export_absences_statement
+from auth.RoleChecker import RoleChecker
+from auth.identity import Identity
+from auth.models import Role
+from utils.export import export_response
+
+router = APIRouter(prefix="/absences", tags=["absences"])
+
+principal_or_admin_dependency = Annotated[
+    Identity,
+    Depends(RoleChecker(
+        [
+            Role.PRINCIPAL,
+            Role.ADMIN
+        ]))]
+
+@router.get("/export", status_code=status.HTTP_200_OK)
+async def export(user: principal_or_admin_dependency, query: Annotated[AbsenceExportQuery, Query()]):
+    return export_response(export_absences_statement(query), query.format, "absences")
@@ -0,0 +1,216 @@
+import asyncio
+import fcntl
+import gzip
+import json
+import logging
+import os
+import uuid
+from dataclasses import dataclass, asdict
+from datetime import UTC, datetime, timedelta
+from typing import BinaryIO, List, Tuple
+
+from sqlalchemy import select, delete
+
+from audit.models import AuditLog
+from audit.schemas import AuditQuery
+from database import Base, SessionLocal, engine
+from migrations import upgrade_schema
+
+logger = logging.getLogger(__name__)
+
+# Rows older than this many days are moved out of the database; 0 keeps everything in the database.
+AUDIT_RETENTION_DAYS = int(os.getenv("AUDIT_RETENTION_DAYS", 365))
+AUDIT_ARCHIVE_PATH = os.getenv("AUDIT_ARCHIVE_PATH", "./audit_archive")
+# One batch is one segment file and one short DELETE transaction.
+AUDIT_ARCHIVE_BATCH_SIZE = int(os.getenv("AUDIT_ARCHIVE_BATCH_SIZE", 1000))
+AUDIT_RETENTION_INTERVAL_SECONDS = float(os.getenv("AUDIT_RETENTION_INTERVAL_SECONDS", 3600))
+
+INDEX_FILE = "index.jsonl"
+LOCK_FILE = ".lock"
+
+
+@dataclass(frozen=True)
+class Segment:
+    file: str
+    min_timestamp: datetime
+    max_timestamp: datetime
+    min_id: int
+    max_id: int
+    rows: int
+
+
+def _to_json(row: dict) -> dict:
+    return {**row, "timestamp": row["timestamp"].isoformat()}
+
+def _from_json(row: dict) -> dict:
+    return {**row, "timestamp": datetime.fromisoformat(row["timestamp"])}
+
+def write_segment(directory: str, rows: List[dict]) -> Segment:
+    os.makedirs(directory, exist_ok=True)
+    # Batches are taken in (timestamp, id) order, so segments never overlap and a retry rewrites the same file.
+    segment = Segment(
+        file=f"audit-{rows[0]['id']:012d}-{rows[-1]['id']:012d}.jsonl.gz",
+        min_timestamp=rows[0]["timestamp"],
+        max_timestamp=rows[-1]["timestamp"],
+        min_id=rows[0]["id"],
+        max_id=rows[-1]["id"],
+        rows=len(rows),
+    )
+
+    path = os.path.join(directory, segment.file)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        for row in rows:
+            f.write(json.dumps(_to_json(row), separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+
+    entry = {**asdict(segment), "min_timestamp": segment.min_timestamp.isoformat(),
+             "max_timestamp": segment.max_timestamp.isoformat()}
+    with open(os.path.join(directory, INDEX_FILE), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+    return segment
+
+def load_segments(directory: str) -> List[Segment]:
+    path = os.path.join(directory, INDEX_FILE)
+    if not os.path.exists(path):
+        return []
+
+    segments = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            entry["min_timestamp"] = datetime.fromisoformat(entry["min_timestamp"])
+            entry["max_timestamp"] = datetime.fromisoformat(entry["max_timestamp"])
+            segments[entry["file"]] = Segment(**entry)
+    return sorted(segments.values(), key=lambda s: (s.min_timestamp, s.min_id))
+
+def read_segment(directory: str, segment: Segment) -> List[dict]:
+    with gzip.open(os.path.join(directory, segment.file), "rt", encoding="utf-8") as f:
+        return [_from_json(json.loads(line)) for line in f]
+
+def _matches(row: dict, query: AuditQuery, cursor: Tuple[datetime, int] | None) -> bool:
+    if query.user_id is not None and row["user_id"] != query.user_id:
+        return False
+    if query.action is not None and row["action"] != query.action.value:
+        return False
+    if query.entity_type is not None and row["entity_type"] != query.entity_type.value:
+        return False
+    if query.entity_id is not None and row["entity_id"] != query.entity_id:
+        return False
+    if query.created_from is not None and row["timestamp"] < query.created_from:
+        return False
+    if query.created_to is not None and row["timestamp"] >= query.created_to:
+        return False
+    return cursor is None or (row["timestamp"], row["id"]) < cursor
+
+def search_archive(
+        directory: str,
+        query: AuditQuery,
+        cursor: Tuple[datetime, int] | None,
+        limit: int,
+) -> List[AuditLog]:
+    found: List[dict] = []
+    for segment in reversed(load_segments(directory)):
+        if query.created_from is not None and segment.max_timestamp < query.created_from:
+            break
+        if query.created_to is not None and segment.min_timestamp >= query.created_to:
+            continue
+        if cursor is not None and (segment.min_timestamp, segment.min_id) >= cursor:
+            continue
+
+        rows = [row for row in read_segment(directory, segment) if _matches(row, query, cursor)]
+        found.extend(reversed(rows))
+        if len(found) >= limit:
+            break
+
+    return [AuditLog(**row) for row in found[:limit]]
+
+
+async def archive_batch(db, before: datetime, directory: str, batch_size: int) -> int:
+    statement = select(*AuditLog.__table__.c).where(
+        AuditLog.timestamp < before
+    ).order_by(AuditLog.timestamp, AuditLog.id).limit(batch_size)
+    rows = [dict(row) for row in (await db.execute(statement)).mappings().all()]
+    if not rows:
+        return 0
+
+    # The segment is durable before the rows go, so a crash in between only means the batch is archived twice.
+    await asyncio.to_thread(write_segment, directory, rows)
+    await db.execute(delete(AuditLog).where(AuditLog.id.in_([row["id"] for row in rows])))
+    await db.commit()
+    return len(rows)
+
+def _lock(directory: str) -> BinaryIO | None:
+    os.makedirs(directory, exist_ok=True)
+    file = open(os.path.join(directory, LOCK_FILE), "ab")  # pylint: disable=consider-using-with
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        return None
+    return file
+
+def _unlock(file: BinaryIO) -> None:
+    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    file.close()
+
+async def archive_audit_logs(
+        session_factory=SessionLocal,
+        retention_days: int = AUDIT_RETENTION_DAYS,
+        directory: str = AUDIT_ARCHIVE_PATH,
+        batch_size: int = AUDIT_ARCHIVE_BATCH_SIZE,
+) -> int:
+    # Every worker runs retention; whoever holds the archive lock does the run and the others skip this round,
+    # so two processes never select the same batch into the same segment.
+    lock = await asyncio.to_thread(_lock, directory)
+    if lock is None:
+        logger.debug("Audit log archival is already running in another process")
+        return 0
+
+    try:
+        before = datetime.now(UTC).replace(tzinfo=None) - timedelta(days=retention_days)
+        archived = 0
+        while True:
+            async with session_factory() as db:
+                moved = await archive_batch(db, before, directory, batch_size)
+            archived += moved
+            if moved < batch_size:
+                return archived
+            # Give queued request transactions a chance at the write lock between batches.
+            await asyncio.sleep(0)
+    finally:
+        await asyncio.to_thread(_unlock, lock)
+
+async def run_audit_retention(stop: asyncio.Event) -> None:
+    if AUDIT_RETENTION_DAYS <= 0:
+        return
+
+    while not stop.is_set():
+        try:
+            archived = await archive_audit_logs()
+            if archived:
+                logger.info("Archived %s audit log entries", archived)
+        except Exception as e:
+            logger.exception("Audit log archival failed: %s", e)
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=AUDIT_RETENTION_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def main() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+    archived = await archive_audit_logs()
+    await engine.dispose()
+    print(f"Archived {archived} audit log entries to {AUDIT_ARCHIVE_PATH}")
+
+
+# One-off run outside the server: python -m audit.archive
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,50 @@
-from sqlalchemy import ForeignKey, String, DateTime
+import enum
+
+from sqlalchemy import ForeignKey, String, DateTime, Integer, JSON, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.sql import func
 
 from auth.models import User
 from database import Base
 
-from datetime import datetime
+from datetime import datetime, UTC
+
+
+class AuditAction(str, enum.Enum):
+    USER_CREATED = "user.created"
+    SUBJECT_CREATED = "subject.created"
+    SUBJECT_STUDENTS_ADDED = "subject.students_added"
+    SUBJECT_STUDENTS_REMOVED = "subject.students_removed"
+    SUBJECT_STATUS_CHANGED = "subject.status_changed"
+    SUBJECT_TEACHER_CHANGED = "subject.teacher_changed"
+    SUBJECT_MATERIAL_ADDED = "subject.material_added"
+
+
+class AuditEntity(str, enum.Enum):
+    USER = "user"
+    SUBJECT = "subject"
 
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    # "What happened to this entity" and "what did this user do", both newest first.
+    __table_args__ = (
+        Index("ix_audit_logs_entity_type_entity_id_timestamp", "entity_type", "entity_id", "timestamp", "id"),
+        Index("ix_audit_logs_user_id_timestamp", "user_id", "timestamp", "id"),
+        Index("ix_audit_logs_timestamp_id", "timestamp", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     user: Mapped["User"] = relationship("User")
+    # Plain strings rather than database enums, so rows written before the structured form still load.
+    # The structured columns are added to existing tables by migrations.upgrade_schema.
     action: Mapped[str] = mapped_column(String)
-    timestamp: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
\ No newline at end of file
+    entity_type: Mapped[str | None] = mapped_column(String, nullable=True)
+    entity_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    payload: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # Keyset cursors need sub-second precision and one text form, which CURRENT_TIMESTAMP lacks on SQLite;
+    # older rows are normalized on upgrade.
+    timestamp: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(UTC).replace(tzinfo=None),
+    )
@@ -0,0 +1,36 @@
+import os
+from datetime import datetime
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from audit.models import AuditAction, AuditEntity
+
+AUDIT_PAGE_SIZE = int(os.getenv("AUDIT_PAGE_SIZE", 50))
+AUDIT_MAX_PAGE_SIZE = int(os.getenv("AUDIT_MAX_PAGE_SIZE", 500))
+
+
+class AuditLogResponse(BaseModel):
+    id: int
+    user_id: int
+    action: str
+    entity_type: str | None
+    entity_id: int | None
+    payload: dict | None
+    timestamp: datetime
+
+    model_config = ConfigDict(from_attributes=True)
+
+class AuditPage(BaseModel):
+    items: List[AuditLogResponse]
+    next_cursor: str | None
+
+class AuditQuery(BaseModel):
+    user_id: int | None = None
+    action: AuditAction | None = None
+    entity_type: AuditEntity | None = None
+    entity_id: int | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+    cursor: str | None = None
+    limit: int = Field(default=AUDIT_PAGE_SIZE, ge=1, le=AUDIT_MAX_PAGE_SIZE)
@@ -1,19 +1,63 @@
+import asyncio
+from typing import List, Tuple
+
 from fastapi import BackgroundTasks
+from sqlalchemy import select, tuple_
+
+from audit.archive import AUDIT_ARCHIVE_PATH, search_archive
+from audit.models import AuditLog, AuditAction, AuditEntity
+from audit.schemas import AuditQuery
+from audit.writer import audit_writer
+from dependency import read_db_dependency
+from utils.pagination import decode_cursor, split_page
+
+
+def log(
+        tasks: BackgroundTasks,
+        user_id: int,
+        action: AuditAction,
+        entity_type: AuditEntity | None = None,
+        entity_id: int | None = None,
+        payload: dict | None = None,
+):
+    # Entries are queued after the response and written in batches by the audit writer started in main.lifespan.
+    tasks.add_task(
+        audit_writer.put,
+        user_id=user_id,
+        action=action,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        payload=payload,
+    )
+
+async def get_audit_logs(
+        db: read_db_dependency,
+        query: AuditQuery,
+        archive_dir: str = AUDIT_ARCHIVE_PATH,
+) -> Tuple[List[AuditLog], str | None]:
+    statement = select(AuditLog)
+    if query.user_id is not None:
+        statement = statement.where(AuditLog.user_id == query.user_id)
+    if query.action is not None:
+        statement = statement.where(AuditLog.action == query.action.value)
+    if query.entity_type is not None:
+        statement = statement.where(AuditLog.entity_type == query.entity_type.value)
+    if query.entity_id is not None:
+        statement = statement.where(AuditLog.entity_id == query.entity_id)
+    if query.created_from is not None:
+        statement = statement.where(AuditLog.timestamp >= query.created_from)
+    if query.created_to is not None:
+        statement = statement.where(AuditLog.timestamp < query.created_to)
 
-from audit.models import AuditLog
-from database import SessionLocal
+    cursor = decode_cursor(query.cursor) if query.cursor is not None else None
+    if cursor is not None:
+        statement = statement.where(tuple_(AuditLog.timestamp, AuditLog.id) < cursor)
 
+    statement = statement.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(query.limit + 1)
+    logs = list((await db.scalars(statement)).all())
 
-def write_log_to_db(user_id: int, action: str):
-    db = SessionLocal()
-    try:
-        log_entry = AuditLog(user_id=user_id, action=action)
-        db.add(log_entry)
-        db.commit()
-    except Exception as e:
-        print(f"Failed to audit log: {e}")
-    finally:
-        db.close()
+    # Archived entries are all older than the ones still in the database, so they only ever extend the page.
+    if len(logs) <= query.limit:
+        logs.extend(await asyncio.to_thread(search_archive, archive_dir, query, cursor, query.limit + 1 - len(logs)))
 
-def log(tasks: BackgroundTasks, user_id: int, action: str):
-    tasks.add_task(write_log_to_db, user_id=user_id, action=action)
\ No newline at end of file
+    return split_page(logs, query.limit, sort_key="timestamp")
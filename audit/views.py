@@ -0,0 +1,20 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends, Query
+from starlette import status
+
+from audit.schemas import AuditPage, AuditQuery
+from audit.service import get_audit_logs
+from auth.RoleChecker import RoleChecker
+from auth.identity import Identity
+from auth.models import Role
+from dependency import read_db_dependency
+
+router = APIRouter(prefix="/audit", tags=["audit"])
+
+admin_dependency = Annotated[Identity, Depends(RoleChecker([Role.ADMIN]))]
+
+@router.get("/", status_code=status.HTTP_200_OK, response_model=AuditPage)
+async def get_all(user: admin_dependency, query: Annotated[AuditQuery, Query()], db: read_db_dependency):
+    logs, next_cursor = await get_audit_logs(db, query)
+    return AuditPage(items=logs, next_cursor=next_cursor)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, asdict
+from datetime import UTC, datetime
+from typing import List
+
+from sqlalchemy import insert
+
+from audit.models import AuditLog, AuditAction, AuditEntity
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 200))
+AUDIT_FLUSH_INTERVAL_MS = int(os.getenv("AUDIT_FLUSH_INTERVAL_MS", 250))
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 10000))
+# How long a request waits for room in a full queue before the entry is dropped.
+AUDIT_ENQUEUE_TIMEOUT_SECONDS = float(os.getenv("AUDIT_ENQUEUE_TIMEOUT_SECONDS", 1))
+
+
+@dataclass
+class AuditWriterMetrics:
+    enqueued: int = 0
+    written: int = 0
+    batches: int = 0
+    dropped: int = 0
+    failed: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+
+class AuditWriter:
+    def __init__(
+            self,
+            session_factory=SessionLocal,
+            batch_size: int = AUDIT_BATCH_SIZE,
+            flush_interval_ms: int = AUDIT_FLUSH_INTERVAL_MS,
+            max_queue: int = AUDIT_QUEUE_SIZE,
+            enqueue_timeout: float = AUDIT_ENQUEUE_TIMEOUT_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.enqueue_timeout = enqueue_timeout
+        self._queue: asyncio.Queue[dict] = asyncio.Queue(maxsize=max_queue)
+        self._metrics = AuditWriterMetrics()
+
+    @property
+    def metrics(self) -> dict:
+        self._metrics.queue_depth = self._queue.qsize()
+        return asdict(self._metrics)
+
+    async def put(
+            self,
+            user_id: int,
+            action: AuditAction,
+            entity_type: AuditEntity | None = None,
+            entity_id: int | None = None,
+            payload: dict | None = None,
+    ) -> None:
+        # The row is written later, so the time of the action is taken now rather than by the server default.
+        entry = {
+            "user_id": user_id,
+            "action": action.value,
+            "entity_type": entity_type.value if entity_type is not None else None,
+            "entity_id": entity_id,
+            "payload": payload,
+            "timestamp": datetime.now(UTC).replace(tzinfo=None),
+        }
+        try:
+            await asyncio.wait_for(self._queue.put(entry), timeout=self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            self._metrics.dropped += 1
+            logger.warning("Audit queue is full, dropped %s by user %s", action.value, user_id)
+            return
+
+        self._metrics.enqueued += 1
+        self._metrics.max_queue_depth = max(self._metrics.max_queue_depth, self._queue.qsize())
+
+    def _take(self, limit: int) -> List[dict]:
+        batch = []
+        while len(batch) < limit and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    async def _collect(self) -> List[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = self._take(self.batch_size)
+        while len(batch) < self.batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+            batch.extend(self._take(self.batch_size - len(batch)))
+        return batch
+
+    async def flush(self, batch: List[dict]) -> None:
+        if not batch:
+            return
+
+        try:
+            async with self.session_factory() as db:
+                await db.execute(insert(AuditLog), batch)
+                await db.commit()
+        except Exception as e:
+            self._metrics.failed += len(batch)
+            logger.exception("Failed to write %s audit entries: %s", len(batch), e)
+            return
+
+        self._metrics.written += len(batch)
+        self._metrics.batches += 1
+
+    async def drain(self) -> None:
+        while not self._queue.empty():
+            await self.flush(self._take(self.batch_size))
+
+    async def run(self, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            await self.flush(await self._collect())
+        await self.drain()
+
+
+audit_writer = AuditWriter()
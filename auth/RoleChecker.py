@@ -4,7 +4,8 @@ from fastapi import Depends
 from starlette import status
 from starlette.exceptions import HTTPException
 
-from auth.models import Role, User
+from auth.identity import Identity
+from auth.models import Role
 from auth.service import get_current_user
 
 
@@ -12,7 +13,7 @@ class RoleChecker:
     def __init__(self, allowed_roles: List[Role]):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, user: Annotated[User, Depends(get_current_user)]) -> User:
+    def __call__(self, user: Annotated[Identity, Depends(get_current_user)]) -> Identity:
         if user.role not in self.allowed_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
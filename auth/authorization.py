@@ -0,0 +1,93 @@
+from sqlalchemy import select, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from auth.cache import token_cache
+from auth.identity import Identity
+from auth.models import Role, parent_student_association
+from classes.models import class_students
+from subjects.models import subject_students
+
+# Every check is a single EXISTS probe on a composite primary key, so its cost doesn't grow with the size of a class,
+# a subject or a family.
+
+
+async def _exists(db: AsyncSession, *criteria) -> bool:
+    return bool(await db.scalar(select(exists().where(*criteria))))
+
+
+async def is_enrolled(db: AsyncSession, student_id: int, subject_id: int) -> bool:
+    return await _exists(
+        db,
+        subject_students.c.subject_id == subject_id,
+        subject_students.c.user_id == student_id,
+    )
+
+
+async def is_parent_of(db: AsyncSession, parent: Identity, student_id: int) -> bool:
+    # A cached snapshot already answers this without a query.
+    snapshot = token_cache.get_snapshot(parent.token_key) if parent.token_key else None
+    if snapshot is not None:
+        return student_id in snapshot.children_ids
+
+    return await _exists(
+        db,
+        parent_student_association.c.parent_id == parent.id,
+        parent_student_association.c.student_id == student_id,
+    )
+
+
+async def has_child_in_subject(db: AsyncSession, parent_id: int, subject_id: int) -> bool:
+    return await _exists(
+        db,
+        parent_student_association.c.parent_id == parent_id,
+        subject_students.c.subject_id == subject_id,
+        subject_students.c.user_id == parent_student_association.c.student_id,
+    )
+
+
+async def is_in_class(db: AsyncSession, student_id: int, class_id: int) -> bool:
+    return await _exists(
+        db,
+        class_students.c.class_id == class_id,
+        class_students.c.user_id == student_id,
+    )
+
+
+async def has_child_in_class(db: AsyncSession, parent_id: int, class_id: int) -> bool:
+    return await _exists(
+        db,
+        parent_student_association.c.parent_id == parent_id,
+        class_students.c.class_id == class_id,
+        class_students.c.user_id == parent_student_association.c.student_id,
+    )
+
+
+async def can_access_subject(db: AsyncSession, user: Identity, subject_id: int, teacher_id: int) -> bool:
+    match user.role:
+        case Role.TEACHER:
+            return teacher_id == user.id
+        case Role.STUDENT:
+            return await is_enrolled(db, user.id, subject_id)
+        case Role.PARENT:
+            return await has_child_in_subject(db, user.id, subject_id)
+    return True
+
+
+async def can_access_student(db: AsyncSession, user: Identity, student_id: int) -> bool:
+    match user.role:
+        case Role.STUDENT:
+            return student_id == user.id
+        case Role.PARENT:
+            return await is_parent_of(db, user, student_id)
+    return True
+
+
+async def can_access_class(db: AsyncSession, user: Identity, class_id: int, teacher_id: int) -> bool:
+    match user.role:
+        case Role.TEACHER:
+            return teacher_id == user.id
+        case Role.STUDENT:
+            return await is_in_class(db, user.id, class_id)
+        case Role.PARENT:
+            return await has_child_in_class(db, user.id, class_id)
+    return True
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, Set, Tuple
+
+from auth.identity import Identity
+from auth.models import Role
+
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", 300))
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    id: int
+    email: str
+    full_name: str
+    role: Role
+    date_of_birth: datetime
+    token_version: int
+    children_ids: Tuple[int, ...] = ()
+
+
+@dataclass
+class CacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    snapshot_hits: int = 0
+    snapshot_misses: int = 0
+    evictions: int = 0
+    invalidations: int = 0
+    size: int = 0
+
+
+@dataclass
+class _Entry:
+    identity: Identity
+    expires_at: float
+    snapshot: UserSnapshot | None = None
+
+
+class TokenCache:
+    def __init__(self, max_entries: int = AUTH_CACHE_MAX_ENTRIES, ttl_seconds: float = AUTH_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._keys_by_user: Dict[int, Set[str]] = {}
+        # Tokens below this version were revoked by a password change handled in this process.
+        self._min_token_version: Dict[int, int] = {}
+        self._metrics = CacheMetrics()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            self._metrics.size = len(self._entries)
+            return asdict(self._metrics)
+
+    def _get_entry(self, key: str) -> _Entry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry.identity.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry.identity.id]
+
+    def get_identity(self, key: str) -> Identity | None:
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None:
+                self._metrics.misses += 1
+                return None
+            self._metrics.hits += 1
+            return entry.identity
+
+    def put_identity(self, key: str, identity: Identity, token_expires_at: float | None) -> None:
+        expires_at = time.time() + self.ttl_seconds
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = _Entry(identity=identity, expires_at=expires_at)
+            self._keys_by_user.setdefault(identity.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._metrics.evictions += 1
+
+    def is_revoked(self, identity: Identity) -> bool:
+        with self._lock:
+            return identity.token_version < self._min_token_version.get(identity.id, 0)
+
+    def get_snapshot(self, key: str) -> UserSnapshot | None:
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is None or entry.snapshot is None:
+                self._metrics.snapshot_misses += 1
+                return None
+            self._metrics.snapshot_hits += 1
+            return entry.snapshot
+
+    def put_snapshot(self, key: str, snapshot: UserSnapshot) -> None:
+        with self._lock:
+            entry = self._get_entry(key)
+            if entry is not None:
+                entry.snapshot = snapshot
+
+    def invalidate_user(self, user_id: int, min_token_version: int | None = None) -> None:
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+            if min_token_version is not None:
+                self._min_token_version[user_id] = min_token_version
+            self._metrics.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+            self._min_token_version.clear()
+            self._metrics = CacheMetrics()
+
+
+token_cache = TokenCache()
@@ -0,0 +1,92 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+from pwdlib import PasswordHash
+from starlette import status
+from starlette.exceptions import HTTPException
+
+# argon2-cffi releases the GIL while hashing, so threads give real parallelism without pickling overhead.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Jobs handed to the executor at once; the rest wait on the event loop.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", 64))
+# Beyond this many waiting jobs new ones are refused, so a login flood can't pile up unbounded work.
+PASSWORD_HASH_MAX_WAITING = int(os.getenv("PASSWORD_HASH_MAX_WAITING", 256))
+
+
+@dataclass
+class HasherMetrics:
+    waiting: int = 0
+    in_executor: int = 0
+    completed: int = 0
+    rejected: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+
+
+class PasswordHasher:
+    def __init__(
+            self,
+            workers: int = PASSWORD_HASH_WORKERS,
+            max_pending: int = PASSWORD_HASH_MAX_PENDING,
+            max_waiting: int = PASSWORD_HASH_MAX_WAITING,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_waiting = max_waiting
+        self._password_hash = PasswordHash.recommended()
+        self._executor: ThreadPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(max_pending)
+        self._metrics = HasherMetrics()
+
+    @property
+    def metrics(self) -> dict:
+        self._metrics.queue_depth = self.queue_depth
+        return asdict(self._metrics)
+
+    @property
+    def queue_depth(self) -> int:
+        # Jobs that are not being hashed yet: blocked on the pending limit or sitting in the executor queue.
+        return self._metrics.waiting + max(0, self._metrics.in_executor - self.workers)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    async def _submit(self, func, *args):
+        if self._slots.locked() and self._metrics.waiting >= self.max_waiting:
+            self._metrics.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many password checks in progress, please try again",
+                headers={"Retry-After": "1"},
+            )
+
+        self._metrics.waiting += 1
+        self._metrics.max_queue_depth = max(self._metrics.max_queue_depth, self.queue_depth)
+        async with self._slots:
+            self._metrics.waiting -= 1
+            self._metrics.in_executor += 1
+            self._metrics.max_queue_depth = max(self._metrics.max_queue_depth, self.queue_depth)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), func, *args)
+            finally:
+                self._metrics.in_executor -= 1
+                self._metrics.completed += 1
+
+    async def hash(self, password: str) -> str:
+        return await self._submit(self._password_hash.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(self._password_hash.verify, password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
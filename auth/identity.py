@@ -0,0 +1,12 @@
+from dataclasses import dataclass, field
+
+from auth.models import Role
+
+
+@dataclass(frozen=True)
+class Identity:
+    id: int
+    email: str
+    role: Role
+    token_version: int
+    token_key: str = field(default="", compare=False)
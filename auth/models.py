@@ -33,6 +33,7 @@ class User(Base):
     full_name: Mapped[str] = mapped_column(String)
     role: Mapped[Role] = mapped_column(Enum(Role))
     date_of_birth: Mapped[datetime] = mapped_column(DateTime)
+    token_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     __mapper_args__ = {
         "polymorphic_on": "role",
@@ -49,7 +50,7 @@ class Student(User):
         primaryjoin="Student.id == parent_student.c.student_id",
         secondaryjoin="Parent.id == parent_student.c.parent_id",
         back_populates="children",
-        lazy="selectin"
+        lazy="raise"
     )
 
 class Parent(User):
@@ -63,7 +64,7 @@ class Parent(User):
         primaryjoin="Parent.id == parent_student.c.parent_id",
         secondaryjoin="Student.id == parent_student.c.student_id",
         back_populates="parents",
-        lazy="selectin"
+        lazy="raise"
     )
 
 class Admin(User):
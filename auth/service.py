@@ -1,72 +1,118 @@
 import os
 from datetime import timedelta, datetime
-from typing import Annotated
+from typing import Annotated, Type, TypeVar
 
 from fastapi import Depends
 from fastapi.security import OAuth2PasswordBearer
 from fastapi_mail import MessageSchema, MessageType
 from jose import jwt, JWTError  # type: ignore[import-untyped]
-from pwdlib import PasswordHash
 from pydantic import EmailStr, NameEmail
+from sqlalchemy import select
 from starlette import status
 from starlette.exceptions import HTTPException
 
+from auth.cache import token_cache, UserSnapshot
+from auth.hashing import password_hasher
+from auth.identity import Identity
 from auth.schemas import CreateUserRequest, ChangePasswordRequest
-from database import SessionLocal
-from dependency import db_dependency
-from auth.models import User
-from fastmail_conf import fm
+from dependency import db_dependency, read_db_dependency
+from auth.models import User, Role, parent_student_association
+from outbox.service import enqueue_email
 
 SECRET_KEY: str | None = os.getenv("SECRET_KEY")
 ALGORITHM: str | None = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRATION_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRATION_MINUTES", 30))
 
-password_hash = PasswordHash.recommended()
 oauth2_bearer = OAuth2PasswordBearer(tokenUrl="auth/login")
 
 token_dependency = Annotated[str, Depends(oauth2_bearer)]
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+UserModel = TypeVar("UserModel", bound=User)
 
-def authenticate_user(email: str, password: str, db: db_dependency) -> User | None:
-    user: User | None = db.query(User).filter(User.email == email).first()
-    if not user or not password_hash.verify(password, user.hashed_password):
+async def authenticate_user(email: str, password: str, db: db_dependency) -> User | None:
+    statement = select(User).where(User.email == email)
+    user: User | None = (await db.scalars(statement)).first()
+    if not user or not await password_hasher.verify(password, user.hashed_password):
         return None
 
     return user
 
-def create_access_token(email: str, user_id: int):
-    encode = {"sub": email, "id": user_id}
+def create_access_token(email: str, user_id: int, role: Role, token_version: int = 0):
+    encode = {"sub": email, "id": user_id, "role": role.name, "ver": token_version}
     expires = datetime.now() + timedelta(minutes=ACCESS_TOKEN_EXPIRATION_MINUTES)
     encode.update({"exp": int(expires.timestamp())})
     return jwt.encode(encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_current_user(token: token_dependency, db: db_dependency) -> User | None:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: NameEmail = payload.get("sub")
-        user_id: int = payload.get("id")
-        if email is None or user_id is None:
+def get_current_user(token: token_dependency) -> Identity:
+    key = token_cache.key(token)
+    identity = token_cache.get_identity(key)
+
+    if identity is None:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            email: NameEmail = payload.get("sub")
+            user_id: int = payload.get("id")
+            role: str = payload.get("role")
+            token_version: int = payload.get("ver")
+            if email is None or user_id is None or role not in Role.__members__ or token_version is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Could not validate user"
+                )
+
+        except JWTError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate user"
             )
 
-        return db.query(User).filter(User.id == user_id).first()
+        identity = Identity(id=user_id, email=email, role=Role[role], token_version=token_version, token_key=key)
+        token_cache.put_identity(key, identity, payload.get("exp"))
 
-    except JWTError:
+    if token_cache.is_revoked(identity):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate user"
+        )
+
+    return identity
+
+async def load_user(identity: Identity, model: Type[UserModel], db: db_dependency) -> UserModel:
+    user: UserModel | None = await db.get(model, identity.id)
+    if user is None or user.token_version != identity.token_version:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate user"
         )
 
-def create_user(request: CreateUserRequest, db: db_dependency) -> User:
-    existing_user = db.query(User).filter(User.email == request.email).first()
+    return user
+
+async def load_user_snapshot(identity: Identity, db: read_db_dependency) -> UserSnapshot:
+    snapshot = token_cache.get_snapshot(identity.token_key)
+    if snapshot is None:
+        user = await load_user(identity, User, db)
+        children_ids = ()
+        if user.role == Role.PARENT:
+            statement = select(parent_student_association.c.student_id).where(
+                parent_student_association.c.parent_id == user.id
+            )
+            children_ids = tuple((await db.scalars(statement)).all())
+        snapshot = UserSnapshot(
+            id=user.id,
+            email=user.email,
+            full_name=user.full_name,
+            role=user.role,
+            date_of_birth=user.date_of_birth,
+            token_version=user.token_version,
+            children_ids=children_ids
+        )
+        token_cache.put_snapshot(identity.token_key, snapshot)
+
+    return snapshot
+
+async def create_user(request: CreateUserRequest, db: db_dependency) -> User:
+    statement = select(User).where(User.email == request.email)
+    existing_user = (await db.scalars(statement)).first()
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -75,26 +121,32 @@ def create_user(request: CreateUserRequest, db: db_dependency) -> User:
 
     user = User(
         email=request.email,
-        hashed_password=password_hash.hash(request.password),
+        hashed_password=await password_hasher.hash(request.password),
         full_name=request.full_name,
         role=request.role,
         date_of_birth=request.date_of_birth
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.flush()
+
+    queue_email_for_new_user(db, user.email, user.full_name, request.password)
+    token = create_access_token(user.email, user.id, user.role, user.token_version)
+    queue_email_for_password_change(db, user.email, token)
+
+    await db.commit()
+    await db.refresh(user)
     return user
 
-async def send_email_for_password_change(email: EmailStr, token: str):
+def queue_email_for_password_change(db: db_dependency, email: EmailStr, token: str):
     message = MessageSchema(
         subject="Change password",
         recipients=[NameEmail(name="", email=email)],
         body=f"Change password at http://127.0.0.1:8000/change-password/{token}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
 
-async def send_email_for_new_user(email: EmailStr, full_name: str, password: str):
+def queue_email_for_new_user(db: db_dependency, email: EmailStr, full_name: str, password: str):
     message = MessageSchema(
         subject=f"Welcome {full_name}",
         recipients=[NameEmail(name="", email=email)],
@@ -102,13 +154,14 @@ async def send_email_for_new_user(email: EmailStr, full_name: str, password: str
              f"You are going to receive an email with a link to change the password.",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
 
-def change_password(token: str, request: ChangePasswordRequest, db: db_dependency):
+async def change_password(token: str, request: ChangePasswordRequest, db: db_dependency):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("id")
-        if user_id is None:
+        token_version = payload.get("ver")
+        if user_id is None or token_version is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token"
@@ -119,13 +172,23 @@ def change_password(token: str, request: ChangePasswordRequest, db: db_dependenc
             detail="Invalid token"
         )
 
-    user: User | None = db.get(User, user_id)
+    user: User | None = await db.get(User, user_id)
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not password_hash.verify(request.old_password, user.hashed_password):
+    if user.token_version != token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token"
+        )
+
+    if not await password_hasher.verify(request.old_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Old password does not match")
 
-    user.hashed_password = password_hash.hash(request.new_password)
+    user.hashed_password = await password_hasher.hash(request.new_password)
+    user.token_version += 1
+    revoked_below = user.token_version
     db.add(user)
-    db.commit()
+    await db.commit()
+
+    token_cache.invalidate_user(user_id, min_token_version=revoked_below)
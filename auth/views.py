@@ -6,32 +6,29 @@ from passlib.context import CryptContext  # type: ignore[import-untyped]
 from starlette import status
 from starlette.exceptions import HTTPException
 
+from audit.models import AuditAction, AuditEntity
 from audit.service import log
 from auth.RoleChecker import RoleChecker
+from auth.identity import Identity
 from auth.schemas import CreateUserRequest, Token, LoginRequest, UserResponse, ChangePasswordRequest
-from auth.service import create_user, authenticate_user, create_access_token, \
-    send_email_for_password_change, send_email_for_new_user, change_password
+from auth.service import create_user, authenticate_user, create_access_token, change_password
 from dependency import db_dependency
 from auth.models import User, Parent, Role
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-user_dependency = Annotated[User, Depends(RoleChecker(list(Role)))]
-admin_dependency = Annotated[User, Depends(RoleChecker([Role.ADMIN]))]
-parent_dependency = Annotated[User, Depends(RoleChecker([Role.PARENT]))]
-student_dependency = Annotated[User, Depends(RoleChecker([Role.STUDENT]))]
-teacher_dependency = Annotated[User, Depends(RoleChecker([Role.TEACHER]))]
-principal_dependency = Annotated[User, Depends(RoleChecker([Role.PRINCIPAL]))]
+user_dependency = Annotated[Identity, Depends(RoleChecker(list(Role)))]
+admin_dependency = Annotated[Identity, Depends(RoleChecker([Role.ADMIN]))]
+parent_dependency = Annotated[Identity, Depends(RoleChecker([Role.PARENT]))]
+student_dependency = Annotated[Identity, Depends(RoleChecker([Role.STUDENT]))]
+teacher_dependency = Annotated[Identity, Depends(RoleChecker([Role.TEACHER]))]
+principal_dependency = Annotated[Identity, Depends(RoleChecker([Role.PRINCIPAL]))]
 
 @router.post("/create-user", response_model=UserResponse)
 async def create(user: admin_dependency, db: db_dependency, request: CreateUserRequest, tasks: BackgroundTasks):
-    new_user: User = create_user(request, db)
-    await send_email_for_new_user(new_user.email, new_user.full_name, request.password)
+    new_user: User = await create_user(request, db)
 
-    token = create_access_token(new_user.email, new_user.id)
-    await send_email_for_password_change(new_user.email, token)
-
-    log(tasks, user_id=user.id, action=f"Created user with ID {new_user.id}")
+    log(tasks, user.id, AuditAction.USER_CREATED, AuditEntity.USER, new_user.id, {"role": new_user.role.name})
 
     return new_user
 
@@ -39,14 +36,14 @@ async def create(user: admin_dependency, db: db_dependency, request: CreateUserR
 async def change_user_password(token: str,
                                request: ChangePasswordRequest,
                                db: db_dependency):
-    change_password(token, request, db)
+    await change_password(token, request, db)
 
 @router.post("/login", response_model=Token)
 async def login_for_access_token(
         form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
         db: db_dependency
 ):
-    user: User | None = authenticate_user(form_data.username, form_data.password, db)
+    user: User | None = await authenticate_user(form_data.username, form_data.password, db)
 
     if not user:
         raise HTTPException(
@@ -54,8 +51,6 @@ async def login_for_access_token(
             detail="Could not validate user"
         )
 
-    email = user.email
-    user_id = user.id
-    token = create_access_token(email, user_id)
+    token = create_access_token(user.email, user.id, user.role, user.token_version)
 
     return {"access_token": token, "token_type": "bearer"}
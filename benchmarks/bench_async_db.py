@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+from database import Base
+from auth.models import User, Role
+from subjects.models import Subject
+from grades.models import Grade, GradeType
+import absences.models  # noqa: F401
+import audit.models  # noqa: F401
+import outbox.models  # noqa: F401
+
+
+def seed(path: str, students: int, grades: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "email": f"s{i}@school.com", "hashed_password": "x", "full_name": f"Student {i}",
+             "role": Role.STUDENT, "date_of_birth": datetime(2010, 1, 1), "token_version": 0}
+            for i in range(1, students + 1)
+        ])
+        conn.execute(insert(Subject), [{"id": 1, "name": "Math", "teacher_id": 1, "archived": False}])
+        conn.execute(insert(Grade), [
+            {"student_id": random.randint(1, students), "subject_id": 1, "grade": random.uniform(2, 6),
+             "grade_type": GradeType.EXAM}
+            for _ in range(grades)
+        ])
+    engine.dispose()
+
+
+def student_grades_statement(students: int):
+    return select(Grade).where(Grade.student_id == random.randint(1, students))
+
+
+async def measure(name: str, handler, requests: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    pings: list[float] = []
+    done = asyncio.Event()
+
+    async def ping():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0)
+            pings.append(time.perf_counter() - started)
+            await asyncio.sleep(0.002)
+
+    async def request():
+        async with semaphore:
+            await handler()
+
+    pinger = asyncio.create_task(ping())
+    started = time.perf_counter()
+    await asyncio.gather(*(request() for _ in range(requests)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await pinger
+
+    pings.sort()
+    p99 = pings[int(len(pings) * 0.99) - 1] * 1000 if pings else 0.0
+    print(f"{name:<24} {requests / elapsed:8.1f} req/s   "
+          f"unrelated request latency p50 {statistics.median(pings) * 1000:6.2f} ms  p99 {p99:7.2f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Concurrent read throughput: sync Session on the event loop vs AsyncSession")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--grades", type=int, default=200_000)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.db")
+        seed(path, args.students, args.grades)
+
+        sync_engine = create_engine(f"sqlite:///{path}", pool_size=args.concurrency)
+        SyncSession = sessionmaker(bind=sync_engine)
+
+        async def sync_handler():
+            with SyncSession() as db:
+                db.scalars(student_grades_statement(args.students)).all()
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=args.concurrency)
+        AsyncSession = async_sessionmaker(bind=async_engine)
+
+        async def async_handler():
+            async with AsyncSession() as db:
+                (await db.scalars(student_grades_statement(args.students))).all()
+
+        print(f"{args.grades} grades, {args.requests} requests, concurrency {args.concurrency}")
+        await measure("sync Session (before)", sync_handler, args.requests, args.concurrency)
+        await measure("AsyncSession (after)", async_handler, args.requests, args.concurrency)
+
+        sync_engine.dispose()
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import Base, build_engine
+from auth.identity import Identity
+from auth.models import User, Role, parent_student_association
+from subjects.models import Subject, subject_students
+from grades.schemas import GradeCreateRequest
+from grades.service import create_grade, create_grades
+import absences.models  # noqa: F401
+import audit.models  # noqa: F401
+import outbox.models  # noqa: F401
+
+TEACHER_ID = 1
+
+
+async def seed(Session, students: int) -> list[int]:
+    student_ids = list(range(100, 100 + students))
+    async with Session() as db:
+        await db.execute(insert(User), [
+            {"id": TEACHER_ID, "email": "teacher@school.com", "hashed_password": "x", "full_name": "Teacher",
+             "role": Role.TEACHER, "date_of_birth": datetime(1980, 1, 1), "token_version": 0},
+            *[{"id": i, "email": f"s{i}@school.com", "hashed_password": "x", "full_name": f"Student {i}",
+               "role": Role.STUDENT, "date_of_birth": datetime(2010, 1, 1), "token_version": 0}
+              for i in student_ids],
+            *[{"id": i + 1000, "email": f"p{i}@school.com", "hashed_password": "x", "full_name": f"Parent {i}",
+               "role": Role.PARENT, "date_of_birth": datetime(1980, 1, 1), "token_version": 0}
+              for i in student_ids],
+        ])
+        await db.execute(insert(parent_student_association), [
+            {"parent_id": i + 1000, "student_id": i} for i in student_ids
+        ])
+        await db.execute(insert(Subject), [{"id": 1, "name": "Math", "teacher_id": TEACHER_ID, "archived": False}])
+        await db.execute(insert(subject_students), [{"subject_id": 1, "user_id": i} for i in student_ids])
+        await db.commit()
+    return student_ids
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Grading a whole class: one POST /grades/ per student vs POST /grades/bulk")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        statements = 0
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def count_statement(*_):
+            nonlocal statements
+            statements += 1
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        student_ids = await seed(Session, args.students)
+        teacher = Identity(id=TEACHER_ID, email="teacher@school.com", role=Role.TEACHER, token_version=0)
+        requests = [GradeCreateRequest(student_id=i, subject_id=1, grade=5.0, type="exam") for i in student_ids]
+
+        async def loop():
+            # Each call gets its own session, the way each POST /grades/ gets its own request scope.
+            for request in requests:
+                async with Session() as db:
+                    await create_grade(teacher, request, db)
+
+        async def bulk():
+            async with Session() as db:
+                await create_grades(teacher, requests, db)
+
+        print(f"{args.students} students, {args.rounds} rounds")
+        for name, handler in (("single-grade loop", loop), ("bulk", bulk)):
+            timings = []
+            statements = 0
+            for _ in range(args.rounds):
+                started = time.perf_counter()
+                await handler()
+                timings.append(time.perf_counter() - started)
+            print(f"{name:<18} median {statistics.median(timings) * 1000:8.2f} ms per class   "
+                  f"{statements / args.rounds:6.1f} statements per class")
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, select, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import Base, build_engine, sqlite_pragmas
+from auth.models import User, Role
+from subjects.models import Subject
+from grades.models import Grade, GradeType
+import absences.models  # noqa: F401
+import audit.models  # noqa: F401
+import outbox.models  # noqa: F401
+
+# "default" is what database.py used before: rollback journal, full fsync on every commit.
+PROFILES = {
+    "default": sqlite_pragmas(journal_mode="DELETE", synchronous="FULL", busy_timeout_ms=5000, mmap_size=0, cache_size=-2000),
+    "production": sqlite_pragmas(),
+}
+
+
+def seed(path: str, students: int, grades: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": i, "email": f"s{i}@school.com", "hashed_password": "x", "full_name": f"Student {i}",
+             "role": Role.STUDENT, "date_of_birth": datetime(2010, 1, 1), "token_version": 0}
+            for i in range(1, students + 1)
+        ])
+        conn.execute(insert(Subject), [{"id": 1, "name": "Math", "teacher_id": 1, "archived": False}])
+        conn.execute(insert(Grade), [
+            {"student_id": random.randint(1, students), "subject_id": 1, "grade": random.uniform(2, 6),
+             "grade_type": GradeType.EXAM}
+            for _ in range(grades)
+        ])
+    engine.dispose()
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] * 1000
+
+
+async def run_profile(name: str, path: str, pragmas: dict, args) -> None:
+    engine = build_engine(
+        f"sqlite+aiosqlite:///{path}",
+        pragmas=pragmas,
+        pool_size=args.readers + args.writers,
+        max_overflow=0,
+    )
+    Session = async_sessionmaker(bind=engine, expire_on_commit=False)
+    latencies = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    deadline = time.perf_counter() + args.seconds
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with Session() as db:
+                    statement = select(Grade).where(Grade.student_id == random.randint(1, args.students))
+                    (await db.scalars(statement)).all()
+                latencies["read"].append(time.perf_counter() - started)
+            except OperationalError:
+                errors["read"] += 1
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with Session() as db:
+                    db.add(Grade(student_id=random.randint(1, args.students), subject_id=1,
+                                 grade=random.uniform(2, 6), grade_type=GradeType.HOMEWORK))
+                    await db.commit()
+                latencies["write"].append(time.perf_counter() - started)
+            except OperationalError:
+                errors["write"] += 1
+
+    await asyncio.gather(*[reader() for _ in range(args.readers)], *[writer() for _ in range(args.writers)])
+    await engine.dispose()
+
+    for kind in ("read", "write"):
+        samples = latencies[kind]
+        median = statistics.median(samples) * 1000 if samples else 0.0
+        print(f"{name:<12} {kind:<6} {len(samples) / args.seconds:8.1f} ops/s   "
+              f"p50 {median:7.2f} ms  p99 {percentile(samples, 0.99):8.2f} ms  errors {errors[kind]}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Mixed read/write traffic against SQLite under each engine profile")
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--grades", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--profile", choices=sorted(PROFILES), action="append")
+    args = parser.parse_args()
+
+    print(f"{args.grades} grades, {args.readers} readers, {args.writers} writers, {args.seconds:g}s per profile")
+    for name in args.profile or list(PROFILES):
+        # Every profile gets a fresh file: WAL mode is persistent once set.
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bench.db")
+            seed(path, args.students, args.grades)
+            await run_profile(name, path, PROFILES[name], args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,117 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import delete, event, insert, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from database import Base, build_engine
+from auth.identity import Identity
+from auth.models import User, Role, Student
+from subjects.models import Subject, subject_students
+from subjects.schemas import AddStudentsRequest
+from subjects.service import add_students
+import absences.models  # noqa: F401
+import audit.models  # noqa: F401
+import classes.models  # noqa: F401
+import grades.models  # noqa: F401
+import outbox.models  # noqa: F401
+
+TEACHER_ID = 1
+
+
+async def seed(Session, students: int, subjects: int) -> tuple[list[int], list[int]]:
+    student_ids = list(range(100, 100 + students))
+    subject_ids = list(range(1, 1 + subjects))
+    async with Session() as db:
+        await db.execute(insert(User), [
+            {"id": TEACHER_ID, "email": "teacher@school.com", "hashed_password": "x", "full_name": "Teacher",
+             "role": Role.TEACHER, "date_of_birth": datetime(1980, 1, 1), "token_version": 0},
+            *[{"id": i, "email": f"s{i}@school.com", "hashed_password": "x", "full_name": f"Student {i}",
+               "role": Role.STUDENT, "date_of_birth": datetime(2010, 1, 1), "token_version": 0}
+              for i in student_ids],
+        ])
+        await db.execute(insert(Subject), [
+            {"id": i, "name": f"Subject {i}", "teacher_id": TEACHER_ID, "archived": False} for i in subject_ids
+        ])
+        await db.commit()
+    return student_ids, subject_ids
+
+
+async def legacy_add_students(request: AddStudentsRequest, subject_id: int, db) -> None:
+    # The previous implementation: load the roster, then test list membership and append per student.
+    subject = await db.get(Subject, subject_id, options=[selectinload(Subject.students)])
+    students = (await db.scalars(select(Student).where(Student.id.in_(request.students_ids)))).all()
+    for student in students:
+        if student not in subject.students:
+            subject.students.append(student)
+    await db.commit()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Enrolling a cohort into every subject: per-student ORM loop vs set-based")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--subjects", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'bench.db')}")
+        statements = 0
+
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def count_statement(*_):
+            nonlocal statements
+            statements += 1
+
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        Session = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+        student_ids, subject_ids = await seed(Session, args.students, args.subjects)
+        teacher = Identity(id=TEACHER_ID, email="teacher@school.com", role=Role.TEACHER, token_version=0)
+        # Half the cohort is enrolled already, so both paths have to skip existing rows.
+        request = AddStudentsRequest(students_ids=student_ids)
+        already_enrolled = [
+            {"subject_id": s, "user_id": i} for s in subject_ids for i in student_ids[:len(student_ids) // 2]
+        ]
+
+        async def legacy():
+            for subject_id in subject_ids:
+                async with Session() as db:
+                    await legacy_add_students(request, subject_id, db)
+
+        async def set_based():
+            for subject_id in subject_ids:
+                async with Session() as db:
+                    await add_students(teacher, request, subject_id, db)
+
+        print(f"{args.students} students into {args.subjects} subjects, {args.rounds} rounds")
+        for name, handler in (("per-student loop", legacy), ("set-based", set_based)):
+            timings = []
+            counted = 0
+            for _ in range(args.rounds):
+                async with Session() as db:
+                    await db.execute(delete(subject_students))
+                    await db.execute(insert(subject_students), already_enrolled)
+                    await db.commit()
+                statements = 0
+                started = time.perf_counter()
+                await handler()
+                timings.append(time.perf_counter() - started)
+                counted += statements
+            print(f"{name:<17} median {statistics.median(timings) * 1000:8.2f} ms per cohort   "
+                  f"{counted / args.rounds:7.1f} statements per cohort")
+
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
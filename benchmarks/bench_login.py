@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pwdlib import PasswordHash
+
+from auth.hashing import PasswordHasher
+
+
+async def heartbeat(stop: asyncio.Event, interval: float, lags: list[float]) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run(name: str, verify, logins: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login():
+        async with semaphore:
+            await verify()
+
+    stop = asyncio.Event()
+    lags: list[float] = []
+    beat = asyncio.create_task(heartbeat(stop, 0.005, lags))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await beat
+
+    worst_lag = max(lags, default=0) * 1000
+    print(f"{name:<22} {logins / elapsed:8.1f} logins/s   worst event loop lag {worst_lag:7.1f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Password verification throughput under concurrent logins")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    password_hash = PasswordHash.recommended()
+    hashed = password_hash.hash("correct horse battery staple")
+
+    async def inline_verify():
+        password_hash.verify("correct horse battery staple", hashed)
+
+    hasher = PasswordHasher(workers=args.workers, max_pending=args.concurrency)
+
+    async def pooled_verify():
+        await hasher.verify("correct horse battery staple", hashed)
+
+    print(f"{args.logins} logins, concurrency {args.concurrency}, {args.workers} hashing workers")
+    await run("inline (event loop)", inline_verify, args.logins, args.concurrency)
+    await run("PasswordHasher", pooled_verify, args.logins, args.concurrency)
+    print(f"max queue depth {hasher.metrics['max_queue_depth']}")
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
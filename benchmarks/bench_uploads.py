@@ -0,0 +1,78 @@
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import UploadFile
+
+from storage.backends import media_storage
+from utils.media import save_file
+
+
+def make_upload(payload: bytes) -> UploadFile:
+    # Starlette spools multipart files over 1 MiB to disk, so reads hit the filesystem just like in a request.
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(payload)
+    spooled.seek(0)
+    return UploadFile(file=spooled, filename="material.pdf")
+
+
+async def legacy_save_file(file: UploadFile, folder: str) -> str:
+    # The previous implementation: one blocking copy on the event loop.
+    os.makedirs(os.path.join(media_storage.root, folder), exist_ok=True)
+    path = os.path.join(media_storage.root, folder, f"{uuid.uuid4()}.pdf")
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    await file.close()
+    return path
+
+
+async def measure(handler, payload: bytes, uploads: int) -> tuple[float, float]:
+    # Distinct content per upload, so none of them is deduplicated away.
+    files = [make_upload(i.to_bytes(4, "big") + payload) for i in range(uploads)]
+    stalls = []
+    done = asyncio.Event()
+
+    async def heartbeat():
+        # Stands in for every other request on the worker: how late does a 1 ms timer fire?
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stalls.append(time.perf_counter() - started - 0.001)
+
+    beat = asyncio.create_task(heartbeat())
+    started = time.perf_counter()
+    await asyncio.gather(*(handler(file, "materials") for file in files))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await beat
+    return elapsed, max(stalls, default=0.0)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description="Material uploads: blocking copy on the loop vs streaming save_file")
+    parser.add_argument("--size-mb", type=int, default=50)
+    parser.add_argument("--uploads", type=int, default=4)
+    args = parser.parse_args()
+
+    payload = os.urandom(args.size_mb * 1024 * 1024)
+    total_mb = args.size_mb * args.uploads
+
+    with tempfile.TemporaryDirectory() as directory:
+        media_storage.root = directory
+        print(f"{args.uploads} concurrent uploads of {args.size_mb} MiB")
+        for name, handler in (("blocking copy", legacy_save_file),
+                              ("streaming", lambda f, folder: save_file(f, folder, max_bytes=len(payload) + 4))):
+            elapsed, stall = await measure(handler, payload, args.uploads)
+            print(f"{name:<14} {total_mb / elapsed:8.1f} MiB/s   longest event loop stall {stall * 1000:8.2f} ms")
+            shutil.rmtree(os.path.join(directory, "materials"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
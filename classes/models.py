@@ -32,23 +32,15 @@ class Class(Base):
     students: Mapped[List[User]] = relationship(
         User,
         secondary=class_students,
-        lazy="selectin"
+        lazy="raise"
     )
     subjects: Mapped[List["Subject"]] = relationship(
         "Subject",
         secondary=class_subjects,
-        lazy="selectin"
+        lazy="raise"
     )
     archived: Mapped[bool] = mapped_column(Boolean, default=False)
 
-    @property
-    def students_ids(self) -> list[int]:
-        return [s.id for s in self.students]
-
-    @property
-    def subjects_ids(self) -> list[int]:
-        return [s.id for s in self.subjects]
-
     @validates("teacher")
     def validate_teacher(self, key, user: User):
         if user.role not in (Role.TEACHER, Role.PRINCIPAL):
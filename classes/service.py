@@ -1,21 +1,36 @@
-from typing import List, cast
-
 from fastapi_mail import MessageSchema, MessageType
 from pydantic import NameEmail
-from sqlalchemy import select
+from sqlalchemy import select, literal
+from sqlalchemy.orm import joinedload
 from starlette import status
 from starlette.exceptions import HTTPException
 
+from auth.identity import Identity
 from auth.models import User, Role, Student
-from classes.models import Class
-from classes.schemas import CreateClassRequest, AddStudentsRequest, ChangeClassStatusRequest, AddSubjectsRequest
+from classes.models import Class, class_students, class_subjects
+from classes.schemas import CreateClassRequest, AddStudentsRequest, ChangeClassStatusRequest, AddSubjectsRequest, \
+    ClassResponse
 from dependency import db_dependency
-from fastmail_conf import fm
-from subjects.models import Subject
-
+from outbox.service import enqueue_email
+from subjects.models import Subject, subject_students
+from subjects.service import get_emails
+from utils.links import add_links
+
+
+async def build_class_response(clas: Class, db: db_dependency) -> ClassResponse:
+    students_ids = await db.scalars(select(class_students.c.user_id).where(class_students.c.class_id == clas.id))
+    subjects_ids = await db.scalars(select(class_subjects.c.subject_id).where(class_subjects.c.class_id == clas.id))
+    return ClassResponse(
+        name=clas.name,
+        year=clas.year,
+        teacher_id=clas.teacher_id,
+        students_ids=list(students_ids.all()),
+        subjects_ids=list(subjects_ids.all()),
+        archived=clas.archived
+    )
 
 async def create_empty_class(request: CreateClassRequest, db: db_dependency) -> Class:
-    user: User | None = db.get(User, request.user_id)
+    user: User | None = await db.get(User, request.user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -28,11 +43,12 @@ async def create_empty_class(request: CreateClassRequest, db: db_dependency) ->
             detail="The assigned user must be a Teacher or a Principal"
         )
 
-    if db.query(Class).filter(
-            Class.name == request.name,
-            Class.year == request.year,
-            Class.archived.is_(False)
-    ).first():
+    statement = select(Class).where(
+        Class.name == request.name,
+        Class.year == request.year,
+        Class.archived.is_(False)
+    )
+    if (await db.scalars(statement)).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Duplication of class"
@@ -44,8 +60,6 @@ async def create_empty_class(request: CreateClassRequest, db: db_dependency) ->
         teacher_id=request.user_id
     )
     db.add(new_class)
-    db.commit()
-    db.refresh(new_class)
 
     message = MessageSchema(
         subject="Assigned to a class",
@@ -53,39 +67,38 @@ async def create_empty_class(request: CreateClassRequest, db: db_dependency) ->
         body=f"You have been assigned a class teacher to {request.name}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
+
+    await db.commit()
+    await db.refresh(new_class)
 
     return new_class
 
 async def add_students_to_class(id: int, request: AddStudentsRequest, db: db_dependency):
-    clas: Class | None = db.get(Class, id)
+    clas: Class | None = await db.get(Class, id, options=[joinedload(Class.teacher)])
     if not clas:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Couldn't find class with ID {id}"
         )
 
-    students: List[Student] = db.query(Student).where(Student.id.in_(request.students_ids)).all()
-    added_students = []
-    for student in students:
-        if student not in clas.students:
-            clas.students.append(student)
-            added_students.append(student)
-
-    db.commit()
+    candidates = select(literal(clas.id).label("class_id"), Student.id.label("user_id")).where(
+        Student.id.in_(request.students_ids)
+    )
+    added_ids = [student_id for _, student_id in await add_links(db, class_students, candidates)]
 
-    recipients = [NameEmail(name="", email=s.email) for s in added_students]
     message = MessageSchema(
         subject=f"Added to class {clas.name}",
-        recipients=recipients,
+        recipients=await get_emails(db, added_ids),
         body=f"You have been added to class {clas.name} of {clas.year} with teacher {clas.teacher.full_name}",
         subtype=MessageType(value="html")
     )
+    enqueue_email(db, message)
 
-    await fm.send_message(message)
+    await db.commit()
 
-def change_class_status(request: ChangeClassStatusRequest, class_id: int, db: db_dependency) -> Class:
-    clas: Class | None = db.get(Class, class_id)
+async def change_class_status(request: ChangeClassStatusRequest, class_id: int, db: db_dependency) -> Class:
+    clas: Class | None = await db.get(Class, class_id)
     if not clas:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -93,23 +106,24 @@ def change_class_status(request: ChangeClassStatusRequest, class_id: int, db: db
         )
 
     if not request.status and clas.archived:
-        if db.query(Class).filter(
+        statement = select(Class).where(
             Class.name == clas.name,
             Class.teacher_id == clas.teacher_id,
             Class.year == clas.year,
             Class.archived.is_(False)
-        ).first():
+        )
+        if (await db.scalars(statement)).first():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Unarchiving this class will result in a duplication. Please archive the active one first."
             )
 
     clas.archived = request.status
-    db.commit()
+    await db.commit()
     return clas
 
-async def add_subjects_to_class(user: User, class_id: int, request: AddSubjectsRequest, db: db_dependency) -> Class:
-    clas: Class | None = db.get(Class, class_id)
+async def add_subjects_to_class(user: Identity, class_id: int, request: AddSubjectsRequest, db: db_dependency) -> Class:
+    clas: Class | None = await db.get(Class, class_id)
     if not clas:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -122,23 +136,24 @@ async def add_subjects_to_class(user: User, class_id: int, request: AddSubjectsR
             detail="You are not the teacher assigned to this class"
         )
 
-    statement = select(Subject).where(Subject.id.in_(request.subjects_ids))
-    subjects = db.scalars(statement).all()
-    if len(subjects) != len(request.subjects_ids):
+    subjects_ids = set(request.subjects_ids)
+    statement = select(Subject.id).where(Subject.id.in_(subjects_ids))
+    if len((await db.scalars(statement)).all()) != len(subjects_ids):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Couldn't find all subjects. Nothing was changed"
         )
 
-    for subject in subjects:
-        new_students = [
-            cast(Student, student) for student in clas.students
-            if student not in subject.students
-        ]
-        subject.students.extend(new_students)
-
-    db.commit()
+    class_links = select(literal(clas.id).label("class_id"), Subject.id.label("subject_id")).where(
+        Subject.id.in_(subjects_ids)
+    )
+    await add_links(db, class_subjects, class_links)
 
-    return clas
+    enrollments = select(Subject.id.label("subject_id"), class_students.c.user_id).join(
+        class_students, class_students.c.class_id == clas.id
+    ).where(Subject.id.in_(subjects_ids))
+    await add_links(db, subject_students, enrollments)
 
+    await db.commit()
 
+    return clas
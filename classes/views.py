@@ -4,16 +4,18 @@ from fastapi import APIRouter, Depends
 from starlette import status
 
 from auth.RoleChecker import RoleChecker
-from auth.models import User, Role
+from auth.identity import Identity
+from auth.models import Role
 from classes.schemas import CreateClassRequest, ClassResponse, AddStudentsRequest, ChangeClassStatusRequest, \
     AddSubjectsRequest
-from classes.service import create_empty_class, add_students_to_class, change_class_status, add_subjects_to_class
+from classes.service import create_empty_class, add_students_to_class, change_class_status, add_subjects_to_class, \
+    build_class_response
 from dependency import db_dependency
 
 router = APIRouter(prefix="/classes", tags=["classes"])
 
 teacher_or_principal_or_admin_dependency = Annotated[
-    User,
+    Identity,
     Depends(
         RoleChecker([
             Role.TEACHER,
@@ -24,13 +26,7 @@ teacher_or_principal_or_admin_dependency = Annotated[
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=ClassResponse)
 async def create_class(user: teacher_or_principal_or_admin_dependency, request: CreateClassRequest, db: db_dependency):
     new_class = await create_empty_class(request, db)
-    return ClassResponse(
-        name=new_class.name,
-        year=new_class.year,
-        teacher_id=new_class.teacher_id,
-        students_ids=[s.id for s in new_class.students],
-        archived=new_class.archived
-    )
+    return await build_class_response(new_class, db)
 
 @router.post("/{class_id}/add-students", status_code=status.HTTP_200_OK)
 async def add_students(user: teacher_or_principal_or_admin_dependency, class_id: int, request: AddStudentsRequest, db: db_dependency):
@@ -38,9 +34,11 @@ async def add_students(user: teacher_or_principal_or_admin_dependency, class_id:
 
 @router.post("/{class_id}/status", status_code=status.HTTP_200_OK, response_model=ClassResponse)
 async def change_status(user: teacher_or_principal_or_admin_dependency, class_id: int, request: ChangeClassStatusRequest, db: db_dependency):
-    return change_class_status(request, class_id, db)
+    clas = await change_class_status(request, class_id, db)
+    return await build_class_response(clas, db)
 
 
 @router.post("/{class_id}/subjects", status_code=status.HTTP_200_OK, response_model=ClassResponse)
 async def add_subjects(user: teacher_or_principal_or_admin_dependency, class_id: int, request: AddSubjectsRequest, db: db_dependency):
-    return await add_subjects_to_class(user, class_id, request, db)
+    clas = await add_subjects_to_class(user, class_id, request, db)
+    return await build_class_response(clas, db)
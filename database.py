@@ -1,15 +1,120 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase, sessionmaker
+import logging
+import os
 
-DATABASE_URL = "sqlite:///./school.db"
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncAttrs, AsyncEngine, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
 
-engine = create_engine(DATABASE_URL, echo=True)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./school.db")
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))
+DATABASE_POOL_RECYCLE_SECONDS = int(os.getenv("DATABASE_POOL_RECYCLE_SECONDS", 1800))
+DATABASE_POOL_TIMEOUT_SECONDS = float(os.getenv("DATABASE_POOL_TIMEOUT_SECONDS", 30))
+# A replica URL; when unset, SQLite files get a read-only connection to the same file.
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+DATABASE_READ_POOL_SIZE = int(os.getenv("DATABASE_READ_POOL_SIZE", 10))
+DATABASE_READ_MAX_OVERFLOW = int(os.getenv("DATABASE_READ_MAX_OVERFLOW", 10))
+# INFO logs every statement, DEBUG adds result rows.
+DATABASE_LOG_LEVEL = os.getenv("DATABASE_LOG_LEVEL", "WARNING").upper()
 
-SessionLocal = sessionmaker(
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", 5000))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))
+# Negative values are KiB, so this is a 64 MiB page cache per connection.
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -64 * 1024))
+
+logging.getLogger("sqlalchemy.engine").setLevel(DATABASE_LOG_LEVEL)
+
+
+def sqlite_pragmas(
+        journal_mode: str = SQLITE_JOURNAL_MODE,
+        synchronous: str = SQLITE_SYNCHRONOUS,
+        busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS,
+        mmap_size: int = SQLITE_MMAP_SIZE,
+        cache_size: int = SQLITE_CACHE_SIZE,
+) -> dict:
+    return {
+        "journal_mode": journal_mode,
+        "synchronous": synchronous,
+        "busy_timeout": busy_timeout_ms,
+        "mmap_size": mmap_size,
+        "cache_size": cache_size,
+    }
+
+
+def read_only_url(url: str) -> str | None:
+    parsed = make_url(url)
+    if parsed.get_backend_name() != "sqlite" or parsed.database in (None, "", ":memory:"):
+        return None
+    if parsed.query.get("mode") == "ro":
+        return url
+    database = parsed.database if parsed.database.startswith("file:") else f"file:{parsed.database}"
+    read_only = parsed.set(database=database).update_query_dict({"mode": "ro", "uri": "true"})
+    return read_only.render_as_string(hide_password=False)
+
+
+def build_engine(url: str, pragmas: dict | None = None, **options) -> AsyncEngine:
+    engine_options = {
+        "pool_pre_ping": True,
+        "pool_recycle": DATABASE_POOL_RECYCLE_SECONDS,
+    }
+
+    is_sqlite = make_url(url).get_backend_name() == "sqlite"
+    is_memory = is_sqlite and make_url(url).database in (None, "", ":memory:")
+    if not is_memory:
+        engine_options.update(
+            pool_size=DATABASE_POOL_SIZE,
+            max_overflow=DATABASE_MAX_OVERFLOW,
+            pool_timeout=DATABASE_POOL_TIMEOUT_SECONDS,
+        )
+    engine_options.update(options)
+
+    new_engine = create_async_engine(url, **engine_options)
+
+    if is_sqlite:
+        applied = sqlite_pragmas() if pragmas is None else pragmas
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in applied.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+            cursor.close()
+
+    return new_engine
+
+
+engine = build_engine(DATABASE_URL)
+
+SessionLocal = async_sessionmaker(
     bind=engine,
     autoflush=False,
-    autocommit=False,
+    expire_on_commit=False,
+)
+
+_read_url = DATABASE_READ_URL or read_only_url(DATABASE_URL)
+if _read_url is None:
+    read_engine = engine
+else:
+    # The writer owns journal_mode and synchronous; readers only tune their own connection and refuse writes.
+    _read_pragmas = {
+        name: value for name, value in sqlite_pragmas().items() if name not in ("journal_mode", "synchronous")
+    }
+    _read_pragmas["query_only"] = "ON"
+    read_engine = build_engine(
+        _read_url,
+        pragmas=_read_pragmas,
+        pool_size=DATABASE_READ_POOL_SIZE,
+        max_overflow=DATABASE_READ_MAX_OVERFLOW,
+    )
+
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    autoflush=False,
+    expire_on_commit=False,
 )
 
-class Base(DeclarativeBase):
+class Base(AsyncAttrs, DeclarativeBase):
     pass
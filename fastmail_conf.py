@@ -1,12 +1,17 @@
 import os
 from typing import List
 
-from fastapi_mail import ConnectionConfig, FastMail
+from fastapi_mail import ConnectionConfig
 from pydantic import BaseModel, EmailStr, SecretStr
 
+from smtp_pool import SMTPPool
+
 MAIL_USERNAME = os.getenv("MAIL_USERNAME", "username")
 MAIL_FROM = os.getenv("MAIL_FROM", "from@from.com")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD", "password")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_IDLE_TIMEOUT_SECONDS = float(os.getenv("SMTP_IDLE_TIMEOUT_SECONDS", 60))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
 
 email_conf = ConnectionConfig(
     MAIL_USERNAME=MAIL_USERNAME,  # type: ignore[arg-type]
@@ -23,4 +28,9 @@ email_conf = ConnectionConfig(
 class EmailSchema(BaseModel):
     email: List[EmailStr]
 
-fm = FastMail(email_conf)
+smtp_pool = SMTPPool.from_config(
+    email_conf,
+    size=SMTP_POOL_SIZE,
+    idle_timeout=SMTP_IDLE_TIMEOUT_SECONDS,
+    max_messages_per_connection=SMTP_MAX_MESSAGES_PER_CONNECTION,
+)
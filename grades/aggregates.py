@@ -0,0 +1,183 @@
+import asyncio
+
+from typing import Dict, Sequence, Tuple
+
+from sqlalchemy import update, insert, delete, select, func, case, bindparam, tuple_, Float, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import SessionLocal, engine, Base
+from migrations import upgrade_schema
+from grades.models import Grade, GradeAggregate
+from utils.links import upsert_insert
+
+
+def _pair(student_id: int, subject_id: int):
+    return (GradeAggregate.student_id == student_id) & (GradeAggregate.subject_id == subject_id)
+
+
+def _summarize(values: Sequence[float]) -> dict:
+    mean = sum(values) / len(values)
+    return {
+        "n": len(values),
+        "batch_total": sum(values),
+        "batch_min": min(values),
+        "batch_max": max(values),
+        "batch_mean": mean,
+        "batch_m2": sum((value - mean) ** 2 for value in values),
+    }
+
+
+# Chan et al.'s merge of two Welford states, written against the old column values so concurrent writers can't
+# lose an update. With a single value it reduces to the usual step:
+# mean' = mean + (x - mean) / (n + 1), m2' = m2 + (x - mean)^2 * n / (n + 1)
+_table = GradeAggregate.__table__
+_delta = bindparam("batch_mean", type_=Float) - _table.c.mean
+_n = bindparam("n", type_=Integer)
+_merge = (
+    update(_table)
+    .where(_table.c.student_id == bindparam("key_student_id"), _table.c.subject_id == bindparam("key_subject_id"))
+    .values(
+        count=_table.c.count + _n,
+        total=_table.c.total + bindparam("batch_total", type_=Float),
+        minimum=case((_table.c.minimum > bindparam("batch_min", type_=Float), bindparam("batch_min", type_=Float)),
+                     else_=_table.c.minimum),
+        maximum=case((_table.c.maximum < bindparam("batch_max", type_=Float), bindparam("batch_max", type_=Float)),
+                     else_=_table.c.maximum),
+        mean=_table.c.mean + _delta * _n / (_table.c.count + _n),
+        m2=_table.c.m2 + bindparam("batch_m2", type_=Float) + _delta * _delta * _table.c.count * _n / (_table.c.count + _n),
+    )
+)
+
+
+def _insert_or_merge(db: AsyncSession):
+    # Two requests adding the first grade of a pair both miss the UPDATE; the later INSERT merges into the row the
+    # earlier one created instead of failing on the primary key. Backends without ON CONFLICT get a plain INSERT.
+    statement = upsert_insert(db, _table)
+    if statement is None:
+        return insert(_table)
+
+    new = statement.excluded
+    delta = new.mean - _table.c.mean
+    return statement.on_conflict_do_update(
+        index_elements=[_table.c.student_id, _table.c.subject_id],
+        set_={
+            "count": _table.c.count + new.count,
+            "total": _table.c.total + new.total,
+            "minimum": case((_table.c.minimum > new.minimum, new.minimum), else_=_table.c.minimum),
+            "maximum": case((_table.c.maximum < new.maximum, new.maximum), else_=_table.c.maximum),
+            "mean": _table.c.mean + delta * new.count / (_table.c.count + new.count),
+            "m2": _table.c.m2 + new.m2 + delta * delta * _table.c.count * new.count / (_table.c.count + new.count),
+        },
+    )
+
+
+async def add_to_aggregates(db: AsyncSession, values: Dict[Tuple[int, int], Sequence[float]]) -> None:
+    batches = [
+        {"key_student_id": student_id, "key_subject_id": subject_id, **_summarize(pair_values)}
+        for (student_id, subject_id), pair_values in values.items() if pair_values
+    ]
+    if not batches:
+        return
+
+    result = await db.execute(_merge, batches)
+    if result.rowcount == len(batches):
+        return
+
+    missing = batches
+    if result.rowcount > 0:
+        existing = set((await db.execute(
+            select(GradeAggregate.student_id, GradeAggregate.subject_id).where(
+                tuple_(GradeAggregate.student_id, GradeAggregate.subject_id).in_(list(values))
+            )
+        )).tuples())
+        missing = [b for b in batches if (b["key_student_id"], b["key_subject_id"]) not in existing]
+
+    await db.execute(_insert_or_merge(db), [
+        {
+            "student_id": b["key_student_id"],
+            "subject_id": b["key_subject_id"],
+            "count": b["n"],
+            "total": b["batch_total"],
+            "minimum": b["batch_min"],
+            "maximum": b["batch_max"],
+            "mean": b["batch_mean"],
+            "m2": b["batch_m2"],
+        }
+        for b in missing
+    ])
+
+
+async def add_to_aggregate(db: AsyncSession, student_id: int, subject_id: int, value: float) -> None:
+    await add_to_aggregates(db, {(student_id, subject_id): [value]})
+
+
+async def remove_from_aggregate(db: AsyncSession, student_id: int, subject_id: int, value: float) -> None:
+    # Call after the grade row is gone (or flushed with its old value replaced).
+    aggregate: GradeAggregate | None = await db.get(GradeAggregate, (student_id, subject_id), populate_existing=True)
+    if aggregate is None:
+        return
+
+    if aggregate.count <= 1:
+        await db.execute(delete(GradeAggregate).where(_pair(student_id, subject_id)))
+        return
+
+    delta = value - GradeAggregate.mean
+    values = dict(
+        count=GradeAggregate.count - 1,
+        total=GradeAggregate.total - value,
+        mean=(GradeAggregate.mean * GradeAggregate.count - value) / (GradeAggregate.count - 1),
+        m2=GradeAggregate.m2 - delta * delta * GradeAggregate.count / (GradeAggregate.count - 1),
+    )
+    # Min and max can't be reversed; only rescan this pair's grades when the removed value was one of them.
+    if value <= aggregate.minimum or value >= aggregate.maximum:
+        remaining = select(func.min(Grade.grade), func.max(Grade.grade)).where(
+            Grade.student_id == student_id, Grade.subject_id == subject_id
+        )
+        minimum, maximum = (await db.execute(remaining)).one()
+        values.update(minimum=minimum, maximum=maximum)
+
+    await db.execute(update(GradeAggregate).where(_pair(student_id, subject_id)).values(**values))
+
+
+async def replace_in_aggregate(db: AsyncSession, student_id: int, subject_id: int, old_value: float, new_value: float) -> None:
+    await remove_from_aggregate(db, student_id, subject_id, old_value)
+    await add_to_aggregate(db, student_id, subject_id, new_value)
+
+
+async def rebuild_aggregates(db: AsyncSession) -> int:
+    count = func.count(Grade.id)
+    total = func.sum(Grade.grade)
+    mean = func.avg(Grade.grade)
+    backfill = select(
+        Grade.student_id,
+        Grade.subject_id,
+        count,
+        total,
+        func.min(Grade.grade),
+        func.max(Grade.grade),
+        mean,
+        func.sum(Grade.grade * Grade.grade) - total * mean,
+    ).group_by(Grade.student_id, Grade.subject_id)
+
+    await db.execute(delete(GradeAggregate))
+    result = await db.execute(insert(GradeAggregate).from_select(
+        ["student_id", "subject_id", "count", "total", "minimum", "maximum", "mean", "m2"],
+        backfill,
+    ))
+    await db.commit()
+    return result.rowcount
+
+
+async def main() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+    async with SessionLocal() as db:
+        rows = await rebuild_aggregates(db)
+    await engine.dispose()
+    print(f"Rebuilt {rows} grade aggregates")
+
+
+# Backfill or repair: python -m grades.aggregates
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,10 +1,9 @@
 import enum
-from datetime import datetime
+from datetime import datetime, UTC
 
-from sqlalchemy import ForeignKey, FLOAT, Enum, DateTime
+from sqlalchemy import ForeignKey, FLOAT, Enum, DateTime, Index, Integer
 from sqlalchemy.orm import Mapped, relationship, validates
 from sqlalchemy.orm import mapped_column
-from sqlalchemy.sql import func
 
 from database import Base
 from subjects.models import Subject
@@ -19,6 +18,12 @@ class GradeType(enum.Enum):
 
 class Grade(Base):
     __tablename__ = "grades"
+    # Keyset pagination walks (created_at, id); the filtered listings seek on their column first.
+    __table_args__ = (
+        Index("ix_grades_created_at_id", "created_at", "id"),
+        Index("ix_grades_subject_id_created_at_id", "subject_id", "created_at", "id"),
+        Index("ix_grades_student_id_created_at_id", "student_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
 
@@ -31,7 +36,12 @@ class Grade(Base):
     grade: Mapped[float] = mapped_column(FLOAT)
     grade_type: Mapped[GradeType] = mapped_column(Enum(GradeType))
 
-    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    # CURRENT_TIMESTAMP has whole-second precision and a different text form on SQLite; keyset cursors need one
+    # format that round-trips exactly, so the value is always set here and older rows are normalized on upgrade.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(UTC).replace(tzinfo=None),
+    )
 
     @property
     def type(self):
@@ -48,3 +58,23 @@ class Grade(Base):
         if student.role != Role.STUDENT:
             raise ValueError("Grades can be assigned only to students")
         return student
+
+
+class GradeAggregate(Base):
+    __tablename__ = "grade_aggregates"
+
+    student_id: Mapped[int] = mapped_column(ForeignKey("users.id"), primary_key=True)
+    subject_id: Mapped[int] = mapped_column(ForeignKey("subjects.id"), primary_key=True)
+
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[float] = mapped_column(FLOAT, default=0)
+    minimum: Mapped[float] = mapped_column(FLOAT)
+    maximum: Mapped[float] = mapped_column(FLOAT)
+    # Welford running mean and sum of squared deviations from it.
+    mean: Mapped[float] = mapped_column(FLOAT, default=0)
+    m2: Mapped[float] = mapped_column(FLOAT, default=0)
+
+    @property
+    def variance(self) -> float:
+        # Reversing Welford on delete can leave m2 a rounding error below zero.
+        return max(self.m2, 0.0) / self.count if self.count else 0.0
@@ -1,7 +1,14 @@
-from pydantic import BaseModel, ConfigDict, field_validator
+import os
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from datetime import datetime
 
 from grades.models import GradeType
+from utils.export import ExportFormat
+
+GRADES_PAGE_SIZE = int(os.getenv("GRADES_PAGE_SIZE", 50))
+GRADES_MAX_PAGE_SIZE = int(os.getenv("GRADES_MAX_PAGE_SIZE", 500))
 
 
 class GradeResponse(BaseModel):
@@ -14,6 +21,46 @@ class GradeResponse(BaseModel):
 
     model_config = ConfigDict(from_attributes=True)
 
+class GradeSummaryResponse(BaseModel):
+    student_id: int
+    subject_id: int
+    count: int
+    mean: float
+    minimum: float
+    maximum: float
+    variance: float
+
+    model_config = ConfigDict(from_attributes=True)
+
+class GradePage(BaseModel):
+    items: List[GradeResponse]
+    next_cursor: str | None
+
+class GradeFilters(BaseModel):
+    subject_id: int | None = None
+    student_id: int | None = None
+    type: GradeType | None = None
+    created_from: datetime | None = None
+    created_to: datetime | None = None
+
+    @field_validator("type", mode="before")
+    @classmethod
+    def convert_type_to_enum(cls, value) -> GradeType | None:
+        if isinstance(value, str):
+            try:
+                return GradeType[value.upper()]
+            except KeyError:
+                raise ValueError(f"Invalid grade type: {value}. Must be one of {[t.name for t in GradeType]}")
+
+        return value
+
+class GradeQuery(GradeFilters):
+    cursor: str | None = None
+    limit: int = Field(default=GRADES_PAGE_SIZE, ge=1, le=GRADES_MAX_PAGE_SIZE)
+
+class GradeExportQuery(GradeFilters):
+    format: ExportFormat = ExportFormat.NDJSON
+
 class GradeCreateRequest(BaseModel):
     student_id: int
     subject_id: int
@@ -1,49 +1,99 @@
-from typing import List, cast
+import os
+from collections import defaultdict
+from typing import List, Tuple
 
 from fastapi_mail import MessageSchema, MessageType
 from pydantic import NameEmail
-from sqlalchemy import select
+from sqlalchemy import select, tuple_, Select, insert
+from sqlalchemy.orm import selectinload
 from starlette import status
 from starlette.exceptions import HTTPException
 
-from auth.models import User, Role, Parent, Student
-from dependency import db_dependency
-from fastmail_conf import fm
-from grades.models import Grade
-from grades.schemas import GradeCreateRequest
-from subjects.models import Subject
-
-
-def get_all_grades(db: db_dependency) -> List[Grade]:
-    statement = select(Grade)
-    return list(db.scalars(statement).all())
+from auth.authorization import can_access_student, is_enrolled
+from auth.identity import Identity
+from auth.models import Role, Student, User, parent_student_association
+from dependency import db_dependency, read_db_dependency
+from outbox.service import enqueue_email, enqueue_emails
+from grades.aggregates import add_to_aggregate, add_to_aggregates
+from grades.models import Grade, GradeAggregate
+from grades.schemas import GradeCreateRequest, GradeQuery, GradeFilters
+from subjects.models import Subject, subject_students
+from utils.pagination import decode_cursor, split_page
+
+GRADES_MAX_BULK_SIZE = int(os.getenv("GRADES_MAX_BULK_SIZE", 500))
+
+
+def filter_grades(statement: Select, filters: GradeFilters) -> Select:
+    if filters.subject_id is not None:
+        statement = statement.where(Grade.subject_id == filters.subject_id)
+    if filters.student_id is not None:
+        statement = statement.where(Grade.student_id == filters.student_id)
+    if filters.type is not None:
+        statement = statement.where(Grade.grade_type == filters.type)
+    if filters.created_from is not None:
+        statement = statement.where(Grade.created_at >= filters.created_from)
+    if filters.created_to is not None:
+        statement = statement.where(Grade.created_at < filters.created_to)
+    return statement
+
+async def get_all_grades(db: read_db_dependency, query: GradeQuery | None = None) -> Tuple[List[Grade], str | None]:
+    query = query or GradeQuery()
+    statement = filter_grades(select(Grade), query)
+
+    if query.cursor is not None:
+        created_at, grade_id = decode_cursor(query.cursor)
+        statement = statement.where(tuple_(Grade.created_at, Grade.id) < (created_at, grade_id))
+
+    statement = statement.order_by(Grade.created_at.desc(), Grade.id.desc()).limit(query.limit + 1)
+    grades = list((await db.scalars(statement)).all())
+    return split_page(grades, query.limit)
+
+def export_grades_statement(filters: GradeFilters) -> Select:
+    statement = select(
+        Grade.id,
+        Grade.student_id,
+        Grade.subject_id,
+        Grade.grade,
+        Grade.grade_type.label("type"),
+        Grade.created_at,
+    )
+    return filter_grades(statement, filters).order_by(Grade.id)
 
-def get_grade(user: User, grade_id: int, db: db_dependency) -> Grade:
-    grade: Grade | None = db.get(Grade, grade_id)
+async def get_grade(user: Identity, grade_id: int, db: read_db_dependency) -> Grade:
+    grade: Grade | None = await db.get(Grade, grade_id)
     if not grade:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Grade with ID: {grade_id} was not found"
         )
 
-    if user.role == Role.STUDENT and grade.student_id != user.id:
+    if not await can_access_student(db, user, grade.student_id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Can't see that grade"
         )
 
-    if user.role == Role.PARENT:
-        user = cast(Parent, user)
-        if grade.student_id not in [c.id for c in user.children]:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Can't see that grade"
-            )
-
     return grade
 
-async def create_grade(user: User, request: GradeCreateRequest, db: db_dependency) -> Grade:
-    subject: Subject | None = db.get(Subject, request.subject_id)
+async def get_grade_summaries(
+        user: Identity,
+        student_id: int,
+        subject_id: int | None,
+        db: read_db_dependency
+) -> List[GradeAggregate]:
+    if not await can_access_student(db, user, student_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Can't see grades of other students"
+        )
+
+    statement = select(GradeAggregate).where(GradeAggregate.student_id == student_id)
+    if subject_id is not None:
+        statement = statement.where(GradeAggregate.subject_id == subject_id)
+    return list((await db.scalars(statement.order_by(GradeAggregate.subject_id))).all())
+
+async def create_grade(user: Identity, request: GradeCreateRequest, db: db_dependency) -> Grade:
+    subject: Subject | None = await db.get(Subject, request.subject_id)
     if not subject:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -57,13 +107,13 @@ async def create_grade(user: User, request: GradeCreateRequest, db: db_dependenc
                 detail="Can't grade when not a teacher of the subject"
             )
 
-    if request.student_id not in subject.students_ids:
+    if not await is_enrolled(db, request.student_id, subject.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Student is not part of the subject"
         )
 
-    student: Student | None = db.get(Student, request.student_id)
+    student: Student | None = await db.get(Student, request.student_id, options=[selectinload(Student.parents)])
     if student is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -83,8 +133,7 @@ async def create_grade(user: User, request: GradeCreateRequest, db: db_dependenc
         grade_type=request.type
     )
     db.add(grade)
-    db.commit()
-    db.refresh(grade)
+    await add_to_aggregate(db, request.student_id, request.subject_id, request.grade)
 
     emails = ([NameEmail(name="", email=student.email)] +
               [NameEmail(name="", email=p.email) for p in student.parents])
@@ -95,8 +144,97 @@ async def create_grade(user: User, request: GradeCreateRequest, db: db_dependenc
         body=f"You received a grade {request.grade}, {request.type.name} in {subject.name}",
         subtype=MessageType(value="html")
     )
+    enqueue_email(db, message)
 
-    await fm.send_message(message)
+    await db.commit()
+    await db.refresh(grade)
 
     return grade
 
+async def create_grades(user: Identity, requests: List[GradeCreateRequest], db: db_dependency) -> List[Grade]:
+    if not requests or len(requests) > GRADES_MAX_BULK_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Provide between 1 and {GRADES_MAX_BULK_SIZE} grades"
+        )
+
+    for request in requests:
+        if request.grade < 2 or request.grade > 6:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid grade"
+            )
+
+    subject_ids = {r.subject_id for r in requests}
+    statement = select(Subject.id, Subject.name, Subject.teacher_id).where(Subject.id.in_(subject_ids))
+    subjects = {row.id: row for row in (await db.execute(statement)).all()}
+    missing_subject_ids = subject_ids - subjects.keys()
+    if missing_subject_ids:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Subject with ID: {min(missing_subject_ids)} was not  found"
+        )
+
+    if user.role == Role.TEACHER and any(s.teacher_id != user.id for s in subjects.values()):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Can't grade when not a teacher of the subject"
+        )
+
+    pairs = {(r.student_id, r.subject_id) for r in requests}
+    statement = select(subject_students.c.user_id, subject_students.c.subject_id).where(
+        tuple_(subject_students.c.user_id, subject_students.c.subject_id).in_(list(pairs))
+    )
+    if len(set((await db.execute(statement)).tuples())) != len(pairs):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Student is not part of the subject"
+        )
+
+    student_ids = {r.student_id for r in requests}
+    statement = select(User.id, User.email).where(User.id.in_(student_ids), User.role == Role.STUDENT)
+    recipients = {row.id: [NameEmail(name="", email=row.email)] for row in (await db.execute(statement)).all()}
+    if len(recipients) != len(student_ids):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Provided student is not actually a student"
+        )
+
+    statement = (
+        select(parent_student_association.c.student_id, User.email)
+        .join(User, User.id == parent_student_association.c.parent_id)
+        .where(parent_student_association.c.student_id.in_(student_ids))
+    )
+    for student_id, email in (await db.execute(statement)).tuples():
+        recipients[student_id].append(NameEmail(name="", email=email))
+
+    # Without sort_by_parameter_order SQLite can batch the RETURNING insert; ids still follow the VALUES order.
+    statement = insert(Grade).returning(Grade)
+    grades = sorted((await db.scalars(statement, [
+        {
+            "student_id": r.student_id,
+            "subject_id": r.subject_id,
+            "grade": r.grade,
+            "grade_type": r.type,
+        }
+        for r in requests
+    ])).all(), key=lambda g: g.id)
+
+    values = defaultdict(list)
+    for request in requests:
+        values[(request.student_id, request.subject_id)].append(request.grade)
+    await add_to_aggregates(db, values)
+
+    await enqueue_emails(db, [
+        MessageSchema(
+            subject="New grade",
+            recipients=recipients[request.student_id],
+            body=f"You received a grade {request.grade}, {request.type.name} in {subjects[request.subject_id].name}",
+            subtype=MessageType(value="html")
+        )
+        for request in requests
+    ])
+
+    await db.commit()
+
+    return grades
@@ -1,22 +1,26 @@
-from typing import List, Annotated
+from typing import Annotated, List
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from starlette import status
 
 from auth.RoleChecker import RoleChecker
-from auth.models import User, Role
-from dependency import db_dependency
-from grades.schemas import GradeResponse, GradeCreateRequest
-from grades.service import get_all_grades, get_grade, create_grade
+from auth.identity import Identity
+from auth.models import Role
+from dependency import db_dependency, read_db_dependency
+from grades.schemas import GradeResponse, GradeCreateRequest, GradePage, GradeQuery, GradeExportQuery, \
+    GradeSummaryResponse
+from grades.service import get_all_grades, get_grade, create_grade, export_grades_statement, get_grade_summaries, \
+    create_grades
+from utils.export import export_response
 
 router = APIRouter(prefix="/grades", tags=["grades"])
 
 user_dependency = Annotated[
-    User,
+    Identity,
     Depends(RoleChecker(list(Role)))]
 
 principal_or_admin_dependency = Annotated[
-    User,
+    Identity,
     Depends(RoleChecker(
         [
             Role.PRINCIPAL,
@@ -24,26 +28,34 @@ principal_or_admin_dependency = Annotated[
         ]))]
 
 teacher_or_admin_dependency = Annotated[
-    User,
+    Identity,
     Depends(RoleChecker(
         [
             Role.TEACHER,
             Role.ADMIN
         ]))]
 
-@router.get("/", status_code=status.HTTP_200_OK, response_model=List[GradeResponse])
-async def get_all(user: principal_or_admin_dependency, db: db_dependency):
-    return get_all_grades(db)
+@router.get("/", status_code=status.HTTP_200_OK, response_model=GradePage)
+async def get_all(user: principal_or_admin_dependency, query: Annotated[GradeQuery, Query()], db: read_db_dependency):
+    grades, next_cursor = await get_all_grades(db, query)
+    return GradePage(items=grades, next_cursor=next_cursor)
+
+@router.get("/export", status_code=status.HTTP_200_OK)
+async def export(user: principal_or_admin_dependency, query: Annotated[GradeExportQuery, Query()]):
+    return export_response(export_grades_statement(query), query.format, "grades")
+
+@router.get("/students/{student_id}/summary", status_code=status.HTTP_200_OK, response_model=List[GradeSummaryResponse])
+async def summary(user: user_dependency, student_id: int, db: read_db_dependency, subject_id: int | None = None):
+    return await get_grade_summaries(user, student_id, subject_id, db)
 
 @router.get("/{grade_id}", status_code=status.HTTP_200_OK, response_model=GradeResponse)
-async def get(user: user_dependency, grade_id: int, db: db_dependency):
-    return get_grade(user, grade_id, db)
+async def get(user: user_dependency, grade_id: int, db: read_db_dependency):
+    return await get_grade(user, grade_id, db)
 
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=GradeResponse)
 async def create(user: teacher_or_admin_dependency, request: GradeCreateRequest, db: db_dependency):
     return await create_grade(user, request, db)
 
-
-
-
-
+@router.post("/bulk", status_code=status.HTTP_201_CREATED, response_model=List[GradeResponse])
+async def create_bulk(user: teacher_or_admin_dependency, requests: List[GradeCreateRequest], db: db_dependency):
+    return await create_grades(user, requests, db)
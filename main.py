@@ -1,10 +1,8 @@
 from dotenv import load_dotenv
 
-import absences.views
-
 load_dotenv()
 
-import os
+import absences.views
 
 import grades.views
 
@@ -12,6 +10,7 @@ import subjects.views
 
 # pylint: disable=wrong-import-position
 
+import asyncio
 from contextlib import asynccontextmanager
 
 from starlette import status
@@ -20,25 +19,62 @@ from starlette.exceptions import HTTPException
 import classes.views
 import auth
 import parents.views
+import audit.views
 from auth.views import user_dependency
-from database import engine, Base
+from database import engine, read_engine, Base
+from migrations import upgrade_schema
 
-from fastapi.responses import FileResponse
-
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 
 from auth.models import *
 from classes.models import *
 from subjects.models import *
 from grades.models import *
 from audit.models import *
+from outbox.models import *
+from storage.models import *
+from outbox.worker import run_outbox_worker
+from audit.writer import audit_writer
+from audit.archive import run_audit_retention
+from fastmail_conf import smtp_pool
+from auth.hashing import password_hasher
+from utils.media import media_response
+from storage.signing import verify_media_signature
+from storage.backends import media_storage
+from storage.uploads import run_upload_cleanup
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+    stop_outbox = asyncio.Event()
+    outbox_task = asyncio.create_task(run_outbox_worker(stop_outbox))
+    stop_audit = asyncio.Event()
+    audit_task = asyncio.create_task(audit_writer.run(stop_audit))
+    retention_task = asyncio.create_task(run_audit_retention(stop_audit))
+    stop_uploads = asyncio.Event()
+    uploads_task = asyncio.create_task(run_upload_cleanup(stop_uploads))
+
     yield
 
+    stop_outbox.set()
+    await outbox_task
+    # Drains whatever is still queued before the engine goes away.
+    stop_audit.set()
+    await audit_task
+    await retention_task
+    stop_uploads.set()
+    await uploads_task
+    await smtp_pool.close()
+    await asyncio.to_thread(password_hasher.shutdown)
+    await media_storage.close()
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -48,8 +84,7 @@ app.include_router(classes.views.router)
 app.include_router(subjects.views.router)
 app.include_router(grades.views.router)
 app.include_router(absences.views.router)
-
-UPLOAD_DIR = os.getenv("MEDIA_PATH", "./media")
+app.include_router(audit.views.router)
 
 
 @app.get("/")
@@ -64,13 +99,6 @@ async def root(user: user_dependency):
 
 
 @app.get("/media/{file_path:path}")
-async def media(file_path: str):
-    full_path = os.path.join(UPLOAD_DIR, file_path)
-
-    if not os.path.exists(full_path) or not os.path.isfile(full_path):
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="File was not found"
-        )
-
-    return FileResponse(full_path)
+async def media(request: Request, file_path: str, expires: int, uid: int, sig: str):
+    verify_media_signature(file_path, expires, uid, sig)
+    return await media_response(request, file_path, expires)
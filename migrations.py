@@ -0,0 +1,61 @@
+import logging
+from typing import List, Tuple
+
+from sqlalchemy import Connection, inspect, text
+
+from database import Base
+
+logger = logging.getLogger(__name__)
+
+# create_all only creates missing tables, so columns added to a table that already exists are listed here.
+# Each entry is (table, column, DDL for ADD COLUMN); rows written before the column read its DEFAULT.
+ADDED_COLUMNS: List[Tuple[str, str, str]] = [
+    ("users", "token_version", "INTEGER NOT NULL DEFAULT 0"),
+    ("audit_logs", "entity_type", "VARCHAR"),
+    ("audit_logs", "entity_id", "INTEGER"),
+    ("audit_logs", "payload", "JSON"),
+]
+
+# Keyset cursors compare timestamps as text on SQLite, so rows written by the old CURRENT_TIMESTAMP default
+# ("YYYY-MM-DD HH:MM:SS") are rewritten to the "YYYY-MM-DD HH:MM:SS.ffffff" form the models now always write.
+NORMALIZED_TIMESTAMPS: List[Tuple[str, str]] = [
+    ("grades", "created_at"),
+    ("audit_logs", "timestamp"),
+]
+
+
+def _add_columns(conn: Connection) -> None:
+    inspector = inspect(conn)
+    tables = set(inspector.get_table_names())
+    for table, column, ddl in ADDED_COLUMNS:
+        if table not in tables:
+            continue
+        if column in {c["name"] for c in inspector.get_columns(table)}:
+            continue
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        logger.info("Added column %s.%s", table, column)
+
+def _normalize_timestamps(conn: Connection) -> None:
+    if conn.dialect.name != "sqlite":
+        return
+    tables = set(inspect(conn).get_table_names())
+    for table, column in NORMALIZED_TIMESTAMPS:
+        if table not in tables:
+            continue
+        result = conn.execute(text(
+            f"UPDATE {table} SET {column} = strftime('%Y-%m-%d %H:%M:%f000', {column}) WHERE length({column}) = 19"
+        ))
+        if result.rowcount:
+            logger.info("Normalized %s %s.%s values", result.rowcount, table, column)
+
+def _create_indexes(conn: Connection) -> None:
+    # Indexes are only emitted together with their table, so new ones on an existing table are created here.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+# Brings tables created by an older release up to the current models; safe to run on every start.
+def upgrade_schema(conn: Connection) -> None:
+    _add_columns(conn)
+    _normalize_timestamps(conn)
+    _create_indexes(conn)
@@ -0,0 +1,39 @@
+import enum
+from datetime import datetime, UTC
+from typing import List
+
+from sqlalchemy import String, Text, Integer, DateTime, Enum, JSON, Index
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+
+from database import Base
+
+
+class OutboxStatus(enum.Enum):
+    PENDING = 1
+    FAILED = 2
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+
+    subject: Mapped[str] = mapped_column(String)
+    recipients: Mapped[List[str]] = mapped_column(JSON)
+    body: Mapped[str] = mapped_column(Text)
+    subtype: Mapped[str] = mapped_column(String, default="html")
+
+    status: Mapped[OutboxStatus] = mapped_column(Enum(OutboxStatus), default=OutboxStatus.PENDING)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    last_error: Mapped[str | None] = mapped_column(String, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(UTC).replace(tzinfo=None),
+    )
+
+    __table_args__ = (
+        Index("ix_email_outbox_status_next_attempt_at", "status", "next_attempt_at"),
+    )
@@ -0,0 +1,30 @@
+from typing import Iterable
+
+from fastapi_mail import MessageSchema
+from sqlalchemy import insert
+
+from dependency import db_dependency
+from outbox.models import EmailOutbox
+
+
+def _outbox_values(message: MessageSchema) -> dict:
+    return {
+        "subject": message.subject,
+        "recipients": [r.email for r in message.recipients],
+        "body": str(message.body or ""),
+        "subtype": message.subtype.value,
+    }
+
+
+def enqueue_email(db: db_dependency, message: MessageSchema) -> None:
+    if not message.recipients:
+        return
+
+    db.add(EmailOutbox(**_outbox_values(message)))
+
+
+async def enqueue_emails(db: db_dependency, messages: Iterable[MessageSchema]) -> None:
+    # One executemany instead of an ORM flush that inserts row by row to collect primary keys.
+    rows = [_outbox_values(m) for m in messages if m.recipients]
+    if rows:
+        await db.execute(insert(EmailOutbox), rows)
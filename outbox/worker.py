@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+from datetime import UTC, datetime, timedelta
+
+from fastapi_mail import MessageSchema, MessageType
+from pydantic import NameEmail
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import SessionLocal
+from fastmail_conf import smtp_pool
+from outbox.models import EmailOutbox, OutboxStatus
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 50))
+OUTBOX_POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", 5))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", 3600))
+# A claimed row is hidden from other workers for this long; if the worker dies mid-send it is retried afterwards.
+OUTBOX_CLAIM_SECONDS = float(os.getenv("OUTBOX_CLAIM_SECONDS", 300))
+
+
+def backoff_delay(attempts: int) -> timedelta:
+    seconds = OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1))
+    return timedelta(seconds=min(seconds, OUTBOX_MAX_BACKOFF_SECONDS))
+
+
+def to_message(row: EmailOutbox) -> MessageSchema:
+    return MessageSchema(
+        subject=row.subject,
+        recipients=[NameEmail(name="", email=email) for email in row.recipients],
+        body=row.body,
+        subtype=MessageType(value=row.subtype)
+    )
+
+
+async def claim_batch(db: AsyncSession, now: datetime) -> list[EmailOutbox]:
+    statement = (
+        select(EmailOutbox)
+        .where(EmailOutbox.status == OutboxStatus.PENDING, EmailOutbox.next_attempt_at <= now)
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+        .limit(OUTBOX_BATCH_SIZE)
+    )
+    candidates = list((await db.scalars(statement)).all())
+
+    claimed = []
+    lease = now + timedelta(seconds=OUTBOX_CLAIM_SECONDS)
+    for row in candidates:
+        result = await db.execute(
+            update(EmailOutbox)
+            .where(EmailOutbox.id == row.id, EmailOutbox.next_attempt_at == row.next_attempt_at)
+            .values(next_attempt_at=lease)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 1:
+            claimed.append(row)
+    await db.commit()
+
+    return claimed
+
+
+async def send_row(row: EmailOutbox) -> None:
+    await smtp_pool.send_message(to_message(row))
+
+
+async def deliver_batch() -> int:
+    async with SessionLocal() as db:
+        rows = await claim_batch(db, datetime.now(UTC).replace(tzinfo=None))
+
+        # The pool caps in-flight sends at its size, so the whole batch fans out over the warm sessions.
+        results = await asyncio.gather(
+            *(send_row(row) for row in rows),
+            return_exceptions=True,
+        )
+
+        for row, result in zip(rows, results):
+            if isinstance(result, Exception):
+                row.attempts += 1
+                row.last_error = str(result)[:500]
+                if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    row.status = OutboxStatus.FAILED
+                    # Bodies can carry secrets (e.g. a new user's initial password); a dead row keeps only the metadata.
+                    row.body = ""
+                    logger.error("Giving up on outbox email %s after %s attempts: %s", row.id, row.attempts, result)
+                else:
+                    row.next_attempt_at = datetime.now(UTC).replace(tzinfo=None) + backoff_delay(row.attempts)
+            else:
+                await db.delete(row)
+        await db.commit()
+
+        return len(rows)
+
+
+async def run_outbox_worker(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        delivered = 0
+        try:
+            delivered = await deliver_batch()
+        except Exception as e:
+            logger.exception("Outbox delivery failed: %s", e)
+
+        if delivered < OUTBOX_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=OUTBOX_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
@@ -1,13 +1,16 @@
-from typing import List
+from typing import List, Sequence
 
 from fastapi_mail import MessageSchema, MessageType
 from pydantic import NameEmail
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from starlette import status
 from starlette.exceptions import HTTPException
 
 from dependency import db_dependency
+from auth.cache import token_cache
 from auth.models import Parent, Student
-from fastmail_conf import fm
+from outbox.service import enqueue_email
 from parents.schemas import AddStudentsRequest, RemoveStudentsRequests
 
 
@@ -15,13 +18,14 @@ async def add_students_to_parent(request: AddStudentsRequest, db: db_dependency)
     parent_id: int = request.parent_id
     students_ids: List[int] = request.students_ids
 
-    parent: Parent | None = db.get(Parent, parent_id)
+    parent: Parent | None = await db.get(Parent, parent_id, options=[selectinload(Parent.children)])
     if not parent:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Parent ID {parent_id} not found"
         )
-    students = db.query(Student).filter(Student.id.in_(students_ids)).all()
+    statement = select(Student).where(Student.id.in_(students_ids))
+    students = (await db.scalars(statement)).all()
     if len(students) != len(request.students_ids):
         found_ids = {s.id for s in students}
         missing_ids = set(request.students_ids) - found_ids
@@ -31,7 +35,6 @@ async def add_students_to_parent(request: AddStudentsRequest, db: db_dependency)
         )
 
     parent.children.extend(students)
-    db.commit()
 
     students_names: List[str] = [str(s.full_name) for s in students]
     message = MessageSchema(
@@ -40,25 +43,28 @@ async def add_students_to_parent(request: AddStudentsRequest, db: db_dependency)
         body=f"The following children were added to your profile: {", ".join(students_names)}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
+
+    await db.commit()
+
+    token_cache.invalidate_user(parent_id)
 
 async def remove_students_from_parent(request: RemoveStudentsRequests, db: db_dependency) -> None:
     parent_id: int = request.parent_id
     students_ids: List[int] = request.students_ids
 
-    parent: Parent | None = db.get(Parent, parent_id)
+    parent: Parent | None = await db.get(Parent, parent_id, options=[selectinload(Parent.children)])
     if not parent:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Parent ID {parent_id} not found"
         )
-    students_to_remove: List[Student] = db.query(Student).filter(Student.id.in_(students_ids)).all()
+    statement = select(Student).where(Student.id.in_(students_ids))
+    students_to_remove: Sequence[Student] = (await db.scalars(statement)).all()
     for student in students_to_remove:
         if student in parent.children:
             parent.children.remove(student)
 
-    db.commit()
-
     students_names = [s.full_name for s in students_to_remove]
     message = MessageSchema(
         subject="Removed children from profile",
@@ -66,7 +72,11 @@ async def remove_students_from_parent(request: RemoveStudentsRequests, db: db_de
         body=f"The following children were removed from your profile: {", ".join(students_names)}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
+
+    await db.commit()
+
+    token_cache.invalidate_user(parent_id)
 
 
 
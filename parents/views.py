@@ -1,11 +1,10 @@
-from typing import Annotated, cast
 
 from fastapi import APIRouter, Depends
 from starlette import status
 
-from auth.models import Parent
+from auth.service import load_user_snapshot
 from auth.views import admin_dependency, parent_dependency
-from dependency import db_dependency
+from dependency import db_dependency, read_db_dependency
 from .schemas import AddStudentsRequest, ParentProfileResponse, RemoveStudentsRequests
 from .service import add_students_to_parent, remove_students_from_parent
 
@@ -20,13 +19,13 @@ async def remove_children(user: admin_dependency, request: RemoveStudentsRequest
     await remove_students_from_parent(request, db)
 
 @router.get("/profile", response_model=ParentProfileResponse, status_code=status.HTTP_200_OK)
-async def get_profile(user: parent_dependency):
-    parent: Parent = cast(Parent, user)
+async def get_profile(user: parent_dependency, db: read_db_dependency):
+    parent = await load_user_snapshot(user, db)
     return ParentProfileResponse(
         id=parent.id,
         email=parent.email,
         full_name=parent.full_name,
         role=parent.role.name,
         date_of_birth= parent.date_of_birth,
-        children_ids=[s.id for s in parent.children]
+        children_ids=list(parent.children_ids)
     )
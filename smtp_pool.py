@@ -0,0 +1,161 @@
+import asyncio
+import time
+from dataclasses import dataclass, asdict
+from email.message import Message, EmailMessage
+from typing import List
+
+import aiosmtplib
+from fastapi_mail import ConnectionConfig, MessageSchema
+from fastapi_mail.msg import MailMsg
+
+
+@dataclass
+class SMTPPoolMetrics:
+    connections_opened: int = 0
+    connections_closed: int = 0
+    idle_reconnects: int = 0
+    messages_sent: int = 0
+    send_failures: int = 0
+    in_use: int = 0
+    idle: int = 0
+
+
+@dataclass
+class _PooledConnection:
+    smtp: aiosmtplib.SMTP
+    last_used: float
+    messages_sent: int = 0
+
+
+class SMTPPool:
+    def __init__(
+            self,
+            hostname: str,
+            port: int,
+            username: str | None = None,
+            password: str | None = None,
+            sender: str = "",
+            start_tls: bool = False,
+            use_tls: bool = False,
+            validate_certs: bool = True,
+            size: int = 4,
+            idle_timeout: float = 60,
+            max_messages_per_connection: int = 100,
+            timeout: float = 30,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender
+        self.start_tls = start_tls
+        self.use_tls = use_tls
+        self.validate_certs = validate_certs
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.max_messages_per_connection = max_messages_per_connection
+        self.timeout = timeout
+
+        self._idle: List[_PooledConnection] = []
+        self._slots = asyncio.Semaphore(size)
+        self._metrics = SMTPPoolMetrics()
+
+    @classmethod
+    def from_config(cls, config: ConnectionConfig, **kwargs) -> "SMTPPool":
+        return cls(
+            hostname=config.MAIL_SERVER,
+            port=config.MAIL_PORT,
+            username=config.MAIL_USERNAME if config.USE_CREDENTIALS else None,
+            password=config.MAIL_PASSWORD.get_secret_value() if config.USE_CREDENTIALS else None,
+            sender=str(config.MAIL_FROM),
+            start_tls=config.MAIL_STARTTLS,
+            use_tls=config.MAIL_SSL_TLS,
+            validate_certs=config.VALIDATE_CERTS,
+            timeout=config.TIMEOUT,
+            **kwargs,
+        )
+
+    @property
+    def metrics(self) -> dict:
+        self._metrics.idle = len(self._idle)
+        return asdict(self._metrics)
+
+    async def _open(self) -> _PooledConnection:
+        smtp = aiosmtplib.SMTP(
+            hostname=self.hostname,
+            port=self.port,
+            use_tls=self.use_tls,
+            start_tls=self.start_tls,
+            validate_certs=self.validate_certs,
+            timeout=self.timeout,
+        )
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password or "")
+
+        self._metrics.connections_opened += 1
+        return _PooledConnection(smtp=smtp, last_used=time.monotonic())
+
+    async def _close(self, connection: _PooledConnection) -> None:
+        self._metrics.connections_closed += 1
+        try:
+            if connection.smtp.is_connected:
+                await connection.smtp.quit()
+        except aiosmtplib.SMTPException:
+            connection.smtp.close()
+
+    async def _acquire(self) -> _PooledConnection:
+        while self._idle:
+            connection = self._idle.pop()
+            expired = time.monotonic() - connection.last_used > self.idle_timeout
+            if expired or not connection.smtp.is_connected:
+                # The server has most likely dropped an idle session already; don't pay for a failed send to find out.
+                self._metrics.idle_reconnects += 1
+                await self._close(connection)
+                continue
+            return connection
+
+        return await self._open()
+
+    async def _release(self, connection: _PooledConnection) -> None:
+        connection.last_used = time.monotonic()
+        if connection.messages_sent >= self.max_messages_per_connection:
+            await self._close(connection)
+            return
+        self._idle.append(connection)
+
+    async def send(self, messages: List[Message | EmailMessage]) -> None:
+        async with self._slots:
+            self._metrics.in_use += 1
+            connection: _PooledConnection | None = None
+            try:
+                connection = await self._acquire()
+                for message in messages:
+                    try:
+                        await connection.smtp.send_message(message)
+                    except aiosmtplib.SMTPServerDisconnected:
+                        await self._close(connection)
+                        connection = None
+                        connection = await self._open()
+                        await connection.smtp.send_message(message)
+                    connection.messages_sent += 1
+                    self._metrics.messages_sent += 1
+            except Exception:
+                self._metrics.send_failures += 1
+                if connection is not None:
+                    await self._close(connection)
+                    connection = None
+                raise
+            finally:
+                self._metrics.in_use -= 1
+                if connection is not None:
+                    await self._release(connection)
+
+    async def send_message(self, message: MessageSchema | List[MessageSchema]) -> None:
+        schemas = message if isinstance(message, list) else [message]
+        prepared = [await MailMsg(m)._message(self.sender) for m in schemas]  # pylint: disable=protected-access
+        await self.send(prepared)
+
+    async def close(self) -> None:
+        while self._idle:
+            await self._close(self._idle.pop())
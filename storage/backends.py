@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import stat
+import uuid
+import xml.etree.ElementTree as ElementTree
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from email.utils import parsedate_to_datetime
+from typing import AsyncIterator, BinaryIO, List
+from urllib.parse import quote
+
+import httpx
+
+MEDIA_STORAGE = os.getenv("MEDIA_STORAGE", "local")
+MEDIA_PATH = os.getenv("MEDIA_PATH", "./media")
+MEDIA_STREAM_CHUNK_BYTES = int(os.getenv("MEDIA_STREAM_CHUNK_BYTES", 256 * 1024))
+MEDIA_S3_ENDPOINT = os.getenv("MEDIA_S3_ENDPOINT", "")
+MEDIA_S3_BUCKET = os.getenv("MEDIA_S3_BUCKET", "")
+MEDIA_S3_REGION = os.getenv("MEDIA_S3_REGION", "us-east-1")
+MEDIA_S3_ACCESS_KEY = os.getenv("MEDIA_S3_ACCESS_KEY", "")
+MEDIA_S3_SECRET_KEY = os.getenv("MEDIA_S3_SECRET_KEY", "")
+MEDIA_S3_TIMEOUT_SECONDS = float(os.getenv("MEDIA_S3_TIMEOUT_SECONDS", 30))
+
+S3_NAMESPACE = "{http://s3.amazonaws.com/doc/2006-03-01/}"
+EMPTY_SHA256 = hashlib.sha256(b"").hexdigest()
+
+
+@dataclass(frozen=True)
+class ObjectInfo:
+    key: str
+    size: int
+    # Seconds since the epoch.
+    modified: float
+
+
+class StorageBackend(ABC):
+    # Keys are "/"-separated relative paths such as "blobs/ab/ab12….pdf"; missing objects raise FileNotFoundError.
+
+    @abstractmethod
+    async def put(self, key: str, source: BinaryIO, size: int, sha256: str) -> None: ...
+
+    @abstractmethod
+    async def head(self, key: str) -> ObjectInfo | None: ...
+
+    @abstractmethod
+    def stream(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        # Yields bytes start..end inclusive in chunks, never the whole object at once.
+        ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def list(self, prefix: str) -> List[ObjectInfo]: ...
+
+    async def get(self, key: str) -> bytes:
+        return b"".join([chunk async for chunk in self.stream(key)])
+
+    async def close(self) -> None:
+        pass
+
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str = MEDIA_PATH, chunk_bytes: int = MEDIA_STREAM_CHUNK_BYTES):
+        self.root = root
+        self.chunk_bytes = chunk_bytes
+
+    def _path(self, key: str) -> str:
+        root = os.path.realpath(self.root)
+        full_path = os.path.realpath(os.path.join(root, key))
+        # "..", absolute keys and symlinks must not reach outside the root.
+        if os.path.commonpath([root, full_path]) != root or full_path == root:
+            raise FileNotFoundError(key)
+        return full_path
+
+    def _write(self, source: BinaryIO, destination: str) -> None:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        # Readers never see a partial file: it only gets its final name once fully written.
+        temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+        try:
+            with open(temp_path, "wb") as buffer:
+                while chunk := source.read(self.chunk_bytes):
+                    buffer.write(chunk)
+            os.replace(temp_path, destination)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    async def put(self, key: str, source: BinaryIO, size: int, sha256: str) -> None:
+        await asyncio.to_thread(self._write, source, self._path(key))
+
+    def _stat(self, key: str) -> ObjectInfo | None:
+        try:
+            result = os.stat(self._path(key))
+        except FileNotFoundError:
+            return None
+        if not stat.S_ISREG(result.st_mode):
+            return None
+        return ObjectInfo(key=key, size=result.st_size, modified=result.st_mtime)
+
+    async def head(self, key: str) -> ObjectInfo | None:
+        return await asyncio.to_thread(self._stat, key)
+
+    async def stream(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        file = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            await asyncio.to_thread(file.seek, start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                size = self.chunk_bytes if remaining is None else min(self.chunk_bytes, remaining)
+                chunk = await asyncio.to_thread(file.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(file.close)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await asyncio.to_thread(os.remove, self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def _walk(self, prefix: str) -> List[ObjectInfo]:
+        root = os.path.realpath(self.root)
+        objects = []
+        for directory, _, files in os.walk(os.path.join(root, prefix)):
+            for name in files:
+                full_path = os.path.join(directory, name)
+                key = os.path.relpath(full_path, root).replace(os.sep, "/")
+                result = os.stat(full_path)
+                objects.append(ObjectInfo(key=key, size=result.st_size, modified=result.st_mtime))
+        return objects
+
+    async def list(self, prefix: str) -> List[ObjectInfo]:
+        return await asyncio.to_thread(self._walk, prefix)
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode(), hashlib.sha256).digest()
+
+def sign_v4(
+        method: str,
+        url: httpx.URL,
+        headers: dict,
+        payload_sha256: str,
+        access_key: str,
+        secret_key: str,
+        region: str,
+        service: str = "s3",
+        now: datetime | None = None,
+) -> dict:
+    now = now or datetime.now(UTC)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    scope = f"{now:%Y%m%d}/{region}/{service}/aws4_request"
+
+    signed = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed["host"] = url.netloc.decode()
+    signed["x-amz-date"] = amz_date
+    names = sorted(signed)
+
+    query = "&".join(
+        f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}"
+        for name, value in sorted(url.params.multi_items())
+    )
+    canonical_request = "\n".join([
+        method,
+        quote(url.path, safe="/-_.~"),
+        query,
+        "".join(f"{name}:{signed[name]}\n" for name in names),
+        ";".join(names),
+        payload_sha256,
+    ])
+    string_to_sign = "\n".join([
+        "AWS4-HMAC-SHA256",
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest(),
+    ])
+
+    key = f"AWS4{secret_key}".encode()
+    for part in (now.strftime("%Y%m%d"), region, service, "aws4_request"):
+        key = _hmac(key, part)
+    signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+
+    return {
+        **headers,
+        "host": signed["host"],
+        "x-amz-date": amz_date,
+        "authorization": f"AWS4-HMAC-SHA256 Credential={access_key}/{scope}, "
+                         f"SignedHeaders={';'.join(names)}, Signature={signature}",
+    }
+
+
+class S3Storage(StorageBackend):
+    def __init__(
+            self,
+            endpoint: str = MEDIA_S3_ENDPOINT,
+            bucket: str = MEDIA_S3_BUCKET,
+            region: str = MEDIA_S3_REGION,
+            access_key: str = MEDIA_S3_ACCESS_KEY,
+            secret_key: str = MEDIA_S3_SECRET_KEY,
+            client: httpx.AsyncClient | None = None,
+            chunk_bytes: int = MEDIA_STREAM_CHUNK_BYTES,
+            page_size: int = 1000,
+    ):
+        self.endpoint = endpoint.rstrip("/")
+        self.bucket = bucket
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.client = client or httpx.AsyncClient(timeout=MEDIA_S3_TIMEOUT_SECONDS)
+        self.chunk_bytes = chunk_bytes
+        self.page_size = page_size
+
+    def _request(
+            self,
+            method: str,
+            key: str = "",
+            params: dict | None = None,
+            headers: dict | None = None,
+            payload_sha256: str = EMPTY_SHA256,
+            content=None,
+    ) -> httpx.Request:
+        # Path-style addressing works with AWS as well as MinIO and other S3-compatible stores.
+        url = httpx.URL(f"{self.endpoint}/{self.bucket}/{quote(key)}" if key else f"{self.endpoint}/{self.bucket}",
+                        params=params)
+        headers = {**(headers or {}), "x-amz-content-sha256": payload_sha256}
+        headers = sign_v4(method, url, headers, payload_sha256, self.access_key, self.secret_key, self.region)
+        return self.client.build_request(method, url, headers=headers, content=content)
+
+    async def _read(self, source: BinaryIO) -> AsyncIterator[bytes]:
+        while chunk := await asyncio.to_thread(source.read, self.chunk_bytes):
+            yield chunk
+
+    async def put(self, key: str, source: BinaryIO, size: int, sha256: str) -> None:
+        # The content hash is already known, so the store verifies the body instead of trusting it unsigned.
+        request = self._request("PUT", key, headers={"content-length": str(size)}, payload_sha256=sha256,
+                                content=self._read(source))
+        response = await self.client.send(request)
+        response.raise_for_status()
+
+    async def head(self, key: str) -> ObjectInfo | None:
+        response = await self.client.send(self._request("HEAD", key))
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return ObjectInfo(
+            key=key,
+            size=int(response.headers["content-length"]),
+            modified=parsedate_to_datetime(response.headers["last-modified"]).timestamp(),
+        )
+
+    async def stream(self, key: str, start: int = 0, end: int | None = None) -> AsyncIterator[bytes]:
+        headers = {}
+        if start or end is not None:
+            headers["range"] = f"bytes={start}-{'' if end is None else end}"
+        response = await self.client.send(self._request("GET", key, headers=headers), stream=True)
+        try:
+            if response.status_code == 404:
+                raise FileNotFoundError(key)
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(self.chunk_bytes):
+                yield chunk
+        finally:
+            await response.aclose()
+
+    async def delete(self, key: str) -> None:
+        response = await self.client.send(self._request("DELETE", key))
+        if response.status_code != 404:
+            response.raise_for_status()
+
+    async def list(self, prefix: str) -> List[ObjectInfo]:
+        objects = []
+        params = {"list-type": "2", "prefix": prefix, "max-keys": str(self.page_size)}
+        while True:
+            response = await self.client.send(self._request("GET", params=params))
+            response.raise_for_status()
+            root = ElementTree.fromstring(response.content)
+            for item in root.iter(f"{S3_NAMESPACE}Contents"):
+                objects.append(ObjectInfo(
+                    key=item.findtext(f"{S3_NAMESPACE}Key"),
+                    size=int(item.findtext(f"{S3_NAMESPACE}Size")),
+                    modified=datetime.fromisoformat(item.findtext(f"{S3_NAMESPACE}LastModified")).timestamp(),
+                ))
+            if root.findtext(f"{S3_NAMESPACE}IsTruncated") != "true":
+                return objects
+            params = {**params, "continuation-token": root.findtext(f"{S3_NAMESPACE}NextContinuationToken")}
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+def build_storage(kind: str = MEDIA_STORAGE) -> StorageBackend:
+    if kind == "s3":
+        return S3Storage()
+    return LocalStorage()
+
+
+media_storage = build_storage()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+from datetime import datetime, UTC, timedelta
+from typing import List
+
+from sqlalchemy import select, update, delete, func, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import Base, SessionLocal, engine
+from migrations import upgrade_schema
+from models.homework_submissions import HomeworkSubmission
+from storage.backends import media_storage
+from storage.models import MediaBlob
+from storage.service import MEDIA_BLOBS_FOLDER, COLLECTING_REF_COUNT
+from subjects.models import SubjectMaterial
+
+# Blobs released or written less than this long ago are kept, so in-flight uploads never lose their file.
+MEDIA_GC_GRACE_SECONDS = int(os.getenv("MEDIA_GC_GRACE_SECONDS", 3600))
+
+
+async def recount_references(db: AsyncSession) -> None:
+    references = union_all(
+        select(SubjectMaterial.file_path.label("path")),
+        select(HomeworkSubmission.file_path.label("path")),
+    ).subquery()
+    counted = select(func.count()).select_from(references).where(
+        references.c.path == MediaBlob.path
+    ).scalar_subquery()
+    # Parked rows belong to a running collection and stay parked.
+    await db.execute(update(MediaBlob).where(MediaBlob.ref_count != COLLECTING_REF_COUNT).values(ref_count=counted))
+    await db.commit()
+
+async def _orphans(known: set[str], cutoff: datetime) -> List[str]:
+    # Objects without a row: uploads that crashed before committing, or leftover ".part" files.
+    objects = await media_storage.list(f"{MEDIA_BLOBS_FOLDER}/")
+    return [
+        item.key for item in objects
+        if item.key not in known and datetime.fromtimestamp(item.modified, UTC).replace(tzinfo=None) < cutoff
+    ]
+
+async def collect_garbage(db: AsyncSession, grace_seconds: int = MEDIA_GC_GRACE_SECONDS) -> List[str]:
+    cutoff = datetime.now(UTC).replace(tzinfo=None) - timedelta(seconds=grace_seconds)
+
+    # Claim the rows before touching files: while a row is parked, uploads of the same content can neither
+    # reference it nor recreate it, so no file is deleted under a material. Rows left parked by a crashed run
+    # still match and are finished here.
+    result = await db.scalars(
+        update(MediaBlob)
+        .where(MediaBlob.ref_count <= 0, MediaBlob.updated_at < cutoff)
+        .values(ref_count=COLLECTING_REF_COUNT)
+        .returning(MediaBlob.path)
+    )
+    claimed = list(result.all())
+    await db.commit()
+
+    for path in claimed:
+        await media_storage.delete(path)
+    if claimed:
+        await db.execute(
+            delete(MediaBlob).where(MediaBlob.path.in_(claimed), MediaBlob.ref_count == COLLECTING_REF_COUNT)
+        )
+        await db.commit()
+
+    known = set((await db.scalars(select(MediaBlob.path))).all())
+    orphans = await _orphans(known, cutoff)
+    for path in orphans:
+        await media_storage.delete(path)
+    return claimed + orphans
+
+
+async def main() -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+    async with SessionLocal() as db:
+        await recount_references(db)
+        removed = await collect_garbage(db)
+    await engine.dispose()
+    await media_storage.close()
+    print(f"Removed {len(removed)} unreferenced media files")
+
+
+# Run periodically, e.g. from cron: python -m storage.gc
+if __name__ == "__main__":
+    asyncio.run(main())
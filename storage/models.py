@@ -0,0 +1,23 @@
+from datetime import datetime, UTC
+
+from sqlalchemy import String, Integer, DateTime, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from database import Base
+
+
+class MediaBlob(Base):
+    __tablename__ = "media_blobs"
+    __table_args__ = (
+        Index("ix_media_blobs_ref_count_updated_at", "ref_count", "updated_at"),
+    )
+
+    # The content hash plus the lower-cased upload extension, relative to MEDIA_PATH. Dedupe is per extension:
+    # the same bytes uploaded as .pdf and .bin are two blobs with their own reference counts.
+    path: Mapped[str] = mapped_column(String, primary_key=True)
+    sha256: Mapped[str] = mapped_column(String(64), index=True)
+    size: Mapped[int] = mapped_column(Integer)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(UTC).replace(tzinfo=None))
+    # Touched on every reference change; the collector leaves recently released blobs alone.
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=lambda: datetime.now(UTC).replace(tzinfo=None))
@@ -0,0 +1,58 @@
+from datetime import datetime, UTC
+
+from fastapi import UploadFile
+from sqlalchemy import update, insert
+from sqlalchemy.exc import IntegrityError
+from starlette import status
+from starlette.exceptions import HTTPException
+
+from dependency import db_dependency
+from storage.backends import media_storage
+from storage.models import MediaBlob
+from utils.media import SavedFile, save_file, MEDIA_MAX_UPLOAD_BYTES
+
+MEDIA_BLOBS_FOLDER = "blobs"
+# The collector parks a blob's row at this count while it deletes the file; no upload may reference it meanwhile.
+COLLECTING_REF_COUNT = -1
+
+
+async def _increment(db: db_dependency, path: str) -> bool:
+    result = await db.execute(
+        update(MediaBlob)
+        .where(MediaBlob.path == path, MediaBlob.ref_count > COLLECTING_REF_COUNT)
+        .values(ref_count=MediaBlob.ref_count + 1, updated_at=datetime.now(UTC).replace(tzinfo=None))
+    )
+    return result.rowcount > 0
+
+def _being_collected() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The file was being cleaned up, please upload it again"
+    )
+
+async def add_reference(db: db_dependency, saved: SavedFile) -> None:
+    if await _increment(db, saved.path):
+        return
+
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(MediaBlob).values(
+                path=saved.path,
+                sha256=saved.sha256,
+                size=saved.size,
+                ref_count=1,
+            ))
+    except IntegrityError:
+        # A concurrent upload of the same content created the row first, or the collector holds it.
+        if await _increment(db, saved.path):
+            return
+        raise _being_collected()
+
+    # The row was gone, so the collector may have just removed the file this upload was deduplicated against.
+    if await media_storage.head(saved.path) is None:
+        raise _being_collected()
+
+async def store_file(db: db_dependency, file: UploadFile, max_bytes: int = MEDIA_MAX_UPLOAD_BYTES) -> str:
+    saved = await save_file(file, MEDIA_BLOBS_FOLDER, max_bytes=max_bytes)
+    await add_reference(db, saved)
+    return saved.path
@@ -0,0 +1,247 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import AsyncIterator, BinaryIO, List
+
+from starlette import status
+from starlette.exceptions import HTTPException
+
+logger = logging.getLogger(__name__)
+
+# Must be shared between workers, since any of them may receive the next chunk.
+MEDIA_UPLOADS_PATH = os.getenv("MEDIA_UPLOADS_PATH", "./uploads")
+MEDIA_MAX_RESUMABLE_UPLOAD_BYTES = int(os.getenv("MEDIA_MAX_RESUMABLE_UPLOAD_BYTES", 2 * 1024 * 1024 * 1024))
+# Sessions without a chunk for this long are abandoned and removed.
+MEDIA_UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("MEDIA_UPLOAD_SESSION_TTL_SECONDS", 86400))
+MEDIA_UPLOAD_CLEANUP_INTERVAL_SECONDS = float(os.getenv("MEDIA_UPLOAD_CLEANUP_INTERVAL_SECONDS", 600))
+MEDIA_UPLOAD_WRITE_BYTES = int(os.getenv("MEDIA_UPLOAD_WRITE_BYTES", 1024 * 1024))
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+@dataclass(frozen=True)
+class UploadSession:
+    id: str
+    user_id: int
+    filename: str
+    length: int
+    metadata: dict
+    created_at: float
+
+
+def _paths(directory: str, upload_id: str) -> tuple[str, str]:
+    return os.path.join(directory, f"{upload_id}.json"), os.path.join(directory, f"{upload_id}.data")
+
+def _not_found(upload_id: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Upload {upload_id} not found"
+    )
+
+def _create(directory: str, session: UploadSession) -> None:
+    os.makedirs(directory, exist_ok=True)
+    info_path, data_path = _paths(directory, session.id)
+    open(data_path, "xb").close()
+    # The session only becomes visible once its description is complete.
+    with open(f"{info_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(asdict(session), f)
+    os.replace(f"{info_path}.tmp", info_path)
+
+async def create_session(
+        user_id: int,
+        filename: str,
+        length: int,
+        metadata: dict,
+        directory: str | None = None,
+        max_bytes: int = MEDIA_MAX_RESUMABLE_UPLOAD_BYTES,
+) -> UploadSession:
+    directory = directory or MEDIA_UPLOADS_PATH
+    if length > max_bytes:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"File is larger than {max_bytes} bytes"
+        )
+
+    session = UploadSession(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        filename=filename,
+        length=length,
+        metadata=metadata,
+        created_at=time.time(),
+    )
+    await asyncio.to_thread(_create, directory, session)
+    return session
+
+def _load(directory: str, upload_id: str) -> UploadSession | None:
+    try:
+        with open(_paths(directory, upload_id)[0], encoding="utf-8") as f:
+            return UploadSession(**json.load(f))
+    except FileNotFoundError:
+        return None
+
+async def get_session(user_id: int, upload_id: str, directory: str | None = None) -> UploadSession:
+    directory = directory or MEDIA_UPLOADS_PATH
+    session = await asyncio.to_thread(_load, directory, upload_id) if _UPLOAD_ID.match(upload_id) else None
+    # Someone else's upload is reported as missing rather than forbidden, so ids can't be probed.
+    if session is None or session.user_id != user_id:
+        raise _not_found(upload_id)
+    return session
+
+def _progress(directory: str, upload_id: str, ttl_seconds: int) -> tuple[int, float]:
+    try:
+        result = os.stat(_paths(directory, upload_id)[1])
+    except FileNotFoundError:
+        raise _not_found(upload_id)
+    return result.st_size, result.st_mtime + ttl_seconds
+
+async def session_progress(
+        session: UploadSession,
+        directory: str | None = None,
+        ttl_seconds: int = MEDIA_UPLOAD_SESSION_TTL_SECONDS,
+) -> tuple[int, float]:
+    # The data file is the only record of progress, so a chunk cut off midway still counts for what arrived.
+    # Its modification time is the last activity, which is what abandonment is measured from.
+    return await asyncio.to_thread(_progress, directory or MEDIA_UPLOADS_PATH, session.id, ttl_seconds)
+
+def _lock(directory: str, upload_id: str) -> BinaryIO:
+    try:
+        # Without O_CREAT, so a removed upload isn't silently started again.
+        file = os.fdopen(os.open(_paths(directory, upload_id)[1], os.O_WRONLY | os.O_APPEND), "ab")
+    except FileNotFoundError:
+        raise _not_found(upload_id)
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        file.close()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another chunk of this upload is being written"
+        )
+    return file
+
+def _write(file: BinaryIO, data: bytes) -> None:
+    file.write(data)
+    file.flush()
+
+def _unlock(file: BinaryIO) -> None:
+    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+    file.close()
+
+async def append_chunk(
+        session: UploadSession,
+        offset: int,
+        chunks: AsyncIterator[bytes],
+        directory: str | None = None,
+        write_bytes: int = MEDIA_UPLOAD_WRITE_BYTES,
+) -> int:
+    directory = directory or MEDIA_UPLOADS_PATH
+    # The lock is held across workers for the whole request, so two clients can't interleave their bytes.
+    file = await asyncio.to_thread(_lock, directory, session.id)
+    try:
+        current = await asyncio.to_thread(os.fstat, file.fileno())
+        if offset != current.st_size:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload is at offset {current.st_size}, not {offset}"
+            )
+
+        written = offset
+        buffer = bytearray()
+        try:
+            async for chunk in chunks:
+                if written + len(buffer) + len(chunk) > session.length:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+                        detail=f"Upload is longer than the declared {session.length} bytes"
+                    )
+                buffer.extend(chunk)
+                if len(buffer) >= write_bytes:
+                    await asyncio.to_thread(_write, file, bytes(buffer))
+                    written += len(buffer)
+                    buffer.clear()
+        finally:
+            # Whatever arrived before a disconnect is kept, so the client can resume from there.
+            if buffer:
+                await asyncio.to_thread(_write, file, bytes(buffer))
+                written += len(buffer)
+        return written
+    finally:
+        await asyncio.to_thread(_unlock, file)
+
+@asynccontextmanager
+async def completed_upload(session: UploadSession, directory: str | None = None) -> AsyncIterator[str]:
+    directory = directory or MEDIA_UPLOADS_PATH
+    # Holding the chunk lock means a second finalize of the same upload is refused, and afterwards finds it gone.
+    file = await asyncio.to_thread(_lock, directory, session.id)
+    try:
+        offset = (await asyncio.to_thread(os.fstat, file.fileno())).st_size
+        if offset != session.length:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"Upload has {offset} of {session.length} bytes"
+            )
+        yield _paths(directory, session.id)[1]
+    finally:
+        await asyncio.to_thread(_unlock, file)
+
+def _remove(directory: str, upload_id: str) -> None:
+    for path in _paths(directory, upload_id):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+async def remove_session(session: UploadSession, directory: str | None = None) -> None:
+    directory = directory or MEDIA_UPLOADS_PATH
+    await asyncio.to_thread(_remove, directory, session.id)
+
+def _abandoned(directory: str, ttl_seconds: int, now: float) -> List[str]:
+    if not os.path.isdir(directory):
+        return []
+
+    abandoned = []
+    for upload_id in sorted({name.split(".", 1)[0] for name in os.listdir(directory)}):
+        if not _UPLOAD_ID.match(upload_id):
+            continue
+        info_path, data_path = _paths(directory, upload_id)
+        paths = [info_path, f"{info_path}.tmp", data_path]
+        # Every chunk touches the data file, so the newest file of a session is its last activity.
+        modified = [os.path.getmtime(path) for path in paths if os.path.exists(path)]
+        if modified and max(modified) < now - ttl_seconds:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            abandoned.append(upload_id)
+    return abandoned
+
+async def cleanup_sessions(
+        directory: str | None = None,
+        ttl_seconds: int = MEDIA_UPLOAD_SESSION_TTL_SECONDS,
+        now: float | None = None,
+) -> List[str]:
+    directory = directory or MEDIA_UPLOADS_PATH
+    return await asyncio.to_thread(_abandoned, directory, ttl_seconds, time.time() if now is None else now)
+
+async def run_upload_cleanup(stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        try:
+            removed = await cleanup_sessions()
+            if removed:
+                logger.info("Removed %s abandoned uploads", len(removed))
+        except Exception as e:
+            logger.exception("Upload cleanup failed: %s", e)
+
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=MEDIA_UPLOAD_CLEANUP_INTERVAL_SECONDS)
+        except asyncio.TimeoutError:
+            pass
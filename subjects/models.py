@@ -37,10 +37,11 @@ class Subject(Base):
     name: Mapped[str] = mapped_column(String)
     teacher_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     teacher: Mapped[User] = relationship(User)
+    # Rosters can be large, so every call site picks its own loader option or queries the IDs directly.
     students: Mapped[List[Student]] = relationship(
         Student,
         secondary=subject_students,
-        lazy="selectin"
+        lazy="raise"
     )
     materials: Mapped[List["SubjectMaterial"]] = relationship(
         "SubjectMaterial",
@@ -49,14 +50,6 @@ class Subject(Base):
     )
     archived: Mapped[bool] = mapped_column(Boolean, default=False)
 
-    @property
-    def students_ids(self) -> list[int]:
-        return [s.id for s in self.students]
-
-    @property
-    def materials_ids(self) -> list[int]:
-        return [m.id for m in self.materials]
-
     @validates("teacher")
     def validate_teacher(self, key, user):
         if user.role not in (Role.TEACHER, Role.PRINCIPAL):
@@ -2,7 +2,7 @@ from datetime import datetime
 
 from typing import List
 
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CreateSubjectRequest(BaseModel):
@@ -36,6 +36,7 @@ class SubjectMaterialResponse(BaseModel):
     id: int
     title: str
     file_path: str
+    url: str
     uploaded_at: datetime
     subject_id: int
 
@@ -43,3 +44,17 @@ class SubjectMaterialResponse(BaseModel):
 
 class CreateSubjectMaterialRequest(BaseModel):
     title: str
+
+class CreateMaterialUploadRequest(BaseModel):
+    title: str
+    filename: str
+    length: int = Field(gt=0)
+
+class MaterialUploadResponse(BaseModel):
+    id: str
+    subject_id: int
+    title: str
+    filename: str
+    length: int
+    offset: int
+    expires_at: datetime
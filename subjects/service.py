@@ -1,43 +1,102 @@
+import asyncio
+import logging
 import os
 import uuid
-from typing import Sequence, List
+from datetime import datetime, UTC
+from functools import partial
+from typing import AsyncIterator, Sequence, List
 
 from fastapi import UploadFile
 from fastapi_mail import MessageSchema, MessageType
 from pydantic import NameEmail
-from sqlalchemy import select
+from sqlalchemy import select, literal
+from sqlalchemy.orm import joinedload
 from starlette import status
 from starlette.exceptions import HTTPException
 
+from auth.authorization import can_access_subject
+from auth.identity import Identity
 from auth.models import User, Role, Student
-from dependency import db_dependency
-from fastmail_conf import fm
-from subjects.models import Subject, SubjectMaterial
+from dependency import db_dependency, read_db_dependency
+from outbox.service import enqueue_email
+from storage.backends import media_storage
+from storage.service import store_file
+from storage.signing import sign_media_url
+from storage.uploads import UploadSession, MEDIA_MAX_RESUMABLE_UPLOAD_BYTES, create_session, get_session, \
+    session_progress, append_chunk, completed_upload, remove_session
+from subjects.models import Subject, SubjectMaterial, subject_students
 from subjects.schemas import CreateSubjectRequest, AddStudentsRequest, RemoveStudentsRequest, StatusRequest, \
-    TeacherRequest, CreateSubjectMaterialRequest
-from utils.media import save_file
+    TeacherRequest, CreateSubjectMaterialRequest, SubjectResponse, SubjectMaterialResponse, \
+    CreateMaterialUploadRequest, MaterialUploadResponse
+from utils.links import add_links, remove_links
+from utils.zipstream import ZipMember, stream_zip
+
+logger = logging.getLogger(__name__)
 
 UPLOAD_DIR = os.getenv("MEDIA_PATH", "./media")
-MATERIALS_FOLDER = "materials"
 
+# Formats that are compressed already; they go into material archives as they are.
+ARCHIVE_STORED_EXTENSIONS = {
+    ".7z", ".aac", ".avi", ".bz2", ".docx", ".gif", ".gz", ".jpeg", ".jpg", ".m4a", ".mkv", ".mov", ".mp3",
+    ".mp4", ".odp", ".ods", ".odt", ".ogg", ".pdf", ".png", ".pptx", ".rar", ".webm", ".webp", ".xlsx", ".xz",
+    ".zip",
+}
+
+# The teacher is needed for notification emails; rosters are changed with set-based statements.
+SUBJECT_OPTIONS = [joinedload(Subject.teacher)]
+
+SUBJECT_ACCESS_DENIED = {
+    Role.TEACHER: "You are not the teacher of this subject",
+    Role.STUDENT: "You are not assigned to this subject",
+    Role.PARENT: "You don't have a child assigned to this subject",
+}
+
+
+async def build_subject_response(subject: Subject, db: db_dependency) -> SubjectResponse:
+    students_ids = await db.scalars(
+        select(subject_students.c.user_id).where(subject_students.c.subject_id == subject.id)
+    )
+    materials_ids = await db.scalars(
+        select(SubjectMaterial.id).where(SubjectMaterial.subject_id == subject.id)
+    )
+    return SubjectResponse(
+        id=subject.id,
+        name=subject.name,
+        teacher_id=subject.teacher_id,
+        students_ids=list(students_ids.all()),
+        materials_ids=list(materials_ids.all()),
+        archived=subject.archived
+    )
+
+def build_material_response(user: Identity, material: SubjectMaterial) -> SubjectMaterialResponse:
+    # Access was checked while loading the material, so the link itself carries the grant.
+    return SubjectMaterialResponse(
+        id=material.id,
+        title=material.title,
+        file_path=material.file_path,
+        url=sign_media_url(material.file_path, user.id),
+        uploaded_at=material.uploaded_at,
+        subject_id=material.subject_id
+    )
 
-async def create_subject(user: User, request: CreateSubjectRequest, db: db_dependency) -> Subject:
+async def create_subject(user: Identity, request: CreateSubjectRequest, db: db_dependency) -> Subject:
     if user.role == Role.TEACHER and user.id != request.teacher_id:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="A teacher can't create subjects for other teachers"
         )
 
-    if (db.query(Subject).filter(
-            Subject.name == request.name,
-            Subject.teacher_id == request.teacher_id,
-            Subject.archived.is_(False)).first()):
+    statement = select(Subject).where(
+        Subject.name == request.name,
+        Subject.teacher_id == request.teacher_id,
+        Subject.archived.is_(False))
+    if (await db.scalars(statement)).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Duplication of subject"
         )
 
-    teacher: User | None = db.get(User, request.teacher_id)
+    teacher: User | None = await db.get(User, request.teacher_id)
     if teacher is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -51,17 +110,16 @@ async def create_subject(user: User, request: CreateSubjectRequest, db: db_depen
         )
 
     statement = select(Student).where(Student.id.in_(request.students_ids))
-    students: Sequence[Student] = db.scalars(statement).all()
+    students: Sequence[Student] = (await db.scalars(statement)).all()
 
     subject: Subject = Subject(
         name=request.name,
         teacher_id=request.teacher_id,
-        students=list(students)
+        students=list(students),
+        materials=[]
     )
 
     db.add(subject)
-    db.commit()
-    db.refresh(subject)
 
     teacher_message = MessageSchema(
         subject="Assigned subject",
@@ -69,7 +127,7 @@ async def create_subject(user: User, request: CreateSubjectRequest, db: db_depen
         body=f"You have been assigned subject teacher to {request.name}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(teacher_message)
+    enqueue_email(db, teacher_message)
 
     students_message = MessageSchema(
         subject="Added to subject",
@@ -77,12 +135,20 @@ async def create_subject(user: User, request: CreateSubjectRequest, db: db_depen
         body=f"You have been added to subject {request.name} with teacher {teacher.full_name}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(students_message)
+    enqueue_email(db, students_message)
+
+    await db.commit()
 
     return subject
 
-async def add_students(user: User, request: AddStudentsRequest, subject_id: int, db: db_dependency) -> Subject:
-    subject: Subject | None = db.get(Subject, subject_id)
+async def get_emails(db: db_dependency, users_ids: List[int]) -> List[NameEmail]:
+    if not users_ids:
+        return []
+    statement = select(User.email).where(User.id.in_(users_ids))
+    return [NameEmail(name="", email=email) for email in (await db.scalars(statement)).all()]
+
+async def add_students(user: Identity, request: AddStudentsRequest, subject_id: int, db: db_dependency) -> Subject:
+    subject: Subject | None = await db.get(Subject, subject_id, options=SUBJECT_OPTIONS)
     if subject is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -95,28 +161,25 @@ async def add_students(user: User, request: AddStudentsRequest, subject_id: int,
             detail="A teacher can't update subjects for other teachers"
         )
 
-    statement = select(Student).where(Student.id.in_(request.students_ids))
-    students: Sequence[Student] = db.scalars(statement).all()
-    added_students = []
-    for student in students:
-        if student not in subject.students:
-            subject.students.append(student)
-            added_students.append(student)
-
-    db.commit()
+    candidates = select(literal(subject.id).label("subject_id"), Student.id.label("user_id")).where(
+        Student.id.in_(request.students_ids)
+    )
+    added_ids = [student_id for _, student_id in await add_links(db, subject_students, candidates)]
 
     message = MessageSchema(
         subject="Added to subject",
-        recipients=[NameEmail(name="", email=s.email) for s in added_students],
+        recipients=await get_emails(db, added_ids),
         body=f"You have been added to subject {subject.name} with teacher {subject.teacher.full_name}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
+
+    await db.commit()
 
     return subject
 
-async def remove_students(user: User, request: RemoveStudentsRequest, subject_id: int, db: db_dependency) -> Subject:
-    subject: Subject | None = db.get(Subject, subject_id)
+async def remove_students(user: Identity, request: RemoveStudentsRequest, subject_id: int, db: db_dependency) -> Subject:
+    subject: Subject | None = await db.get(Subject, subject_id, options=SUBJECT_OPTIONS)
     if subject is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -129,28 +192,22 @@ async def remove_students(user: User, request: RemoveStudentsRequest, subject_id
             detail="A teacher can't update subjects for other teachers"
         )
 
-    statement = select(Student).where(Student.id.in_(request.students_ids))
-    students: Sequence[Student] = db.scalars(statement).all()
-    removed_students = []
-    for student in students:
-        if student in subject.students:
-            subject.students.remove(student)
-            removed_students.append(student)
-
-    db.commit()
+    removed_ids = await remove_links(db, subject_students, subject.id, request.students_ids)
 
     message = MessageSchema(
         subject="Removed from subject",
-        recipients=[NameEmail(name="", email=s.email) for s in removed_students],
+        recipients=await get_emails(db, removed_ids),
         body=f"You have been removed from subject {subject.name} with teacher {subject.teacher.full_name}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
+
+    await db.commit()
 
     return subject
 
-async def change_status(user: User, subject_id: int, request: StatusRequest, db: db_dependency) -> Subject:
-    subject: Subject | None = db.get(Subject, subject_id)
+async def change_status(user: Identity, subject_id: int, request: StatusRequest, db: db_dependency) -> Subject:
+    subject: Subject | None = await db.get(Subject, subject_id, options=SUBJECT_OPTIONS)
     if subject is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -164,18 +221,18 @@ async def change_status(user: User, subject_id: int, request: StatusRequest, db:
         )
 
     if not request.status and subject.archived:
-        if db.query(Subject).filter(
-                Subject.name == subject.name,
-                Subject.teacher_id == subject.teacher_id,
-                Subject.archived.is_(False)
-        ).first():
+        statement = select(Subject).where(
+            Subject.name == subject.name,
+            Subject.teacher_id == subject.teacher_id,
+            Subject.archived.is_(False)
+        )
+        if (await db.scalars(statement)).first():
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Unarchiving this subject will result in subject duplication. Archive the active subject first."
             )
 
     subject.archived = request.status
-    db.commit()
 
     message = MessageSchema(
         subject="Archived subject",
@@ -183,20 +240,22 @@ async def change_status(user: User, subject_id: int, request: StatusRequest, db:
         body=f"Subject {subject.name} has been {"archived" if request.status else "unarchived"}",
         subtype=MessageType(value="html")
     )
-    await fm.send_message(message)
+    enqueue_email(db, message)
+
+    await db.commit()
 
     return subject
 
 
 async def change_teacher(request: TeacherRequest, subject_id: int, db: db_dependency) -> Subject:
-    subject: Subject | None = db.get(Subject, subject_id)
+    subject: Subject | None = await db.get(Subject, subject_id, options=SUBJECT_OPTIONS)
     if subject is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Subject with ID {subject_id} was not found"
         )
 
-    new_teacher: User | None = db.get(User, request.teacher_id)
+    new_teacher: User | None = await db.get(User, request.teacher_id)
     if new_teacher is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -208,11 +267,12 @@ async def change_teacher(request: TeacherRequest, subject_id: int, db: db_depend
             detail=f"Provided user can't be a teacher"
         )
 
-    if db.query(Subject).filter(
-            Subject.name == subject.name,
-            Subject.teacher_id == new_teacher.id,
-            Subject.archived.is_(False)
-    ).first():
+    statement = select(Subject).where(
+        Subject.name == subject.name,
+        Subject.teacher_id == new_teacher.id,
+        Subject.archived.is_(False)
+    )
+    if (await db.scalars(statement)).first():
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="This user already is assigned to an active subject with the same name"
@@ -222,7 +282,6 @@ async def change_teacher(request: TeacherRequest, subject_id: int, db: db_depend
     new_teacher_email = NameEmail(name="", email=new_teacher.email)
 
     subject.teacher_id = new_teacher.id
-    db.commit()
 
     old_teacher_message = MessageSchema(
         subject="Removed from subject",
@@ -237,12 +296,15 @@ async def change_teacher(request: TeacherRequest, subject_id: int, db: db_depend
         subtype=MessageType(value="html")
     )
 
-    await fm.send_message([old_teacher_message, new_teacher_message])
+    enqueue_email(db, old_teacher_message)
+    enqueue_email(db, new_teacher_message)
+
+    await db.commit()
 
     return subject
 
-async def create_subject_material(user: User, request: CreateSubjectMaterialRequest, file: UploadFile, subject_id: int, db: db_dependency) -> SubjectMaterial:
-    subject: Subject | None = db.get(Subject, subject_id)
+async def get_material_subject(user: Identity, subject_id: int, db: db_dependency) -> Subject:
+    subject: Subject | None = await db.get(Subject, subject_id)
     if not subject:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -255,84 +317,168 @@ async def create_subject_material(user: User, request: CreateSubjectMaterialRequ
             detail="You are not the teacher of this subject"
         )
 
-    file_path = await save_file(file, MATERIALS_FOLDER)
+    return subject
 
+async def add_subject_material(subject: Subject, title: str, file_path: str, db: db_dependency) -> SubjectMaterial:
     material = SubjectMaterial(
-        title=request.title,
+        title=title,
         file_path=file_path,
-        subject_id=subject_id
+        subject_id=subject.id
     )
 
     db.add(material)
-    db.commit()
-    db.refresh(material)
 
-    students_emails = [NameEmail(name="", email=s.email) for s in subject.students]
+    statement = select(Student.email).join(subject_students, subject_students.c.user_id == Student.id).where(
+        subject_students.c.subject_id == subject.id
+    )
+    students_emails = [NameEmail(name="", email=email) for email in (await db.scalars(statement)).all()]
     message = MessageSchema(
         subject="New material",
         recipients=students_emails,
-        body=f"New material '{request.title}' has been added to {subject.name}.",
+        body=f"New material '{title}' has been added to {subject.name}.",
         subtype=MessageType(value="html")
     )
+    enqueue_email(db, message)
+
+    await db.commit()
+    await db.refresh(material)
+
+    return material
+
+async def create_subject_material(user: Identity, request: CreateSubjectMaterialRequest, file: UploadFile, subject_id: int, db: db_dependency) -> SubjectMaterial:
+    subject = await get_material_subject(user, subject_id, db)
+    file_path = await store_file(db, file)
+    return await add_subject_material(subject, request.title, file_path, db)
+
+async def build_upload_response(session: UploadSession) -> MaterialUploadResponse:
+    offset, expires_at = await session_progress(session)
+    return MaterialUploadResponse(
+        id=session.id,
+        subject_id=session.metadata["subject_id"],
+        title=session.metadata["title"],
+        filename=session.filename,
+        length=session.length,
+        offset=offset,
+        expires_at=datetime.fromtimestamp(expires_at, UTC).replace(tzinfo=None)
+    )
+
+async def create_material_upload(user: Identity, request: CreateMaterialUploadRequest, subject_id: int, db: db_dependency) -> UploadSession:
+    subject = await get_material_subject(user, subject_id, db)
+    return await create_session(user.id, request.filename, request.length, {"subject_id": subject.id, "title": request.title})
+
+async def get_material_upload(user: Identity, subject_id: int, upload_id: str) -> UploadSession:
+    # Chunks don't touch the database: the subject was authorized when the upload was created.
+    session = await get_session(user.id, upload_id)
+    if session.metadata.get("subject_id") != subject_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Upload {upload_id} not found"
+        )
+    return session
+
+async def upload_material_chunk(user: Identity, subject_id: int, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+    session = await get_material_upload(user, subject_id, upload_id)
+    await append_chunk(session, offset, chunks)
+    return session
 
-    await fm.send_message(message)
+async def complete_material_upload(user: Identity, subject_id: int, upload_id: str, db: db_dependency) -> SubjectMaterial:
+    session = await get_material_upload(user, subject_id, upload_id)
+    subject = await get_material_subject(user, subject_id, db)
+
+    async with completed_upload(session) as path:
+        file = UploadFile(file=await asyncio.to_thread(open, path, "rb"), filename=session.filename, size=session.length)
+        file_path = await store_file(db, file, max_bytes=MEDIA_MAX_RESUMABLE_UPLOAD_BYTES)
+        material = await add_subject_material(subject, session.metadata["title"], file_path, db)
+        await remove_session(session)
 
     return material
 
-def get_authorized_subject(
-        user: User,
+async def cancel_material_upload(user: Identity, subject_id: int, upload_id: str) -> None:
+    session = await get_material_upload(user, subject_id, upload_id)
+    await remove_session(session)
+
+async def get_authorized_subject(
+        user: Identity,
         subject_id: int,
-        db: db_dependency,
+        db: read_db_dependency,
 ) -> Subject:
-    subject: Subject | None = db.get(Subject, subject_id)
+    subject: Subject | None = await db.get(Subject, subject_id)
     if not subject:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Subject with ID {subject_id} not found",
         )
 
-    match user.role:
-        case Role.TEACHER:
-            if subject.teacher_id != user.id:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="You are not the teacher of this subject",
-                )
-
-        case Role.STUDENT:
-            if user.id not in {s.id for s in subject.students}:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="You are not assigned to this subject",
-                )
-
-        case Role.PARENT:
-            allowed_parent_ids = {
-                p.id for s in subject.students for p in s.parents
-            }
-            if user.id not in allowed_parent_ids:
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail="You don't have a child assigned to this subject",
-                )
+    if not await can_access_subject(db, user, subject.id, subject.teacher_id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail=SUBJECT_ACCESS_DENIED[user.role],
+        )
 
     return subject
 
-def get_materials(user: User, subject_id, db: db_dependency) -> List[SubjectMaterial]:
-    subject: Subject = get_authorized_subject(user, subject_id, db)
+async def get_materials(user: Identity, subject_id, db: read_db_dependency) -> List[SubjectMaterial]:
+    subject: Subject = await get_authorized_subject(user, subject_id, db)
     statement = select(SubjectMaterial).where(
         SubjectMaterial.subject_id == subject.id
     )
-    return list(db.scalars(statement).all())
+    return list((await db.scalars(statement)).all())
 
-def get_material(user: User, subject_id: int, material_id: int, db: db_dependency) -> SubjectMaterial:
-    subject: Subject = get_authorized_subject(user, subject_id, db)
+async def get_material(user: Identity, subject_id: int, material_id: int, db: read_db_dependency) -> SubjectMaterial:
+    subject: Subject = await get_authorized_subject(user, subject_id, db)
 
-    for material in subject.materials:
-        if material_id == material.id:
-            return material
+    statement = select(SubjectMaterial).where(
+        SubjectMaterial.subject_id == subject.id,
+        SubjectMaterial.id == material_id
+    )
+    material: SubjectMaterial | None = (await db.scalars(statement)).first()
+    if material is not None:
+        return material
 
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail=f"Material with ID {material_id} not found"
-    )
\ No newline at end of file
+    )
+
+async def get_materials_archive(user: Identity, subject_id: int, db: read_db_dependency) -> tuple[Subject, List[SubjectMaterial]]:
+    subject: Subject = await get_authorized_subject(user, subject_id, db)
+    statement = select(SubjectMaterial).where(
+        SubjectMaterial.subject_id == subject.id
+    ).order_by(SubjectMaterial.uploaded_at, SubjectMaterial.id)
+    return subject, list((await db.scalars(statement)).all())
+
+def archive_names(materials: Sequence[SubjectMaterial]) -> List[str]:
+    names = []
+    taken = set()
+    for material in materials:
+        extension = os.path.splitext(material.file_path)[1].lower()
+        stem = material.title.replace("/", "_").replace("\\", "_").strip() or f"material-{material.id}"
+        if stem.lower().endswith(extension):
+            stem = stem[:len(stem) - len(extension)]
+        name = f"{stem}{extension}"
+        copy = 2
+        while name.lower() in taken:
+            name = f"{stem} ({copy}){extension}"
+            copy += 1
+        taken.add(name.lower())
+        names.append(name)
+    return names
+
+async def _archive_members(materials: Sequence[SubjectMaterial]) -> AsyncIterator[ZipMember]:
+    for material, name in zip(materials, archive_names(materials)):
+        info = await media_storage.head(material.file_path)
+        if info is None:
+            # The response has already started, so a missing file can only be left out.
+            logger.warning("Material %s is missing its file %s", material.id, material.file_path)
+            continue
+        yield ZipMember(
+            name=name,
+            modified=material.uploaded_at,
+            size=info.size,
+            chunks=partial(media_storage.stream, material.file_path),
+            compress=os.path.splitext(name)[1] not in ARCHIVE_STORED_EXTENSIONS,
+        )
+
+def stream_materials_archive(materials: Sequence[SubjectMaterial]) -> AsyncIterator[bytes]:
+    # Files are read from storage chunk by chunk as the client downloads, with no temporary archive.
+    return stream_zip(_archive_members(materials))
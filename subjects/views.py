@@ -1,25 +1,32 @@
 from typing import Annotated, List
+from urllib.parse import quote
 
-from fastapi import APIRouter, Depends, UploadFile, BackgroundTasks
+from fastapi import APIRouter, Depends, UploadFile, BackgroundTasks, Form, Header, Request, Response
+from fastapi.responses import StreamingResponse
 from starlette import status
 
+from audit.models import AuditAction, AuditEntity
 from audit.service import log
 from auth.RoleChecker import RoleChecker
-from auth.models import User, Role
-from dependency import db_dependency
+from auth.identity import Identity
+from auth.models import Role
+from dependency import db_dependency, read_db_dependency
 from subjects.schemas import CreateSubjectRequest, SubjectResponse, AddStudentsRequest, RemoveStudentsRequest, \
-    StatusRequest, TeacherRequest, SubjectMaterialResponse, CreateSubjectMaterialRequest
+    StatusRequest, TeacherRequest, SubjectMaterialResponse, CreateSubjectMaterialRequest, CreateMaterialUploadRequest, \
+    MaterialUploadResponse
 from subjects.service import create_subject, add_students, remove_students, change_status, change_teacher, \
-    create_subject_material, get_materials, get_material
+    create_subject_material, get_materials, get_material, build_subject_response, build_material_response, \
+    build_upload_response, create_material_upload, get_material_upload, upload_material_chunk, \
+    complete_material_upload, cancel_material_upload, get_materials_archive, stream_materials_archive
 
 router = APIRouter(prefix="/subjects", tags=["subjects"])
 
 user_dependency = Annotated[
-    User,
+    Identity,
     Depends(RoleChecker(list(Role)))]
 
 teacher_or_principal_or_admin_dependency = Annotated[
-    User,
+    Identity,
     Depends(RoleChecker(
         [
             Role.TEACHER,
@@ -28,7 +35,7 @@ teacher_or_principal_or_admin_dependency = Annotated[
         ]))]
 
 principal_or_admin_dependency = Annotated[
-    User,
+    Identity,
     Depends(RoleChecker(
         [
             Role.PRINCIPAL,
@@ -38,45 +45,90 @@ principal_or_admin_dependency = Annotated[
 @router.post("/", response_model=SubjectResponse, status_code=status.HTTP_201_CREATED)
 async def create(user: teacher_or_principal_or_admin_dependency, request: CreateSubjectRequest, db: db_dependency, tasks: BackgroundTasks):
     subject = await create_subject(user, request, db)
-    log(tasks, user.id, f"Created subject {request.name}")
-    return subject
+    log(tasks, user.id, AuditAction.SUBJECT_CREATED, AuditEntity.SUBJECT, subject.id,
+        {"name": request.name, "teacher_id": request.teacher_id, "students_ids": request.students_ids})
+    return await build_subject_response(subject, db)
 
 @router.post("/{subject_id}/add-students", status_code=status.HTTP_200_OK, response_model=SubjectResponse)
 async def add(user: teacher_or_principal_or_admin_dependency, subject_id: int, request: AddStudentsRequest, db: db_dependency, tasks: BackgroundTasks):
     subject = await add_students(user, request, subject_id, db)
-    log(tasks, user_id=user.id, action=f"Added students: {request.students_ids} to subject {subject_id}")
-    return subject
+    log(tasks, user.id, AuditAction.SUBJECT_STUDENTS_ADDED, AuditEntity.SUBJECT, subject_id,
+        {"students_ids": request.students_ids})
+    return await build_subject_response(subject, db)
 
 @router.post("/{subject_id}/remove-students", status_code=status.HTTP_200_OK, response_model=SubjectResponse)
 async def remove(user: teacher_or_principal_or_admin_dependency, subject_id: int, request: RemoveStudentsRequest, db: db_dependency, tasks: BackgroundTasks):
     subject = await remove_students(user, request, subject_id, db)
-    log(tasks, user_id=user.id, action=f"Removed students: {request.students_ids} from subject {subject_id}")
-    return subject
+    log(tasks, user.id, AuditAction.SUBJECT_STUDENTS_REMOVED, AuditEntity.SUBJECT, subject_id,
+        {"students_ids": request.students_ids})
+    return await build_subject_response(subject, db)
 
 @router.post("/{subject_id}/status", status_code=status.HTTP_200_OK, response_model=SubjectResponse)
 async def update_status(user: teacher_or_principal_or_admin_dependency, subject_id: int, request: StatusRequest, db: db_dependency, tasks: BackgroundTasks):
     subject = await change_status(user, subject_id, request, db)
-    log(tasks, user_id=user.id, action=f"Changed the status of subject {subject_id} to {request.status}")
-    return subject
+    log(tasks, user.id, AuditAction.SUBJECT_STATUS_CHANGED, AuditEntity.SUBJECT, subject_id,
+        {"archived": request.status})
+    return await build_subject_response(subject, db)
 
 @router.post("/{subject_id}/change-teacher", status_code=status.HTTP_200_OK, response_model=SubjectResponse)
 async def update_teacher(user: principal_or_admin_dependency, subject_id: int, request: TeacherRequest, db: db_dependency, tasks: BackgroundTasks):
     subject = await change_teacher(request, subject_id, db)
-    log(tasks, user_id=user.id, action=f"Changed the teacher of subject {subject_id} to {subject.teacher_id}")
-    return subject
+    log(tasks, user.id, AuditAction.SUBJECT_TEACHER_CHANGED, AuditEntity.SUBJECT, subject_id,
+        {"teacher_id": subject.teacher_id})
+    return await build_subject_response(subject, db)
 
 
 @router.post("/{subject_id}/materials", status_code=status.HTTP_201_CREATED, response_model=SubjectMaterialResponse)
-async def create_material(user: teacher_or_principal_or_admin_dependency, subject_id: int, request: CreateSubjectMaterialRequest, file: UploadFile, db: db_dependency, tasks: BackgroundTasks):
+async def create_material(user: teacher_or_principal_or_admin_dependency, subject_id: int, title: Annotated[str, Form()], file: UploadFile, db: db_dependency, tasks: BackgroundTasks):
+    # Multipart bodies can't carry a JSON model, so the request is built from the form field.
+    request = CreateSubjectMaterialRequest(title=title)
     material = await create_subject_material(user, request, file, subject_id, db)
-    log(tasks, user_id=user.id, action=f"Added material {material.id} to subject {subject_id}")
-    return material
+    log(tasks, user.id, AuditAction.SUBJECT_MATERIAL_ADDED, AuditEntity.SUBJECT, subject_id,
+        {"material_id": material.id, "title": material.title})
+    return build_material_response(user, material)
+
+# Resumable uploads: create a session, PATCH the bytes from the current offset (again after a dropped
+# connection), then complete it into a material.
+@router.post("/{subject_id}/materials/uploads", status_code=status.HTTP_201_CREATED, response_model=MaterialUploadResponse)
+async def create_upload(user: teacher_or_principal_or_admin_dependency, subject_id: int, request: CreateMaterialUploadRequest, response: Response, db: db_dependency):
+    session = await create_material_upload(user, request, subject_id, db)
+    response.headers["location"] = f"/subjects/{subject_id}/materials/uploads/{session.id}"
+    return await build_upload_response(session)
+
+@router.get("/{subject_id}/materials/uploads/{upload_id}", status_code=status.HTTP_200_OK, response_model=MaterialUploadResponse)
+async def upload_status(user: teacher_or_principal_or_admin_dependency, subject_id: int, upload_id: str):
+    return await build_upload_response(await get_material_upload(user, subject_id, upload_id))
+
+@router.patch("/{subject_id}/materials/uploads/{upload_id}", status_code=status.HTTP_200_OK, response_model=MaterialUploadResponse)
+async def upload_chunk(user: teacher_or_principal_or_admin_dependency, subject_id: int, upload_id: str, upload_offset: Annotated[int, Header()], request: Request):
+    session = await upload_material_chunk(user, subject_id, upload_id, upload_offset, request.stream())
+    return await build_upload_response(session)
+
+@router.post("/{subject_id}/materials/uploads/{upload_id}/complete", status_code=status.HTTP_201_CREATED, response_model=SubjectMaterialResponse)
+async def complete_upload(user: teacher_or_principal_or_admin_dependency, subject_id: int, upload_id: str, db: db_dependency, tasks: BackgroundTasks):
+    material = await complete_material_upload(user, subject_id, upload_id, db)
+    log(tasks, user.id, AuditAction.SUBJECT_MATERIAL_ADDED, AuditEntity.SUBJECT, subject_id,
+        {"material_id": material.id, "title": material.title})
+    return build_material_response(user, material)
+
+@router.delete("/{subject_id}/materials/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def cancel_upload(user: teacher_or_principal_or_admin_dependency, subject_id: int, upload_id: str):
+    await cancel_material_upload(user, subject_id, upload_id)
 
 
 @router.get("/{subject_id}/materials", status_code=status.HTTP_200_OK, response_model=List[SubjectMaterialResponse])
-async def materials(user: user_dependency, subject_id: int, db: db_dependency):
-    return get_materials(user, subject_id, db)
+async def materials(user: user_dependency, subject_id: int, db: read_db_dependency):
+    return [build_material_response(user, material) for material in await get_materials(user, subject_id, db)]
+
+@router.get("/{subject_id}/materials/archive", status_code=status.HTTP_200_OK, response_class=StreamingResponse)
+async def materials_archive(user: user_dependency, subject_id: int, db: read_db_dependency):
+    subject, materials = await get_materials_archive(user, subject_id, db)
+    return StreamingResponse(
+        stream_materials_archive(materials),
+        media_type="application/zip",
+        headers={"content-disposition": f"attachment; filename*=UTF-8''{quote(subject.name)}.zip"}
+    )
 
 @router.get("/{subject_id}/materials/{material_id}", status_code=status.HTTP_200_OK, response_model=SubjectMaterialResponse)
-async def material(user: user_dependency, subject_id: int, material_id: int, db: db_dependency):
-    return get_material(user, subject_id, material_id, db)
\ No newline at end of file
+async def material(user: user_dependency, subject_id: int, material_id: int, db: read_db_dependency):
+    return build_material_response(user, await get_material(user, subject_id, material_id, db))
\ No newline at end of file
@@ -0,0 +1,95 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from audit.archive import archive_audit_logs, load_segments, read_segment, write_segment, _lock, _unlock
+from audit.models import AuditLog, AuditAction, AuditEntity
+from audit.schemas import AuditQuery
+from audit.service import get_audit_logs
+from auth.models import User, Role
+
+NOW = datetime.now()
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_db):
+    sqlite_db.add(User(id=1, email="admin@school.com", hashed_password="x", full_name="Admin",
+                       role=Role.ADMIN, date_of_birth=datetime(1980, 1, 1)))
+    await sqlite_db.commit()
+    # Five entries from last year and two recent ones; ids follow time.
+    await sqlite_db.execute(insert(AuditLog), [
+        {"user_id": 1, "action": AuditAction.SUBJECT_STUDENTS_ADDED.value, "entity_type": AuditEntity.SUBJECT.value,
+         "entity_id": 40 + i % 2, "payload": {"students_ids": [i]}, "timestamp": NOW - timedelta(days=400 - i)}
+        for i in range(5)
+    ] + [
+        {"user_id": 1, "action": AuditAction.SUBJECT_CREATED.value, "entity_type": AuditEntity.SUBJECT.value,
+         "entity_id": 40 + i % 2, "timestamp": NOW - timedelta(days=1 - i)}
+        for i in range(2)
+    ])
+    await sqlite_db.commit()
+    return async_sessionmaker(bind=sqlite_db.bind, expire_on_commit=False)
+
+@pytest.mark.asyncio
+async def test_archive_moves_old_rows_into_segments(session_factory, sqlite_db, tmp_path):
+    archived = await archive_audit_logs(session_factory, retention_days=30, directory=str(tmp_path), batch_size=2)
+
+    assert archived == 5
+    assert sorted((await sqlite_db.scalars(select(AuditLog.id))).all()) == [6, 7]
+    segments = load_segments(str(tmp_path))
+    assert [(s.min_id, s.max_id, s.rows) for s in segments] == [(1, 2, 2), (3, 4, 2), (5, 5, 1)]
+    assert segments[0].min_timestamp == NOW - timedelta(days=400)
+    rows = read_segment(str(tmp_path), segments[1])
+    assert [row["payload"] for row in rows] == [{"students_ids": [2]}, {"students_ids": [3]}]
+
+@pytest.mark.asyncio
+async def test_rewritten_segment_is_indexed_once(session_factory, sqlite_db, tmp_path):
+    rows = [dict(row) for row in (await sqlite_db.execute(select(*AuditLog.__table__.c).limit(2))).mappings()]
+
+    write_segment(str(tmp_path), rows)
+    write_segment(str(tmp_path), rows)
+
+    assert len(load_segments(str(tmp_path))) == 1
+    assert [p.name for p in tmp_path.iterdir() if p.name.endswith(".tmp")] == []
+
+@pytest.mark.asyncio
+async def test_archive_skips_while_another_process_holds_the_lock(session_factory, sqlite_db, tmp_path):
+    lock = _lock(str(tmp_path))
+    try:
+        archived = await archive_audit_logs(session_factory, retention_days=30, directory=str(tmp_path))
+    finally:
+        _unlock(lock)
+
+    assert archived == 0
+    assert len((await sqlite_db.scalars(select(AuditLog.id))).all()) == 7
+    assert load_segments(str(tmp_path)) == []
+
+    assert await archive_audit_logs(session_factory, retention_days=30, directory=str(tmp_path)) == 5
+
+@pytest.mark.asyncio
+async def test_query_continues_into_archive(session_factory, sqlite_db, tmp_path):
+    await archive_audit_logs(session_factory, retention_days=30, directory=str(tmp_path), batch_size=2)
+
+    seen = []
+    cursor = None
+    while True:
+        query = AuditQuery(limit=3, cursor=cursor)
+        logs, cursor = await get_audit_logs(sqlite_db, query, archive_dir=str(tmp_path))
+        seen.extend(log.id for log in logs)
+        if cursor is None:
+            break
+
+    assert seen == [7, 6, 5, 4, 3, 2, 1]
+
+@pytest.mark.asyncio
+async def test_query_filters_archived_rows(session_factory, sqlite_db, tmp_path):
+    await archive_audit_logs(session_factory, retention_days=30, directory=str(tmp_path), batch_size=2)
+
+    logs, _ = await get_audit_logs(sqlite_db, AuditQuery(entity_type="subject", entity_id=41), archive_dir=str(tmp_path))
+    assert [log.id for log in logs] == [7, 4, 2]
+    assert logs[1].payload == {"students_ids": [3]}
+
+    query = AuditQuery(created_from=NOW - timedelta(days=399), created_to=NOW - timedelta(days=397))
+    logs, _ = await get_audit_logs(sqlite_db, query, archive_dir=str(tmp_path))
+    assert [log.id for log in logs] == [3, 2]
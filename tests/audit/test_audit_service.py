@@ -0,0 +1,97 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+
+from audit.models import AuditLog, AuditAction, AuditEntity
+from audit.schemas import AuditQuery
+from audit.service import get_audit_logs
+from auth.models import User, Role
+from migrations import upgrade_schema
+
+
+async def seed_logs(db):
+    db.add_all([
+        User(id=i, email=f"u{i}@school.com", hashed_password="x", full_name=f"User {i}",
+             role=Role.ADMIN, date_of_birth=datetime(1980, 1, 1))
+        for i in (1, 2)
+    ])
+    await db.commit()
+    start = datetime(2024, 1, 1)
+    # Two entries share a timestamp so the id has to break the tie.
+    await db.execute(insert(AuditLog), [
+        {"user_id": 1, "action": AuditAction.SUBJECT_CREATED.value, "entity_type": AuditEntity.SUBJECT.value,
+         "entity_id": 42, "timestamp": start},
+        {"user_id": 2, "action": AuditAction.SUBJECT_STUDENTS_ADDED.value, "entity_type": AuditEntity.SUBJECT.value,
+         "entity_id": 42, "payload": {"students_ids": [10]}, "timestamp": start + timedelta(minutes=1)},
+        {"user_id": 1, "action": AuditAction.SUBJECT_CREATED.value, "entity_type": AuditEntity.SUBJECT.value,
+         "entity_id": 7, "timestamp": start + timedelta(minutes=1)},
+        {"user_id": 1, "action": AuditAction.USER_CREATED.value, "entity_type": AuditEntity.USER.value,
+         "entity_id": 2, "timestamp": start + timedelta(minutes=2)},
+    ])
+    await db.commit()
+
+@pytest.mark.asyncio
+async def test_get_audit_logs_walks_pages_newest_first(sqlite_db):
+    await seed_logs(sqlite_db)
+
+    seen = []
+    cursor = None
+    while True:
+        logs, cursor = await get_audit_logs(sqlite_db, AuditQuery(limit=2, cursor=cursor))
+        seen.extend(log.id for log in logs)
+        if cursor is None:
+            break
+
+    assert seen == [4, 3, 2, 1]
+
+@pytest.mark.asyncio
+async def test_get_audit_logs_pages_through_rows_with_server_default_timestamps(sqlite_db, tmp_path):
+    # What the old CURRENT_TIMESTAMP default wrote: whole seconds, so all five rows share one value.
+    for log_id in range(1, 6):
+        await sqlite_db.execute(text(
+            "INSERT INTO audit_logs (id, user_id, action, timestamp) "
+            f"VALUES ({log_id}, 1, 'User logged in', '2024-01-01 08:00:00')"
+        ))
+    await sqlite_db.run_sync(lambda session: upgrade_schema(session.connection()))
+    await sqlite_db.commit()
+
+    seen, cursor = [], None
+    for _ in range(5):
+        logs, cursor = await get_audit_logs(sqlite_db, AuditQuery(limit=2, cursor=cursor), archive_dir=str(tmp_path))
+        seen.extend(log.id for log in logs)
+        if cursor is None:
+            break
+
+    assert seen == [5, 4, 3, 2, 1]
+
+@pytest.mark.asyncio
+async def test_get_audit_logs_by_entity(sqlite_db):
+    await seed_logs(sqlite_db)
+
+    logs, cursor = await get_audit_logs(sqlite_db, AuditQuery(entity_type="subject", entity_id=42))
+
+    assert [log.id for log in logs] == [2, 1]
+    assert logs[0].payload == {"students_ids": [10]}
+    assert cursor is None
+
+@pytest.mark.asyncio
+async def test_get_audit_logs_by_user_and_action(sqlite_db):
+    await seed_logs(sqlite_db)
+
+    logs, _ = await get_audit_logs(sqlite_db, AuditQuery(user_id=1, action="subject.created"))
+    assert [log.id for log in logs] == [3, 1]
+
+    logs, _ = await get_audit_logs(sqlite_db, AuditQuery(created_from=datetime(2024, 1, 1, 0, 1)))
+    assert [log.id for log in logs] == [4, 3, 2]
+
+@pytest.mark.asyncio
+async def test_get_audit_logs_uses_entity_index(sqlite_db):
+    await seed_logs(sqlite_db)
+    statement = "EXPLAIN QUERY PLAN SELECT id FROM audit_logs WHERE entity_type = 'subject' AND entity_id = 42 " \
+                "ORDER BY timestamp DESC, id DESC LIMIT 51"
+
+    connection = await sqlite_db.connection()
+    plan = " ".join(row[-1] for row in (await connection.exec_driver_sql(statement)).all())
+
+    assert "ix_audit_logs_entity_type_entity_id_timestamp" in plan
+    assert "TEMP B-TREE" not in plan
@@ -0,0 +1,77 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from audit.models import AuditLog, AuditAction, AuditEntity
+from audit.writer import AuditWriter
+from auth.models import User, Role
+
+
+@pytest_asyncio.fixture
+async def session_factory(sqlite_db):
+    sqlite_db.add(User(id=1, email="admin@school.com", hashed_password="x", full_name="Admin",
+                       role=Role.ADMIN, date_of_birth=datetime(1980, 1, 1)))
+    await sqlite_db.commit()
+    return async_sessionmaker(bind=sqlite_db.bind, expire_on_commit=False)
+
+@pytest.mark.asyncio
+async def test_flushes_in_batches(session_factory, sqlite_db, sql_statements):
+    writer = AuditWriter(session_factory=session_factory, batch_size=2, flush_interval_ms=10)
+    for i in range(5):
+        await writer.put(1, AuditAction.SUBJECT_STUDENTS_ADDED, AuditEntity.SUBJECT, i, {"students_ids": [i]})
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(writer.run(stop))
+    await asyncio.sleep(0.05)
+    stop.set()
+    await task
+
+    logs = (await sqlite_db.scalars(select(AuditLog).order_by(AuditLog.id))).all()
+    assert [log.entity_id for log in logs] == list(range(5))
+    assert logs[0].action == "subject.students_added" and logs[0].entity_type == "subject"
+    assert logs[3].payload == {"students_ids": [3]}
+    assert all(log.timestamp is not None for log in logs)
+    assert len([s for s in sql_statements if s.startswith("INSERT INTO audit_logs")]) == 3
+    assert writer.metrics["written"] == 5 and writer.metrics["batches"] == 3
+
+@pytest.mark.asyncio
+async def test_drains_queue_on_stop(session_factory, sqlite_db):
+    writer = AuditWriter(session_factory=session_factory, batch_size=100, flush_interval_ms=60_000)
+    stop = asyncio.Event()
+    stop.set()
+    for i in range(3):
+        await writer.put(1, AuditAction.USER_CREATED, AuditEntity.USER, i)
+
+    await writer.run(stop)
+
+    assert len((await sqlite_db.scalars(select(AuditLog))).all()) == 3
+    assert writer.metrics["queue_depth"] == 0
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_after_timeout():
+    writer = AuditWriter(max_queue=1, enqueue_timeout=0.01)
+
+    await writer.put(1, AuditAction.USER_CREATED)
+    await writer.put(1, AuditAction.USER_CREATED)
+
+    assert writer.metrics["enqueued"] == 1
+    assert writer.metrics["dropped"] == 1
+    assert writer.metrics["max_queue_depth"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_counted():
+    def broken_session():
+        raise RuntimeError("database is gone")
+
+    writer = AuditWriter(session_factory=broken_session)
+    await writer.put(1, AuditAction.USER_CREATED)
+    await writer.put(1, AuditAction.USER_CREATED)
+
+    await writer.drain()
+
+    assert writer.metrics["failed"] == 2
+    assert writer.metrics["written"] == 0
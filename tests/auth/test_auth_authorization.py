@@ -0,0 +1,142 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from starlette.exceptions import HTTPException
+
+from auth.authorization import is_enrolled, is_parent_of, has_child_in_subject, can_access_subject, \
+    can_access_student, can_access_class
+from auth.cache import token_cache, UserSnapshot
+from auth.identity import Identity
+from auth.models import User, Role, Student, Parent
+from classes.models import Class
+from grades.models import Grade, GradeType
+from grades.schemas import GradeCreateRequest
+from grades.service import get_grade, create_grade
+from subjects.models import Subject
+from subjects.service import get_authorized_subject
+
+STUDENTS = 40
+TEACHER = Identity(id=1, email="teacher@school.com", role=Role.TEACHER, token_version=0)
+STUDENT = Identity(id=100, email="s100@school.com", role=Role.STUDENT, token_version=0)
+PARENT = Identity(id=1100, email="p100@school.com", role=Role.PARENT, token_version=0)
+OTHER_PARENT = Identity(id=1101, email="p101@school.com", role=Role.PARENT, token_version=0)
+OUTSIDER = Identity(id=500, email="s500@school.com", role=Role.STUDENT, token_version=0)
+
+
+@pytest_asyncio.fixture
+async def school(sqlite_db):
+    sqlite_db.add(User(id=1, email="teacher@school.com", hashed_password="x", full_name="Teacher",
+                       role=Role.TEACHER, date_of_birth=datetime(1980, 1, 1)))
+    students = [
+        Student(id=100 + i, email=f"s{100 + i}@school.com", hashed_password="x", full_name=f"Student {i}",
+                date_of_birth=datetime(2010, 1, 1))
+        for i in range(STUDENTS)
+    ]
+    parents = [
+        Parent(id=1000 + s.id, email=f"p{s.id}@school.com", hashed_password="x", full_name=f"Parent {s.id}",
+               date_of_birth=datetime(1980, 1, 1), children=[s])
+        for s in students
+    ]
+    outsider = Student(id=500, email="s500@school.com", hashed_password="x", full_name="Outsider",
+                       date_of_birth=datetime(2010, 1, 1))
+    sqlite_db.add_all([
+        *students, *parents, outsider,
+        Subject(id=1, name="Math", teacher_id=1, students=students),
+        Subject(id=2, name="Art", teacher_id=1, students=students[1:]),
+        Class(id=1, name="10A", year=2025, teacher_id=1, students=students),
+        Grade(id=1, student_id=100, subject_id=1, grade=5.0, grade_type=GradeType.EXAM),
+    ])
+    await sqlite_db.commit()
+    sqlite_db.expunge_all()
+    return sqlite_db
+
+
+@pytest.mark.asyncio
+async def test_membership_checks(school):
+    assert await is_enrolled(school, 100, 1)
+    assert not await is_enrolled(school, 100, 2)
+    assert not await is_enrolled(school, 500, 1)
+
+    assert await is_parent_of(school, PARENT, 100)
+    assert not await is_parent_of(school, PARENT, 101)
+
+    assert await has_child_in_subject(school, PARENT.id, 1)
+    assert not await has_child_in_subject(school, PARENT.id, 2)
+    assert await has_child_in_subject(school, OTHER_PARENT.id, 2)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("user, subject_id, allowed", [
+    (TEACHER, 1, True),
+    (Identity(id=2, email="t2@school.com", role=Role.TEACHER, token_version=0), 1, False),
+    (STUDENT, 1, True),
+    (STUDENT, 2, False),
+    (PARENT, 1, True),
+    (PARENT, 2, False),
+    (Identity(id=3, email="pr@school.com", role=Role.PRINCIPAL, token_version=0), 2, True),
+])
+async def test_can_access_subject(school, user, subject_id, allowed):
+    assert await can_access_subject(school, user, subject_id, teacher_id=1) == allowed
+
+
+@pytest.mark.asyncio
+async def test_can_access_student_and_class(school):
+    assert await can_access_student(school, STUDENT, 100)
+    assert not await can_access_student(school, STUDENT, 101)
+    assert await can_access_student(school, PARENT, 100)
+    assert await can_access_student(school, TEACHER, 101)
+
+    assert await can_access_class(school, STUDENT, 1, teacher_id=1)
+    assert not await can_access_class(school, OUTSIDER, 1, teacher_id=1)
+    assert await can_access_class(school, PARENT, 1, teacher_id=1)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("user, queries", [(TEACHER, 1), (STUDENT, 2), (PARENT, 2)])
+async def test_get_authorized_subject_does_not_load_students(school, sql_statements, user, queries):
+    subject = await get_authorized_subject(user, 1, school)
+
+    assert subject.id == 1
+    assert len(sql_statements) == queries
+    assert not any("parent_student.parent_id IN" in s or "subject_students.subject_id IN" in s for s in sql_statements)
+
+
+@pytest.mark.asyncio
+async def test_get_authorized_subject_forbidden_parent(school, sql_statements):
+    with pytest.raises(HTTPException) as exc:
+        await get_authorized_subject(PARENT, 2, school)
+
+    assert exc.value.status_code == 403
+    assert len(sql_statements) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_grade_parent_uses_one_exists_query(school, sql_statements):
+    grade = await get_grade(PARENT, 1, school)
+
+    assert grade.id == 1
+    assert len(sql_statements) == 2
+
+
+@pytest.mark.asyncio
+async def test_get_grade_parent_with_cached_snapshot_skips_query(school, sql_statements):
+    parent = Identity(id=PARENT.id, email=PARENT.email, role=Role.PARENT, token_version=0, token_key="k")
+    token_cache.put_identity("k", parent, None)
+    token_cache.put_snapshot("k", UserSnapshot(id=parent.id, email=parent.email, full_name="Parent", role=Role.PARENT,
+                                               date_of_birth=datetime(1980, 1, 1), token_version=0,
+                                               children_ids=(100,)))
+
+    await get_grade(parent, 1, school)
+
+    assert len(sql_statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_create_grade_membership_is_a_single_probe(school, sql_statements):
+    request = GradeCreateRequest(student_id=101, subject_id=1, grade=5.0, type="exam")
+
+    await create_grade(TEACHER, request, school)
+
+    membership = [s for s in sql_statements if "subject_students" in s]
+    assert len(membership) == 1
+    assert "EXISTS" in membership[0]
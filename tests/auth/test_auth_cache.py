@@ -0,0 +1,121 @@
+import time
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+from jose import jwt  # type: ignore[import-untyped]
+from starlette.exceptions import HTTPException
+
+from auth.cache import TokenCache, token_cache
+from auth.identity import Identity
+from auth.models import Role, Parent
+from auth.service import get_current_user, load_user_snapshot
+
+TEST_SECRET_KEY = "test_secret_key"
+TEST_ALGORITHM = "HS256"
+
+def make_identity(user_id=1, token_version=0, key="key"):
+    return Identity(id=user_id, email="test@example.com", role=Role.PARENT, token_version=token_version, token_key=key)
+
+def make_token(**claims):
+    payload = {"sub": "test@example.com", "id": 1, "role": "PARENT", "ver": 0, "exp": int(time.time()) + 600}
+    payload.update(claims)
+    return jwt.encode(payload, TEST_SECRET_KEY, algorithm=TEST_ALGORITHM)
+
+def test_cache_hit_and_miss_counters():
+    cache = TokenCache(max_entries=10, ttl_seconds=60)
+    assert cache.get_identity("key") is None
+
+    cache.put_identity("key", make_identity(), None)
+
+    assert cache.get_identity("key") == make_identity()
+    assert cache.metrics["hits"] == 1
+    assert cache.metrics["misses"] == 1
+
+def test_cache_evicts_least_recently_used():
+    cache = TokenCache(max_entries=2, ttl_seconds=60)
+    cache.put_identity("a", make_identity(1, key="a"), None)
+    cache.put_identity("b", make_identity(2, key="b"), None)
+    cache.get_identity("a")
+
+    cache.put_identity("c", make_identity(3, key="c"), None)
+
+    assert cache.get_identity("b") is None
+    assert cache.get_identity("a") is not None
+    assert cache.metrics["evictions"] == 1
+
+def test_cache_ttl_capped_at_token_expiry():
+    cache = TokenCache(max_entries=10, ttl_seconds=600)
+    cache.put_identity("key", make_identity(), time.time() - 1)
+
+    assert cache.get_identity("key") is None
+
+def test_invalidate_user_drops_entries_and_revokes_old_versions():
+    cache = TokenCache(max_entries=10, ttl_seconds=60)
+    cache.put_identity("a", make_identity(1, key="a"), None)
+    cache.put_identity("b", make_identity(1, key="b"), None)
+
+    cache.invalidate_user(1, min_token_version=1)
+
+    assert cache.get_identity("a") is None
+    assert cache.get_identity("b") is None
+    assert cache.is_revoked(make_identity(1, token_version=0))
+    assert not cache.is_revoked(make_identity(1, token_version=1))
+
+def test_get_current_user_decodes_once():
+    with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
+            patch("auth.service.ALGORITHM", TEST_ALGORITHM), \
+            patch("auth.service.jwt.decode", wraps=jwt.decode) as mock_decode:
+        token = make_token()
+
+        first = get_current_user(token)
+        second = get_current_user(token)
+
+        assert first == second
+        assert mock_decode.call_count == 1
+        assert token_cache.metrics["hits"] == 1
+
+def test_get_current_user_rejects_revoked_cached_token():
+    with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
+            patch("auth.service.ALGORITHM", TEST_ALGORITHM):
+        token = make_token()
+        get_current_user(token)
+
+        token_cache.invalidate_user(1, min_token_version=1)
+
+        with pytest.raises(HTTPException) as exc:
+            get_current_user(token)
+        assert exc.value.status_code == 401
+
+@pytest.mark.asyncio
+async def test_load_user_snapshot_is_cached(mock_db):
+    parent = Parent(id=1, email="test@example.com", full_name="Parent", role=Role.PARENT,
+                    date_of_birth=datetime(1980, 1, 1), token_version=0)
+    mock_db.get.return_value = parent
+    mock_db.scalars.return_value.all.return_value = [10]
+    identity = make_identity()
+    token_cache.put_identity(identity.token_key, identity, None)
+
+    first = await load_user_snapshot(identity, mock_db)
+    second = await load_user_snapshot(identity, mock_db)
+
+    assert first is second
+    assert first.children_ids == (10,)
+    mock_db.get.assert_called_once()
+    mock_db.scalars.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_load_user_snapshot_reloads_after_invalidation(mock_db):
+    parent = Parent(id=1, email="test@example.com", full_name="Parent", role=Role.PARENT,
+                    date_of_birth=datetime(1980, 1, 1), token_version=0)
+    parent.children = []
+    mock_db.get.return_value = parent
+    identity = make_identity()
+    token_cache.put_identity(identity.token_key, identity, None)
+    await load_user_snapshot(identity, mock_db)
+
+    token_cache.invalidate_user(1)
+    token_cache.put_identity(identity.token_key, identity, None)
+    await load_user_snapshot(identity, mock_db)
+
+    assert mock_db.get.call_count == 2
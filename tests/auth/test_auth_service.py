@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock, patch
 from datetime import datetime
@@ -5,45 +7,51 @@ from jose import jwt  # type: ignore[import-untyped]
 from starlette.exceptions import HTTPException
 from starlette import status
 
-from auth.models import Role
+from auth.hashing import PasswordHasher
+from auth.identity import Identity
+from auth.models import Role, User
 from auth.schemas import CreateUserRequest, ChangePasswordRequest
 from auth.service import (
     authenticate_user,
     create_access_token,
     get_current_user,
+    load_user,
     create_user,
-    send_email_for_password_change,
-    send_email_for_new_user,
+    queue_email_for_password_change,
+    queue_email_for_new_user,
     change_password
 )
 
 TEST_SECRET_KEY = "test_secret_key"
 TEST_ALGORITHM = "HS256"
 
-def test_authenticate_user_success(mock_db, auth_user):
-    with patch("auth.service.password_hash") as mock_hash:
-        mock_hash.verify.return_value = True
-        mock_db.query().filter().first.return_value = auth_user
+@pytest.mark.asyncio
+async def test_authenticate_user_success(mock_db, auth_user):
+    with patch("auth.service.password_hasher") as mock_hash:
+        mock_hash.verify = AsyncMock(return_value=True)
+        mock_db.scalars.return_value.first.return_value = auth_user
 
-        result = authenticate_user("test@example.com", "correct_password", mock_db)
+        result = await authenticate_user("test@example.com", "correct_password", mock_db)
 
         assert result is not None
         assert result.email == "test@example.com"
         mock_hash.verify.assert_called_with("correct_password", "hashed_secret_password")
 
-def test_authenticate_user_wrong_password(mock_db, auth_user):
-    with patch("auth.service.password_hash") as mock_hash:
-        mock_hash.verify.return_value = False
-        mock_db.query().filter().first.return_value = auth_user
+@pytest.mark.asyncio
+async def test_authenticate_user_wrong_password(mock_db, auth_user):
+    with patch("auth.service.password_hasher") as mock_hash:
+        mock_hash.verify = AsyncMock(return_value=False)
+        mock_db.scalars.return_value.first.return_value = auth_user
 
-        result = authenticate_user("test@example.com", "wrong_password", mock_db)
+        result = await authenticate_user("test@example.com", "wrong_password", mock_db)
 
         assert result is None
 
-def test_authenticate_user_not_found(mock_db):
-    mock_db.query().filter().first.return_value = None
+@pytest.mark.asyncio
+async def test_authenticate_user_not_found(mock_db):
+    mock_db.scalars.return_value.first.return_value = None
 
-    result = authenticate_user("unknown@example.com", "any_password", mock_db)
+    result = await authenticate_user("unknown@example.com", "any_password", mock_db)
 
     assert result is None
 
@@ -52,42 +60,76 @@ def test_create_access_token():
             patch("auth.service.ALGORITHM", TEST_ALGORITHM), \
             patch("auth.service.ACCESS_TOKEN_EXPIRATION_MINUTES", 30):
 
-        token = create_access_token("test@example.com", 1)
+        token = create_access_token("test@example.com", 1, Role.TEACHER, 3)
 
         decoded = jwt.decode(token, TEST_SECRET_KEY, algorithms=[TEST_ALGORITHM])
         assert decoded["sub"] == "test@example.com"
         assert decoded["id"] == 1
+        assert decoded["role"] == "TEACHER"
+        assert decoded["ver"] == 3
         assert "exp" in decoded
 
-def test_get_current_user_valid(mock_db, auth_user):
+def test_get_current_user_valid():
+    with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
+            patch("auth.service.ALGORITHM", TEST_ALGORITHM):
+
+        token = jwt.encode({"sub": "test@example.com", "id": 1, "role": "STUDENT", "ver": 0}, TEST_SECRET_KEY, algorithm=TEST_ALGORITHM)
+
+        result = get_current_user(token)
+
+        assert result == Identity(id=1, email="test@example.com", role=Role.STUDENT, token_version=0)
+
+def test_get_current_user_missing_role_claim():
     with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
             patch("auth.service.ALGORITHM", TEST_ALGORITHM):
 
         token = jwt.encode({"sub": "test@example.com", "id": 1}, TEST_SECRET_KEY, algorithm=TEST_ALGORITHM)
 
-        mock_db.query().filter().first.return_value = auth_user
+        with pytest.raises(HTTPException) as exc:
+            get_current_user(token)
 
-        result = get_current_user(token, mock_db)
+        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
 
-        assert result.id == 1
-        assert result.email == "test@example.com"
+@pytest.mark.asyncio
+async def test_load_user_success(mock_db, auth_user):
+    auth_user.token_version = 2
+    mock_db.get.return_value = auth_user
+
+    result = await load_user(Identity(id=1, email=auth_user.email, role=Role.STUDENT, token_version=2), User, mock_db)
 
-def test_get_current_user_invalid_token(mock_db):
+    assert result is auth_user
+    mock_db.get.assert_called_once_with(User, 1)
+
+@pytest.mark.asyncio
+async def test_load_user_revoked_token(mock_db, auth_user):
+    auth_user.token_version = 3
+    mock_db.get.return_value = auth_user
+
+    with pytest.raises(HTTPException) as exc:
+        await load_user(Identity(id=1, email=auth_user.email, role=Role.STUDENT, token_version=2), User, mock_db)
+
+    assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+def test_get_current_user_invalid_token():
     with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
             patch("auth.service.ALGORITHM", TEST_ALGORITHM):
 
         token = jwt.encode({"sub": "test", "id": 1}, "wrong_key", algorithm=TEST_ALGORITHM)
 
         with pytest.raises(HTTPException) as exc:
-            get_current_user(token, mock_db)
+            get_current_user(token)
 
         assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
         assert "Could not validate user" in exc.value.detail
 
-def test_create_user_success(mock_db):
-    with patch("auth.service.password_hash") as mock_hash:
-        mock_hash.hash.return_value = "new_hashed_pass"
-        mock_db.query().filter().first.return_value = None
+@pytest.mark.asyncio
+async def test_create_user_success(mock_db):
+    with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
+            patch("auth.service.ALGORITHM", TEST_ALGORITHM), \
+            patch("auth.service.password_hasher") as mock_hash, \
+            patch("auth.service.enqueue_email") as mock_enqueue:
+        mock_hash.hash = AsyncMock(return_value="new_hashed_pass")
+        mock_db.scalars.return_value.first.return_value = None
 
         request = CreateUserRequest(
             email="new@example.com",
@@ -97,15 +139,17 @@ def test_create_user_success(mock_db):
             date_of_birth=datetime(2000, 1, 1)
         )
 
-        result = create_user(request, mock_db)
+        result = await create_user(request, mock_db)
 
         assert result.email == "new@example.com"
         assert result.hashed_password == "new_hashed_pass"
         mock_db.add.assert_called_once()
         mock_db.commit.assert_called_once()
+        assert mock_enqueue.call_count == 2
 
-def test_create_user_duplicate_email(mock_db, auth_user):
-    mock_db.query().filter().first.return_value = auth_user
+@pytest.mark.asyncio
+async def test_create_user_duplicate_email(mock_db, auth_user):
+    mock_db.scalars.return_value.first.return_value = auth_user
 
     request = CreateUserRequest(
         email="test@example.com",
@@ -116,44 +160,87 @@ def test_create_user_duplicate_email(mock_db, auth_user):
     )
 
     with pytest.raises(HTTPException) as exc:
-        create_user(request, mock_db)
+        await create_user(request, mock_db)
 
     assert exc.value.status_code == status.HTTP_400_BAD_REQUEST
     assert "Email already registered" in exc.value.detail
 
-@pytest.mark.asyncio
-async def test_send_emails():
-    with patch("auth.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
-
-        await send_email_for_password_change("test@test.com", "token123")
-        assert mock_fm.send_message.call_count == 1
+def test_queue_emails(mock_db):
+    with patch("auth.service.enqueue_email") as mock_enqueue:
+        queue_email_for_password_change(mock_db, "test@test.com", "token123")
+        assert mock_enqueue.call_count == 1
 
-        await send_email_for_new_user("test@test.com", "Name", "pass")
-        assert mock_fm.send_message.call_count == 2
+        queue_email_for_new_user(mock_db, "test@test.com", "Name", "pass")
+        assert mock_enqueue.call_count == 2
 
-def test_change_password_success(mock_db, auth_user):
+@pytest.mark.asyncio
+async def test_change_password_success(mock_db, auth_user):
     with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
             patch("auth.service.ALGORITHM", TEST_ALGORITHM), \
-            patch("auth.service.password_hash") as mock_hash:
+            patch("auth.service.password_hasher") as mock_hash:
 
-        token = jwt.encode({"id": 1}, TEST_SECRET_KEY, algorithm=TEST_ALGORITHM)
+        token = jwt.encode({"id": 1, "ver": 0}, TEST_SECRET_KEY, algorithm=TEST_ALGORITHM)
         request = ChangePasswordRequest(old_password="old_pass", new_password="new_pass")
 
+        auth_user.token_version = 0
         mock_db.get.return_value = auth_user
-        mock_hash.hash.side_effect = lambda x: "hashed_secret_password" if x == "old_pass" else "new_hashed_value"
+        mock_hash.verify = AsyncMock(return_value=True)
+        mock_hash.hash = AsyncMock(side_effect=lambda x: "hashed_secret_password" if x == "old_pass" else "new_hashed_value")
 
-        change_password(token, request, mock_db)
+        await change_password(token, request, mock_db)
 
         assert auth_user.hashed_password == "new_hashed_value"
+        assert auth_user.token_version == 1
         mock_db.add.assert_called_with(auth_user)
         mock_db.commit.assert_called_once()
 
-def test_change_password_invalid_token(mock_db):
+@pytest.mark.asyncio
+async def test_change_password_invalid_token(mock_db):
     with patch("auth.service.SECRET_KEY", TEST_SECRET_KEY), \
             patch("auth.service.ALGORITHM", TEST_ALGORITHM):
 
         with pytest.raises(HTTPException) as exc:
-            change_password("invalid_token_string", ChangePasswordRequest(old_password="a", new_password="b"), mock_db)
+            await change_password("invalid_token_string", ChangePasswordRequest(old_password="a", new_password="b"), mock_db)
+
+        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
+
+@pytest.mark.asyncio
+async def test_password_hasher_round_trip():
+    hasher = PasswordHasher(workers=2, max_pending=4)
+    try:
+        hashed = await hasher.hash("secret")
+
+        assert await hasher.verify("secret", hashed)
+        assert not await hasher.verify("wrong", hashed)
+        metrics = hasher.metrics
+        assert metrics["completed"] == 3
+        assert metrics["in_executor"] == 0
+        assert metrics["queue_depth"] == 0
+    finally:
+        hasher.shutdown()
 
-        assert exc.value.status_code == status.HTTP_401_UNAUTHORIZED
\ No newline at end of file
+@pytest.mark.asyncio
+async def test_password_hasher_reports_queue_depth():
+    hasher = PasswordHasher(workers=1, max_pending=2)
+    try:
+        await asyncio.gather(*(hasher.hash(f"secret{i}") for i in range(4)))
+
+        assert hasher.metrics["completed"] == 4
+        assert hasher.metrics["max_queue_depth"] >= 2
+        assert hasher.queue_depth == 0
+    finally:
+        hasher.shutdown()
+
+@pytest.mark.asyncio
+async def test_password_hasher_rejects_when_waiting_limit_is_reached():
+    hasher = PasswordHasher(workers=1, max_pending=1, max_waiting=1)
+    try:
+        results = await asyncio.gather(*(hasher.hash(f"secret{i}") for i in range(4)), return_exceptions=True)
+
+        rejected = [r for r in results if isinstance(r, HTTPException)]
+        assert len(rejected) == 2
+        assert rejected[0].status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert hasher.metrics["completed"] == 2
+        assert hasher.metrics["rejected"] == 2
+    finally:
+        hasher.shutdown()
@@ -1,8 +1,12 @@
 import pytest
-from unittest.mock import AsyncMock, patch
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import insert, select
 from starlette.exceptions import HTTPException
-from auth.models import User, Role
-from classes.models import Class
+from auth.models import User, Role, Student
+from classes.models import Class, class_students, class_subjects
+from outbox.models import EmailOutbox
+from subjects.models import Subject, subject_students
 from classes.schemas import (
     CreateClassRequest,
     AddStudentsRequest,
@@ -18,20 +22,19 @@ from classes.service import (
 
 @pytest.mark.asyncio
 async def test_create_empty_class_success(mock_db, teacher_user):
-    with patch("classes.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+    with patch("classes.service.enqueue_email") as mock_enqueue:
 
         request = CreateClassRequest(name="10A", year=2024, user_id=teacher_user.id)
 
         mock_db.get.return_value = teacher_user
-        mock_db.query().filter().first.return_value = None
+        mock_db.scalars.return_value.first.return_value = None
 
         new_class = await create_empty_class(request, mock_db)
 
         assert new_class.name == "10A"
         mock_db.add.assert_called_once()
         mock_db.commit.assert_called_once()
-        mock_fm.send_message.assert_called_once()
+        mock_enqueue.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_create_empty_class_teacher_not_found(mock_db):
@@ -57,7 +60,7 @@ async def test_create_empty_class_invalid_role(mock_db):
 @pytest.mark.asyncio
 async def test_create_empty_class_duplicate(mock_db, teacher_user):
     mock_db.get.return_value = teacher_user
-    mock_db.query().filter().first.return_value = Class()
+    mock_db.scalars.return_value.first.return_value = Class()
 
     request = CreateClassRequest(name="10A", year=2024, user_id=teacher_user.id)
 
@@ -66,21 +69,32 @@ async def test_create_empty_class_duplicate(mock_db, teacher_user):
 
     assert exc.value.status_code == 400
 
-@pytest.mark.asyncio
-async def test_add_students_to_class_success(mock_db, sample_class, student_user):
-    with patch("classes.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+async def seed_school(db, teacher_user, students=3):
+    db.add(User(id=teacher_user.id, email=teacher_user.email, hashed_password="x", full_name="Teacher",
+                role=Role.TEACHER, date_of_birth=datetime(1980, 1, 1)))
+    children = [
+        Student(id=100 + i, email=f"s{i}@school.com", hashed_password="x", full_name=f"Student {i}",
+                date_of_birth=datetime(2010, 1, 1))
+        for i in range(students)
+    ]
+    subjects = [Subject(id=500 + i, name=f"Subject {i}", teacher_id=teacher_user.id) for i in range(2)]
+    db.add_all([*children, *subjects, Class(id=100, name="10A", year=2024, teacher_id=teacher_user.id)])
+    await db.commit()
+    return children
+
+async def linked(db, table):
+    return sorted(tuple(row) for row in (await db.execute(select(table))).all())
 
-        mock_db.get.return_value = sample_class
-        mock_db.query().where().all.return_value = [student_user]
+@pytest.mark.asyncio
+async def test_add_students_to_class_success(sqlite_db, teacher_user):
+    await seed_school(sqlite_db, teacher_user)
+    await sqlite_db.execute(insert(class_students).values(class_id=100, user_id=100))
 
-        request = AddStudentsRequest(students_ids=[10])
+    await add_students_to_class(100, AddStudentsRequest(students_ids=[100, 101, teacher_user.id]), sqlite_db)
 
-        await add_students_to_class(100, request, mock_db)
-
-        assert student_user in sample_class.students
-        mock_db.commit.assert_called_once()
-        mock_fm.send_message.assert_called_once()
+    assert await linked(sqlite_db, class_students) == [(100, 100), (100, 101)]
+    outbox = (await sqlite_db.scalars(select(EmailOutbox))).all()
+    assert [o.recipients for o in outbox] == [["s1@school.com"]]
 
 @pytest.mark.asyncio
 async def test_add_students_to_class_not_found(mock_db):
@@ -92,39 +106,39 @@ async def test_add_students_to_class_not_found(mock_db):
 
     assert exc.value.status_code == 404
 
-def test_change_class_status_archive_success(mock_db, sample_class):
+@pytest.mark.asyncio
+async def test_change_class_status_archive_success(mock_db, sample_class):
     mock_db.get.return_value = sample_class
     request = ChangeClassStatusRequest(status=True)
 
-    result = change_class_status(request, 100, mock_db)
+    result = await change_class_status(request, 100, mock_db)
 
     assert result.archived is True
     mock_db.commit.assert_called_once()
 
-def test_change_class_status_unarchive_duplicate(mock_db, sample_class):
+@pytest.mark.asyncio
+async def test_change_class_status_unarchive_duplicate(mock_db, sample_class):
     sample_class.archived = True
     mock_db.get.return_value = sample_class
-    mock_db.query().filter().first.return_value = Class(id=200)
+    mock_db.scalars.return_value.first.return_value = Class(id=200)
 
     request = ChangeClassStatusRequest(status=False)
 
     with pytest.raises(HTTPException) as exc:
-        change_class_status(request, 100, mock_db)
+        await change_class_status(request, 100, mock_db)
 
     assert exc.value.status_code == 400
 
 @pytest.mark.asyncio
-async def test_add_subjects_to_class_success(mock_db, teacher_user, sample_class, student_user, sample_subject):
-    sample_class.students = [student_user]
-    mock_db.get.return_value = sample_class
-    mock_db.scalars().all.return_value = [sample_subject]
+async def test_add_subjects_to_class_success(sqlite_db, teacher_user):
+    await seed_school(sqlite_db, teacher_user)
+    await sqlite_db.execute(insert(class_students), [{"class_id": 100, "user_id": i} for i in (100, 101)])
+    await sqlite_db.execute(insert(subject_students).values(subject_id=500, user_id=100))
 
-    request = AddSubjectsRequest(subjects_ids=[500])
+    await add_subjects_to_class(teacher_user, 100, AddSubjectsRequest(subjects_ids=[500, 501]), sqlite_db)
 
-    await add_subjects_to_class(teacher_user, 100, request, mock_db)
-
-    assert student_user in sample_subject.students
-    mock_db.commit.assert_called_once()
+    assert await linked(sqlite_db, class_subjects) == [(100, 500), (100, 501)]
+    assert await linked(sqlite_db, subject_students) == [(500, 100), (500, 101), (501, 100), (501, 101)]
 
 @pytest.mark.asyncio
 async def test_add_subjects_to_class_forbidden(mock_db, sample_class):
@@ -141,7 +155,7 @@ async def test_add_subjects_to_class_forbidden(mock_db, sample_class):
 @pytest.mark.asyncio
 async def test_add_subjects_to_class_missing_subject(mock_db, teacher_user, sample_class):
     mock_db.get.return_value = sample_class
-    mock_db.scalars().all.return_value = []
+    mock_db.scalars.return_value.all.return_value = []
 
     request = AddSubjectsRequest(subjects_ids=[500])
 
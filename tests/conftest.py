@@ -1,29 +1,62 @@
 import pytest
-from unittest.mock import MagicMock
+import pytest_asyncio
+from unittest.mock import AsyncMock, MagicMock
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from auth.cache import token_cache
 from auth.models import User, Role, Student, Parent
 from classes.models import Class
 from subjects.models import Subject
 from grades.models import Grade, GradeType
+from database import Base
+import outbox.models  # noqa: F401
+
+@pytest.fixture(autouse=True)
+def clear_token_cache():
+    token_cache.clear()
+    yield
+    token_cache.clear()
+
+@pytest_asyncio.fixture
+async def sqlite_db():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with async_sessionmaker(bind=engine, expire_on_commit=False)() as session:
+        yield session
+    await engine.dispose()
+
+@pytest.fixture
+def sql_statements(sqlite_db):
+    statements = []
+    engine = sqlite_db.bind.sync_engine
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(engine, "before_cursor_execute", record)
 
 @pytest.fixture
 def mock_db():
     mock = MagicMock()
-    query_mock = MagicMock()
-    filter_mock = MagicMock()
     scalars_mock = MagicMock()
 
-    mock.query.return_value = query_mock
-    query_mock.filter.return_value = filter_mock
-    query_mock.where.return_value = filter_mock
-
-    filter_mock.first.return_value = None
-    filter_mock.all.return_value = []
-
-    mock.scalars.return_value = scalars_mock
+    mock.scalars = AsyncMock(return_value=scalars_mock)
+    scalars_mock.first.return_value = None
     scalars_mock.all.return_value = []
 
-    mock.get.return_value = None
+    mock.get = AsyncMock(return_value=None)
+    execute_result = MagicMock()
+    execute_result.rowcount = 0
+    mock.execute = AsyncMock(return_value=execute_result)
+    mock.scalar = AsyncMock()
+    mock.commit = AsyncMock()
+    mock.refresh = AsyncMock()
+    mock.flush = AsyncMock()
+    mock.delete = AsyncMock()
     return mock
 
 @pytest.fixture
@@ -0,0 +1,21 @@
+from database import read_only_url
+
+
+def test_read_only_url_opens_sqlite_file_in_read_only_mode():
+    url = read_only_url("sqlite+aiosqlite:///./school.db")
+
+    assert url.startswith("sqlite+aiosqlite:///file:./school.db?")
+    assert "mode=ro" in url
+    assert "uri=true" in url
+
+
+def test_read_only_url_keeps_existing_read_only_url():
+    url = "sqlite+aiosqlite:///file:./school.db?mode=ro&uri=true"
+
+    assert read_only_url(url) == url
+
+
+def test_read_only_url_without_a_shareable_file():
+    assert read_only_url("sqlite+aiosqlite://") is None
+    assert read_only_url("sqlite+aiosqlite:///:memory:") is None
+    assert read_only_url("postgresql+asyncpg://user:pass@db/school") is None
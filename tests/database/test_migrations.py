@@ -0,0 +1,88 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy import inspect, select, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import grades.models  # noqa: F401
+from audit.models import AuditLog
+from auth.models import User
+from database import Base
+from migrations import upgrade_schema
+
+# Tables as the first release created them, before any column or index was added.
+BASELINE_SCHEMA = [
+    "CREATE TABLE users (id INTEGER NOT NULL, email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL, "
+    "full_name VARCHAR NOT NULL, role VARCHAR(9) NOT NULL, date_of_birth DATETIME NOT NULL, "
+    "PRIMARY KEY (id), UNIQUE (email))",
+    "CREATE TABLE subjects (id INTEGER NOT NULL, name VARCHAR NOT NULL, teacher_id INTEGER NOT NULL, "
+    "archived BOOLEAN NOT NULL, PRIMARY KEY (id), FOREIGN KEY(teacher_id) REFERENCES users (id))",
+    "CREATE TABLE grades (id INTEGER NOT NULL, student_id INTEGER NOT NULL, subject_id INTEGER NOT NULL, "
+    "grade FLOAT NOT NULL, grade_type VARCHAR(20) NOT NULL, created_at DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, "
+    "PRIMARY KEY (id), FOREIGN KEY(student_id) REFERENCES users (id), FOREIGN KEY(subject_id) REFERENCES subjects (id))",
+    "CREATE TABLE audit_logs (id INTEGER NOT NULL, user_id INTEGER NOT NULL, action VARCHAR NOT NULL, "
+    "timestamp DATETIME DEFAULT CURRENT_TIMESTAMP NOT NULL, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id))",
+    "INSERT INTO users (id, email, hashed_password, full_name, role, date_of_birth) "
+    "VALUES (1, 'student@test.com', 'x', 'Student One', 'STUDENT', '2008-01-01 00:00:00.000000')",
+    "INSERT INTO audit_logs (id, user_id, action) VALUES (1, 1, 'User logged in')",
+]
+
+@pytest_asyncio.fixture
+async def baseline_engine():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            await conn.execute(text(statement))
+    yield engine
+    await engine.dispose()
+
+async def upgrade(engine):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+@pytest.mark.asyncio
+async def test_upgrade_adds_token_version_to_existing_users(baseline_engine):
+    await upgrade(baseline_engine)
+
+    async with async_sessionmaker(bind=baseline_engine)() as db:
+        user = await db.scalar(select(User).where(User.id == 1))
+
+    assert user.token_version == 0
+
+@pytest.mark.asyncio
+async def test_upgrade_creates_indexes_on_existing_tables(baseline_engine):
+    await upgrade(baseline_engine)
+
+    async with baseline_engine.connect() as conn:
+        indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("grades")})
+
+    assert "ix_grades_created_at_id" in indexes
+
+@pytest.mark.asyncio
+async def test_upgrade_is_idempotent(baseline_engine):
+    await upgrade(baseline_engine)
+    await upgrade(baseline_engine)
+
+    async with baseline_engine.connect() as conn:
+        columns = await conn.run_sync(lambda c: [col["name"] for col in inspect(c).get_columns("users")])
+
+    assert columns.count("token_version") == 1
+
+@pytest.mark.asyncio
+async def test_upgrade_adds_structured_audit_columns(baseline_engine):
+    await upgrade(baseline_engine)
+
+    async with async_sessionmaker(bind=baseline_engine)() as db:
+        db.add(AuditLog(user_id=1, action="subject_created", entity_type="subject", entity_id=4, payload={"name": "Math"}))
+        await db.commit()
+        logs = (await db.scalars(select(AuditLog).order_by(AuditLog.id))).all()
+
+    assert [(log.action, log.entity_type, log.payload) for log in logs] == [
+        ("User logged in", None, None),
+        ("subject_created", "subject", {"name": "Math"}),
+    ]
+    assert logs[0].timestamp.microsecond == 0
+
+    async with baseline_engine.connect() as conn:
+        indexes = await conn.run_sync(lambda c: {i["name"] for i in inspect(c).get_indexes("audit_logs")})
+    assert "ix_audit_logs_entity_type_entity_id_timestamp" in indexes
@@ -0,0 +1,106 @@
+import statistics
+
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import delete, insert
+
+from grades.aggregates import _merge, add_to_aggregate, add_to_aggregates, remove_from_aggregate, replace_in_aggregate, rebuild_aggregates
+from grades.models import Grade, GradeAggregate, GradeType
+
+VALUES = [5.0, 3.5, 6.0, 2.0, 4.25, 5.5]
+
+
+async def load(sqlite_db, student_id=1, subject_id=1) -> GradeAggregate | None:
+    return await sqlite_db.get(GradeAggregate, (student_id, subject_id), populate_existing=True)
+
+
+def assert_matches(aggregate: GradeAggregate, values):
+    assert aggregate.count == len(values)
+    assert aggregate.total == pytest.approx(sum(values))
+    assert aggregate.minimum == min(values)
+    assert aggregate.maximum == max(values)
+    assert aggregate.mean == pytest.approx(statistics.fmean(values))
+    assert aggregate.variance == pytest.approx(statistics.pvariance(values))
+
+
+@pytest.mark.asyncio
+async def test_add_to_aggregate_tracks_running_statistics(sqlite_db):
+    for value in VALUES:
+        await add_to_aggregate(sqlite_db, 1, 1, value)
+    await add_to_aggregate(sqlite_db, 1, 2, 4.0)
+
+    assert_matches(await load(sqlite_db), VALUES)
+    assert (await load(sqlite_db, subject_id=2)).count == 1
+
+
+@pytest.mark.asyncio
+async def test_add_to_aggregates_merges_batches_into_existing_and_new_rows(sqlite_db):
+    await add_to_aggregates(sqlite_db, {(1, 1): VALUES[:2]})
+    await add_to_aggregates(sqlite_db, {(1, 1): VALUES[2:], (2, 1): [4.0, 5.0]})
+
+    assert_matches(await load(sqlite_db), VALUES)
+    assert_matches(await load(sqlite_db, student_id=2), [4.0, 5.0])
+
+
+@pytest.mark.asyncio
+async def test_add_to_aggregates_merges_when_a_concurrent_writer_creates_the_row(sqlite_db):
+    execute = sqlite_db.execute
+    first = VALUES[:2]
+
+    async def racing_execute(statement, *args, **kwargs):
+        result = await execute(statement, *args, **kwargs)
+        if statement is _merge:
+            # Another request inserts the pair's first aggregate after this one's UPDATE missed.
+            await execute(insert(GradeAggregate).values(
+                student_id=1, subject_id=1, count=len(first), total=sum(first), minimum=min(first),
+                maximum=max(first), mean=statistics.fmean(first),
+                m2=statistics.pvariance(first) * len(first),
+            ))
+        return result
+
+    with patch.object(sqlite_db, "execute", racing_execute):
+        await add_to_aggregates(sqlite_db, {(1, 1): VALUES[2:]})
+
+    assert_matches(await load(sqlite_db), VALUES)
+
+
+@pytest.mark.asyncio
+async def test_remove_and_replace_keep_aggregate_exact(sqlite_db):
+    for i, value in enumerate(VALUES, start=1):
+        sqlite_db.add(Grade(id=i, student_id=1, subject_id=1, grade=value, grade_type=GradeType.EXAM))
+        await add_to_aggregate(sqlite_db, 1, 1, value)
+    await sqlite_db.flush()
+
+    # Removing the maximum forces a rescan of the remaining grades.
+    await sqlite_db.execute(delete(Grade).where(Grade.id == 3))
+    await remove_from_aggregate(sqlite_db, 1, 1, 6.0)
+    remaining = [5.0, 3.5, 2.0, 4.25, 5.5]
+    assert_matches(await load(sqlite_db), remaining)
+
+    grade = await sqlite_db.get(Grade, 2)
+    grade.grade = 4.0
+    await sqlite_db.flush()
+    await replace_in_aggregate(sqlite_db, 1, 1, 3.5, 4.0)
+    assert_matches(await load(sqlite_db), [5.0, 4.0, 2.0, 4.25, 5.5])
+
+
+@pytest.mark.asyncio
+async def test_remove_last_grade_deletes_aggregate(sqlite_db):
+    await add_to_aggregate(sqlite_db, 1, 1, 5.0)
+    await remove_from_aggregate(sqlite_db, 1, 1, 5.0)
+
+    assert await load(sqlite_db) is None
+
+
+@pytest.mark.asyncio
+async def test_rebuild_aggregates_backfills_from_grades(sqlite_db):
+    await sqlite_db.execute(insert(Grade), [
+        {"student_id": 1, "subject_id": 1, "grade": value, "grade_type": GradeType.EXAM} for value in VALUES
+    ] + [{"student_id": 2, "subject_id": 1, "grade": 3.0, "grade_type": GradeType.HOMEWORK}])
+    await add_to_aggregate(sqlite_db, 9, 9, 2.0)
+
+    assert await rebuild_aggregates(sqlite_db) == 2
+    assert_matches(await load(sqlite_db), VALUES)
+    assert_matches(await load(sqlite_db, student_id=2), [3.0])
+    assert await load(sqlite_db, student_id=9, subject_id=9) is None
@@ -1,58 +1,112 @@
 import pytest
-from unittest.mock import AsyncMock, patch
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import select, text
 from starlette.exceptions import HTTPException
+from auth.identity import Identity
 from auth.models import User, Role, Student, Parent
 from subjects.models import Subject
-from grades.models import Grade, GradeType
-from grades.schemas import GradeCreateRequest
-from grades.service import get_all_grades, get_grade, create_grade
+from grades.models import Grade, GradeType, GradeAggregate
+from outbox.models import EmailOutbox
+from grades.schemas import GradeCreateRequest, GradeQuery
+from grades.service import get_all_grades, get_grade, create_grade, get_grade_summaries, create_grades
+from migrations import upgrade_schema
 
-def test_get_all_grades(mock_db, sample_grade):
-    mock_db.scalars().all.return_value = [sample_grade]
-    result = get_all_grades(mock_db)
+@pytest.mark.asyncio
+async def test_get_all_grades(mock_db, sample_grade):
+    mock_db.scalars.return_value.all.return_value = [sample_grade]
+    result, next_cursor = await get_all_grades(mock_db)
     assert len(result) == 1
     assert result[0].id == 500
+    assert next_cursor is None
+
+@pytest.mark.asyncio
+async def test_get_all_grades_returns_cursor_for_next_page(mock_db, student_user):
+    grades = [
+        Grade(id=i, student_id=student_user.id, grade=5.0, grade_type=GradeType.EXAM,
+              created_at=datetime(2025, 1, 1, 8, 0, i))
+        for i in (3, 2, 1)
+    ]
+    mock_db.scalars.return_value.all.return_value = grades
+
+    result, next_cursor = await get_all_grades(mock_db, GradeQuery(limit=2))
+    assert [g.id for g in result] == [3, 2]
+    assert next_cursor is not None
+
+    await get_all_grades(mock_db, GradeQuery(limit=2, cursor=next_cursor))
+    statement = mock_db.scalars.call_args.args[0]
+    params = statement.compile().params
+    assert datetime(2025, 1, 1, 8, 0, 2) in params.values()
+    assert 2 in params.values()
+
+@pytest.mark.asyncio
+async def test_get_all_grades_applies_filters(mock_db):
+    mock_db.scalars.return_value.all.return_value = []
+    query = GradeQuery(subject_id=7, student_id=3, type="exam", created_from=datetime(2025, 1, 1))
+
+    await get_all_grades(mock_db, query)
+
+    sql = str(mock_db.scalars.call_args.args[0])
+    assert "grades.subject_id =" in sql
+    assert "grades.student_id =" in sql
+    assert "grades.grade_type =" in sql
+    assert "grades.created_at >=" in sql
+    assert "LIMIT" in sql
+
+@pytest.mark.asyncio
+async def test_get_all_grades_invalid_cursor(mock_db):
+    with pytest.raises(HTTPException) as exc:
+        await get_all_grades(mock_db, GradeQuery(cursor="not-a-cursor"))
+    assert exc.value.status_code == 400
+    mock_db.scalars.assert_not_called()
 
-def test_get_grade_success_teacher(mock_db, teacher_user, sample_grade):
+@pytest.mark.asyncio
+async def test_get_grade_success_teacher(mock_db, teacher_user, sample_grade):
     mock_db.get.return_value = sample_grade
-    result = get_grade(teacher_user, 500, mock_db)
+    result = await get_grade(teacher_user, 500, mock_db)
     assert result == sample_grade
 
-def test_get_grade_not_found(mock_db, teacher_user):
+@pytest.mark.asyncio
+async def test_get_grade_not_found(mock_db, teacher_user):
     mock_db.get.return_value = None
     with pytest.raises(HTTPException) as exc:
-        get_grade(teacher_user, 999, mock_db)
+        await get_grade(teacher_user, 999, mock_db)
     assert exc.value.status_code == 404
 
-def test_get_grade_student_success(mock_db, student_user, sample_grade):
+@pytest.mark.asyncio
+async def test_get_grade_student_success(mock_db, student_user, sample_grade):
     mock_db.get.return_value = sample_grade
-    result = get_grade(student_user, 500, mock_db)
+    result = await get_grade(student_user, 500, mock_db)
     assert result == sample_grade
+    mock_db.get.assert_called_once()
 
-def test_get_grade_student_forbidden(mock_db, sample_grade):
+@pytest.mark.asyncio
+async def test_get_grade_student_forbidden(mock_db, sample_grade):
     other_student = User(id=99, role=Role.STUDENT)
     mock_db.get.return_value = sample_grade
     with pytest.raises(HTTPException) as exc:
-        get_grade(other_student, 500, mock_db)
+        await get_grade(other_student, 500, mock_db)
     assert exc.value.status_code == 403
 
-def test_get_grade_parent_success(mock_db, parent_user, sample_grade):
+@pytest.mark.asyncio
+async def test_get_grade_parent_success(mock_db, parent_user, sample_grade):
     mock_db.get.return_value = sample_grade
-    result = get_grade(parent_user, 500, mock_db)
+    mock_db.scalar.return_value = True
+    identity = Identity(id=parent_user.id, email=parent_user.email, role=Role.PARENT, token_version=0)
+    result = await get_grade(identity, 500, mock_db)
     assert result == sample_grade
 
-def test_get_grade_parent_forbidden(mock_db, sample_grade):
-    other_parent = Parent(id=88, role=Role.PARENT)
-    other_parent.children = []
+@pytest.mark.asyncio
+async def test_get_grade_parent_forbidden(mock_db, sample_grade):
     mock_db.get.return_value = sample_grade
+    mock_db.scalar.return_value = False
     with pytest.raises(HTTPException) as exc:
-        get_grade(other_parent, 500, mock_db)
+        await get_grade(Identity(id=88, email="other@school.com", role=Role.PARENT, token_version=0), 500, mock_db)
     assert exc.value.status_code == 403
 
 @pytest.mark.asyncio
 async def test_create_grade_success(mock_db, teacher_user, student_user, sample_subject):
-    with patch("grades.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+    with patch("grades.service.enqueue_email") as mock_enqueue:
 
         sample_subject.students = [student_user]
 
@@ -63,7 +117,7 @@ async def test_create_grade_success(mock_db, teacher_user, student_user, sample_
             type=GradeType.HOMEWORK.value
         )
 
-        def db_get_side_effect(model, id):
+        def db_get_side_effect(model, id, **kwargs):
             if model == Subject and id == sample_subject.id:
                 return sample_subject
             if model == Student and id == student_user.id:
@@ -71,13 +125,14 @@ async def test_create_grade_success(mock_db, teacher_user, student_user, sample_
             return None
 
         mock_db.get.side_effect = db_get_side_effect
+        mock_db.scalar.return_value = True
 
         new_grade = await create_grade(teacher_user, request, mock_db)
 
         assert new_grade.grade == 5.5
         mock_db.add.assert_called_once()
         mock_db.commit.assert_called_once()
-        mock_fm.send_message.assert_called_once()
+        mock_enqueue.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_create_grade_subject_not_found(mock_db, teacher_user):
@@ -104,6 +159,7 @@ async def test_create_grade_teacher_forbidden(mock_db, sample_subject, student_u
 @pytest.mark.asyncio
 async def test_create_grade_student_not_in_subject(mock_db, teacher_user, sample_subject):
     mock_db.get.return_value = sample_subject
+    mock_db.scalar.return_value = False
     request = GradeCreateRequest(student_id=99, subject_id=100, grade=5, type=1)
 
     with pytest.raises(HTTPException) as exc:
@@ -117,6 +173,7 @@ async def test_create_grade_student_not_found_in_db(mock_db, teacher_user, sampl
     sample_subject.students.append(fake_student_in_class)
 
     mock_db.get.side_effect = [sample_subject, None]
+    mock_db.scalar.return_value = True
 
     request = GradeCreateRequest(student_id=99, subject_id=100, grade=5, type=1)
 
@@ -129,6 +186,7 @@ async def test_create_grade_student_not_found_in_db(mock_db, teacher_user, sampl
 async def test_create_grade_invalid_value(mock_db, teacher_user, sample_subject, student_user):
     sample_subject.students = [student_user]
     mock_db.get.side_effect = [sample_subject, student_user]
+    mock_db.scalar.return_value = True
 
     request_low = GradeCreateRequest(student_id=student_user.id, subject_id=100, grade=1, type=1)
     with pytest.raises(HTTPException) as exc:
@@ -139,4 +197,108 @@ async def test_create_grade_invalid_value(mock_db, teacher_user, sample_subject,
     request_high = GradeCreateRequest(student_id=student_user.id, subject_id=100, grade=7, type=1)
     with pytest.raises(HTTPException) as exc:
         await create_grade(teacher_user, request_high, mock_db)
-    assert exc.value.status_code == 400
\ No newline at end of file
+    assert exc.value.status_code == 400
+@pytest.mark.asyncio
+async def test_get_grade_summaries_student_other_forbidden(mock_db, student_user):
+    with pytest.raises(HTTPException) as exc:
+        await get_grade_summaries(student_user, student_user.id + 1, None, mock_db)
+    assert exc.value.status_code == 403
+    mock_db.scalars.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_get_grade_summaries_parent_of_child(mock_db, parent_user, student_user):
+    aggregate = GradeAggregate(student_id=student_user.id, subject_id=1, count=2, total=9.0,
+                               minimum=4.0, maximum=5.0, mean=4.5, m2=0.5)
+    mock_db.scalar.return_value = True
+    mock_db.scalars.return_value.all.return_value = [aggregate]
+    identity = Identity(id=parent_user.id, email=parent_user.email, role=Role.PARENT, token_version=0)
+
+    result = await get_grade_summaries(identity, student_user.id, 1, mock_db)
+
+    assert result == [aggregate]
+    assert result[0].variance == 0.25
+
+async def seed_class(db, teacher_user, students=3):
+    db.add(User(id=teacher_user.id, email=teacher_user.email, hashed_password="x", full_name="Teacher",
+                role=Role.TEACHER, date_of_birth=datetime(1980, 1, 1)))
+    children = [
+        Student(id=100 + i, email=f"s{i}@school.com", hashed_password="x", full_name=f"Student {i}",
+                date_of_birth=datetime(2010, 1, 1))
+        for i in range(students)
+    ]
+    parent = Parent(id=200, email="parent@school.com", hashed_password="x", full_name="Parent",
+                    date_of_birth=datetime(1980, 1, 1), children=children[:1])
+    subject = Subject(id=1, name="Math", teacher_id=teacher_user.id, students=children)
+    db.add_all([*children, parent, subject])
+    await db.commit()
+    return children
+
+@pytest.mark.asyncio
+async def test_create_grades_inserts_all_in_one_commit(sqlite_db, teacher_user):
+    students = await seed_class(sqlite_db, teacher_user)
+    requests = [
+        GradeCreateRequest(student_id=s.id, subject_id=1, grade=4.0 + i, type="exam")
+        for i, s in enumerate(students)
+    ]
+
+    grades = await create_grades(teacher_user, requests, sqlite_db)
+
+    assert [(g.student_id, g.grade) for g in grades] == [(100, 4.0), (101, 5.0), (102, 6.0)]
+    assert all(g.id is not None and g.created_at is not None for g in grades)
+    outbox = (await sqlite_db.scalars(select(EmailOutbox).order_by(EmailOutbox.id))).all()
+    assert len(outbox) == 3
+    assert outbox[0].recipients == ["s0@school.com", "parent@school.com"]
+    aggregate = await sqlite_db.get(GradeAggregate, (100, 1))
+    assert aggregate.count == 1 and aggregate.mean == 4.0
+
+@pytest.mark.asyncio
+async def test_create_grades_rejects_student_outside_subject(sqlite_db, teacher_user):
+    students = await seed_class(sqlite_db, teacher_user, students=2)
+    sqlite_db.add(Student(id=150, email="other@school.com", hashed_password="x", full_name="Other",
+                          date_of_birth=datetime(2010, 1, 1)))
+    await sqlite_db.commit()
+    requests = [
+        GradeCreateRequest(student_id=students[0].id, subject_id=1, grade=5.0, type="exam"),
+        GradeCreateRequest(student_id=150, subject_id=1, grade=5.0, type="exam"),
+    ]
+
+    with pytest.raises(HTTPException) as exc:
+        await create_grades(teacher_user, requests, sqlite_db)
+    assert exc.value.status_code == 403
+    assert (await sqlite_db.scalars(select(Grade))).all() == []
+
+@pytest.mark.asyncio
+async def test_create_grades_other_teacher_forbidden(sqlite_db, teacher_user):
+    await seed_class(sqlite_db, teacher_user)
+    other_teacher = Identity(id=teacher_user.id + 1, email="other@school.com", role=Role.TEACHER, token_version=0)
+
+    with pytest.raises(HTTPException) as exc:
+        await create_grades(other_teacher, [GradeCreateRequest(student_id=100, subject_id=1, grade=5.0, type="exam")], sqlite_db)
+    assert exc.value.status_code == 403
+
+@pytest.mark.asyncio
+async def test_create_grades_invalid_grade(mock_db, teacher_user):
+    with pytest.raises(HTTPException) as exc:
+        await create_grades(teacher_user, [GradeCreateRequest(student_id=1, subject_id=1, grade=7.0, type="exam")], mock_db)
+    assert exc.value.status_code == 400
+    mock_db.execute.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_get_all_grades_pages_through_rows_with_server_default_timestamps(sqlite_db):
+    # What the old CURRENT_TIMESTAMP default wrote: whole seconds, so all five rows share one value.
+    for grade_id in range(1, 6):
+        await sqlite_db.execute(text(
+            "INSERT INTO grades (id, student_id, subject_id, grade, grade_type, created_at) "
+            f"VALUES ({grade_id}, 1, 1, 5.0, 'EXAM', '2025-01-01 08:00:00')"
+        ))
+    await sqlite_db.run_sync(lambda session: upgrade_schema(session.connection()))
+    await sqlite_db.commit()
+
+    seen, cursor = [], None
+    for _ in range(5):
+        page, cursor = await get_all_grades(sqlite_db, GradeQuery(limit=2, cursor=cursor))
+        seen.extend(g.id for g in page)
+        if cursor is None:
+            break
+
+    assert seen == [5, 4, 3, 2, 1]
@@ -0,0 +1,107 @@
+import socket
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+from fastapi_mail import MessageSchema, MessageType
+from pydantic import NameEmail
+
+from smtp_pool import SMTPPool
+
+
+class RecordingHandler(Sink):
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return "250 OK"
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller, handler
+    controller.stop()
+
+def make_message(i: int) -> MessageSchema:
+    return MessageSchema(
+        subject=f"Message {i}",
+        recipients=[NameEmail(name="", email=f"student{i}@test.com")],
+        body="New material",
+        subtype=MessageType(value="html")
+    )
+
+def make_pool(controller, **kwargs) -> SMTPPool:
+    return SMTPPool(hostname=controller.hostname, port=controller.port, sender="school@test.com", **kwargs)
+
+@pytest.mark.asyncio
+async def test_pool_reuses_connection(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller, size=2)
+
+    for i in range(5):
+        await pool.send_message(make_message(i))
+    await pool.close()
+
+    assert len(handler.messages) == 5
+    assert len(handler.sessions) == 1
+    metrics = pool.metrics
+    assert metrics["connections_opened"] == 1
+    assert metrics["messages_sent"] == 5
+    assert metrics["in_use"] == 0
+
+@pytest.mark.asyncio
+async def test_pool_sends_batch_on_one_session(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller)
+
+    await pool.send_message([make_message(i) for i in range(3)])
+    await pool.close()
+
+    assert [e.rcpt_tos for e in handler.messages] == [["student0@test.com"], ["student1@test.com"], ["student2@test.com"]]
+    assert pool.metrics["connections_opened"] == 1
+
+@pytest.mark.asyncio
+async def test_pool_reconnects_after_idle_timeout(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller, idle_timeout=0)
+
+    await pool.send_message(make_message(1))
+    await pool.send_message(make_message(2))
+    await pool.close()
+
+    assert len(handler.messages) == 2
+    assert pool.metrics["connections_opened"] == 2
+    assert pool.metrics["idle_reconnects"] == 1
+
+@pytest.mark.asyncio
+async def test_pool_rotates_connection_after_message_limit(smtp_server):
+    controller, handler = smtp_server
+    pool = make_pool(controller, max_messages_per_connection=2)
+
+    for i in range(4):
+        await pool.send_message(make_message(i))
+    await pool.close()
+
+    assert len(handler.messages) == 4
+    assert pool.metrics["connections_opened"] == 2
+    assert pool.metrics["connections_closed"] == 2
+
+@pytest.mark.asyncio
+async def test_pool_reports_failures():
+    pool = SMTPPool(hostname="127.0.0.1", port=free_port(), sender="school@test.com", timeout=1)
+
+    with pytest.raises(Exception):
+        await pool.send_message(make_message(1))
+
+    assert pool.metrics["send_failures"] == 1
+    assert pool.metrics["in_use"] == 0
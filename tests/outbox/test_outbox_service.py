@@ -0,0 +1,157 @@
+import pytest
+from datetime import datetime, UTC
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi_mail import MessageSchema, MessageType
+from pydantic import NameEmail
+
+from outbox.models import EmailOutbox, OutboxStatus
+from outbox.service import enqueue_email, enqueue_emails
+from outbox.worker import deliver_batch, backoff_delay, OUTBOX_MAX_ATTEMPTS
+from smtp_pool import SMTPPool
+from tests.mail.test_smtp_pool import smtp_server  # noqa: F401  pylint: disable=unused-import
+
+def make_message(recipients):
+    return MessageSchema(
+        subject="New grade",
+        recipients=[NameEmail(name="", email=r) for r in recipients],
+        body="You received a grade",
+        subtype=MessageType(value="html")
+    )
+
+def make_row(attempts=0, row_id=1):
+    return EmailOutbox(
+        id=row_id,
+        subject="New grade",
+        recipients=[f"student{row_id}@test.com"],
+        body="You received a grade",
+        subtype="html",
+        status=OutboxStatus.PENDING,
+        attempts=attempts,
+        next_attempt_at=datetime(2024, 1, 1)
+    )
+
+def make_session(db):
+    session_local = MagicMock()
+    session_local.return_value.__aenter__.return_value = db
+    return session_local
+
+def test_enqueue_email_adds_row(mock_db):
+    enqueue_email(mock_db, make_message(["student@test.com", "parent@test.com"]))
+
+    mock_db.add.assert_called_once()
+    row = mock_db.add.call_args.args[0]
+    assert isinstance(row, EmailOutbox)
+    assert row.recipients == ["student@test.com", "parent@test.com"]
+    assert row.subtype == "html"
+    mock_db.commit.assert_not_called()
+
+def test_enqueue_email_skips_empty_recipients(mock_db):
+    enqueue_email(mock_db, make_message([]))
+
+    mock_db.add.assert_not_called()
+
+def test_backoff_delay_grows_and_is_capped():
+    assert backoff_delay(2) == 2 * backoff_delay(1)
+    assert backoff_delay(100) == backoff_delay(200)
+
+@pytest.mark.asyncio
+async def test_deliver_batch_success_deletes_row():
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.delete = AsyncMock()
+    row = make_row()
+    with patch("outbox.worker.SessionLocal", make_session(db)), \
+            patch("outbox.worker.claim_batch", AsyncMock(return_value=[row])), \
+            patch("outbox.worker.smtp_pool") as mock_pool:
+        mock_pool.send_message = AsyncMock()
+
+        delivered = await deliver_batch()
+
+        assert delivered == 1
+        mock_pool.send_message.assert_called_once()
+        db.delete.assert_called_once_with(row)
+        db.commit.assert_called_once()
+
+@pytest.mark.asyncio
+async def test_deliver_batch_failure_schedules_retry():
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.delete = AsyncMock()
+    row = make_row()
+    with patch("outbox.worker.SessionLocal", make_session(db)), \
+            patch("outbox.worker.claim_batch", AsyncMock(return_value=[row])), \
+            patch("outbox.worker.smtp_pool") as mock_pool:
+        mock_pool.send_message = AsyncMock(side_effect=ConnectionError("SMTP down"))
+
+        await deliver_batch()
+
+        assert row.attempts == 1
+        assert row.status == OutboxStatus.PENDING
+        assert row.next_attempt_at > datetime.now(UTC).replace(tzinfo=None)
+        assert "SMTP down" in row.last_error
+        db.delete.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_deliver_batch_gives_up_after_max_attempts():
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.delete = AsyncMock()
+    row = make_row(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+    with patch("outbox.worker.SessionLocal", make_session(db)), \
+            patch("outbox.worker.claim_batch", AsyncMock(return_value=[row])), \
+            patch("outbox.worker.smtp_pool") as mock_pool:
+        mock_pool.send_message = AsyncMock(side_effect=ConnectionError("SMTP down"))
+
+        await deliver_batch()
+
+        assert row.status == OutboxStatus.FAILED
+        db.delete.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_deliver_batch_redacts_body_of_failed_row():
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.delete = AsyncMock()
+    row = make_row(attempts=OUTBOX_MAX_ATTEMPTS - 1)
+    row.body = "The password for the account: student@test.com is s3cret."
+    with patch("outbox.worker.SessionLocal", make_session(db)), \
+            patch("outbox.worker.claim_batch", AsyncMock(return_value=[row])), \
+            patch("outbox.worker.smtp_pool") as mock_pool:
+        mock_pool.send_message = AsyncMock(side_effect=ConnectionError("SMTP down"))
+
+        await deliver_batch()
+
+        assert row.status == OutboxStatus.FAILED
+        assert "s3cret" not in row.body
+        assert row.recipients == ["student1@test.com"]
+        assert "SMTP down" in row.last_error
+
+@pytest.mark.asyncio
+async def test_enqueue_emails_inserts_rows_in_one_statement(mock_db):
+    await enqueue_emails(mock_db, [make_message(["a@test.com"]), make_message([]), make_message(["b@test.com"])])
+
+    mock_db.execute.assert_awaited_once()
+    rows = mock_db.execute.call_args.args[1]
+    assert [r["recipients"] for r in rows] == [["a@test.com"], ["b@test.com"]]
+    mock_db.add.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_deliver_batch_spreads_sends_over_pool_sessions(smtp_server):  # pylint: disable=redefined-outer-name
+    controller, handler = smtp_server
+    pool = SMTPPool(hostname=controller.hostname, port=controller.port, sender="school@test.com", size=3)
+    db = MagicMock()
+    db.commit = AsyncMock()
+    db.delete = AsyncMock()
+    rows = [make_row(row_id=i) for i in range(1, 7)]
+    with patch("outbox.worker.SessionLocal", make_session(db)), \
+            patch("outbox.worker.claim_batch", AsyncMock(return_value=rows)), \
+            patch("outbox.worker.smtp_pool", pool):
+        delivered = await deliver_batch()
+    await pool.close()
+
+    assert delivered == 6
+    assert len(handler.messages) == 6
+    assert 1 < len(handler.sessions) <= 3
+    assert pool.metrics["connections_opened"] <= 3
+    assert db.delete.await_count == 6
+    db.commit.assert_called_once()
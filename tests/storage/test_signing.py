@@ -0,0 +1,51 @@
+import pytest
+from starlette.exceptions import HTTPException
+
+import storage.signing
+from storage.signing import sign_media_url, verify_media_signature, media_url_expiry
+
+
+@pytest.fixture(autouse=True)
+def secret(monkeypatch):
+    monkeypatch.setattr(storage.signing, "MEDIA_URL_SECRET", "media-secret")
+
+def parse(url: str) -> tuple[str, int, int, str]:
+    path, query = url.removeprefix("/media/").split("?")
+    params = dict(part.split("=") for part in query.split("&"))
+    return path, int(params["expires"]), int(params["uid"]), params["sig"]
+
+def test_signed_url_verifies_until_expiry():
+    url = sign_media_url("blobs/ab/abcd.pdf", 7, expires=2000)
+    path, expires, uid, sig = parse(url)
+    assert (path, expires, uid) == ("blobs/ab/abcd.pdf", 2000, 7)
+
+    verify_media_signature(path, expires, uid, sig, now=1999)
+    with pytest.raises(HTTPException) as exc:
+        verify_media_signature(path, expires, uid, sig, now=2001)
+    assert exc.value.status_code == 403
+
+@pytest.mark.parametrize("path, expires, uid", [
+    ("blobs/ab/other.pdf", 2000, 7),
+    ("blobs/ab/abcd.pdf", 9000, 7),
+    ("blobs/ab/abcd.pdf", 2000, 8),
+])
+def test_tampered_url_is_rejected(path, expires, uid):
+    _, _, _, sig = parse(sign_media_url("blobs/ab/abcd.pdf", 7, expires=2000))
+    with pytest.raises(HTTPException) as exc:
+        verify_media_signature(path, expires, uid, sig, now=1000)
+    assert exc.value.status_code == 403
+
+def test_signature_depends_on_secret(monkeypatch):
+    path, expires, uid, sig = parse(sign_media_url("blobs/ab/abcd.pdf", 7, expires=2000))
+    monkeypatch.setattr(storage.signing, "MEDIA_URL_SECRET", "rotated")
+    with pytest.raises(HTTPException):
+        verify_media_signature(path, expires, uid, sig, now=1000)
+
+def test_non_ascii_signature_is_rejected():
+    with pytest.raises(HTTPException):
+        verify_media_signature("blobs/ab/abcd.pdf", 2000, 7, "ü", now=1000)
+
+def test_expiry_is_stable_within_a_window():
+    assert media_url_expiry(now=3600, ttl=3600) == media_url_expiry(now=7199, ttl=3600) == 10800
+    assert media_url_expiry(now=7200, ttl=3600) == 14400
+    assert media_url_expiry(now=7199, ttl=3600) - 7199 >= 3600
@@ -0,0 +1,101 @@
+import io
+import os
+from datetime import datetime, timedelta, UTC
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy import update
+from starlette.exceptions import HTTPException
+
+from storage.backends import media_storage
+from auth.models import User, Role
+from storage.gc import collect_garbage, recount_references
+from storage.models import MediaBlob
+from storage.service import store_file, COLLECTING_REF_COUNT
+from subjects.models import Subject, SubjectMaterial
+
+
+@pytest.fixture
+def media_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_storage, "root", str(tmp_path))
+    return tmp_path
+
+def upload(data: bytes, name: str = "notes.pdf") -> UploadFile:
+    return UploadFile(file=io.BytesIO(data), filename=name)
+
+async def age_blobs(db, hours: int = 2):
+    await db.execute(update(MediaBlob).values(updated_at=datetime.now(UTC).replace(tzinfo=None) - timedelta(hours=hours)))
+    await db.commit()
+
+@pytest.mark.asyncio
+async def test_duplicate_uploads_share_one_blob(sqlite_db, media_dir):
+    first = await store_file(sqlite_db, upload(b"same pdf"))
+    second = await store_file(sqlite_db, upload(b"same pdf"))
+    other = await store_file(sqlite_db, upload(b"other pdf"))
+    await sqlite_db.commit()
+
+    assert first == second != other
+    blob = await sqlite_db.get(MediaBlob, first)
+    assert blob.ref_count == 2 and blob.size == len(b"same pdf")
+    assert len([f for _, _, files in os.walk(media_dir) for f in files]) == 2
+
+@pytest.mark.asyncio
+async def test_gc_removes_released_blobs_after_grace(sqlite_db, media_dir):
+    kept = await store_file(sqlite_db, upload(b"kept"))
+    released = await store_file(sqlite_db, upload(b"released"))
+    await sqlite_db.execute(update(MediaBlob).where(MediaBlob.path == released).values(ref_count=0))
+    await sqlite_db.commit()
+
+    assert await collect_garbage(sqlite_db, grace_seconds=3600) == []
+
+    await age_blobs(sqlite_db)
+    assert await collect_garbage(sqlite_db, grace_seconds=3600) == [released]
+    assert not (media_dir / released).exists()
+    assert (media_dir / kept).exists()
+    assert await sqlite_db.get(MediaBlob, released) is None
+
+@pytest.mark.asyncio
+async def test_upload_is_refused_while_its_blob_is_being_collected(sqlite_db, media_dir):
+    path = await store_file(sqlite_db, upload(b"collected"))
+    await sqlite_db.execute(update(MediaBlob).values(ref_count=COLLECTING_REF_COUNT))
+    await sqlite_db.commit()
+
+    with pytest.raises(HTTPException) as exc:
+        await store_file(sqlite_db, upload(b"collected"))
+
+    assert exc.value.status_code == 503
+    assert (await sqlite_db.get(MediaBlob, path, populate_existing=True)).ref_count == COLLECTING_REF_COUNT
+
+    await age_blobs(sqlite_db)
+    assert await collect_garbage(sqlite_db, grace_seconds=3600) == [path]
+    assert await sqlite_db.get(MediaBlob, path, populate_existing=True) is None
+
+@pytest.mark.asyncio
+async def test_recount_follows_materials(sqlite_db, media_dir):
+    sqlite_db.add(User(id=1, email="t@school.com", hashed_password="x", full_name="Teacher",
+                       role=Role.TEACHER, date_of_birth=datetime(1980, 1, 1)))
+    sqlite_db.add(Subject(id=1, name="Math", teacher_id=1))
+    referenced = await store_file(sqlite_db, upload(b"referenced"))
+    dropped = await store_file(sqlite_db, upload(b"dropped"))
+    sqlite_db.add_all([
+        SubjectMaterial(title="A", file_path=referenced, subject_id=1),
+        SubjectMaterial(title="B", file_path=referenced, subject_id=1),
+    ])
+    await sqlite_db.commit()
+    await age_blobs(sqlite_db)
+
+    await recount_references(sqlite_db)
+    assert (await sqlite_db.get(MediaBlob, referenced)).ref_count == 2
+
+    assert await collect_garbage(sqlite_db, grace_seconds=3600) == [dropped]
+
+@pytest.mark.asyncio
+async def test_gc_sweeps_orphan_files(sqlite_db, media_dir):
+    orphan = media_dir / "blobs" / "ab" / "abc.pdf.part"
+    orphan.parent.mkdir(parents=True)
+    orphan.write_bytes(b"half")
+
+    assert await collect_garbage(sqlite_db, grace_seconds=3600) == []
+    os.utime(orphan, (0, 0))
+    assert await collect_garbage(sqlite_db, grace_seconds=3600) == ["blobs/ab/abc.pdf.part"]
+    assert not orphan.exists()
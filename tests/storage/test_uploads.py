@@ -0,0 +1,105 @@
+import asyncio
+import os
+
+import pytest
+from starlette.exceptions import HTTPException
+
+import storage.uploads
+from storage.uploads import create_session, get_session, session_progress, append_chunk, completed_upload, \
+    remove_session, cleanup_sessions
+
+
+@pytest.fixture(autouse=True)
+def uploads_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage.uploads, "MEDIA_UPLOADS_PATH", str(tmp_path))
+    return tmp_path
+
+async def body(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+async def disconnecting(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+    raise ConnectionResetError()
+
+@pytest.mark.asyncio
+async def test_chunks_resume_from_offset():
+    session = await create_session(1, "lecture.mp4", 10, {"subject_id": 3})
+    assert (await get_session(1, session.id)).metadata == {"subject_id": 3}
+    assert (await session_progress(session))[0] == 0
+
+    with pytest.raises(ConnectionResetError):
+        await append_chunk(session, 0, disconnecting(b"012", b"3"))
+    assert (await session_progress(session))[0] == 4
+
+    with pytest.raises(HTTPException) as exc:
+        await append_chunk(session, 0, body(b"0123"))
+    assert exc.value.status_code == 409
+
+    assert await append_chunk(session, 4, body(b"456789"), write_bytes=4) == 10
+    async with completed_upload(session) as path:
+        with open(path, "rb") as f:
+            assert f.read() == b"0123456789"
+
+@pytest.mark.asyncio
+async def test_chunks_beyond_declared_length_are_rejected():
+    session = await create_session(1, "lecture.mp4", 4, {})
+    with pytest.raises(HTTPException) as exc:
+        await append_chunk(session, 0, body(b"01", b"234"))
+    assert exc.value.status_code == 413
+    assert (await session_progress(session))[0] == 2
+
+    with pytest.raises(HTTPException) as exc:
+        await create_session(1, "huge.mp4", 11, {}, max_bytes=10)
+    assert exc.value.status_code == 413
+
+@pytest.mark.asyncio
+async def test_concurrent_chunks_are_refused():
+    session = await create_session(1, "lecture.mp4", 10, {})
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow():
+        yield b"01"
+        started.set()
+        await release.wait()
+        yield b"23"
+
+    first = asyncio.create_task(append_chunk(session, 0, slow(), write_bytes=1))
+    await started.wait()
+    with pytest.raises(HTTPException) as exc:
+        await append_chunk(session, 2, body(b"23"))
+    assert exc.value.status_code == 409
+    release.set()
+    assert await first == 4
+
+@pytest.mark.asyncio
+async def test_incomplete_or_foreign_uploads():
+    session = await create_session(1, "lecture.mp4", 10, {})
+    with pytest.raises(HTTPException) as exc:
+        async with completed_upload(session):
+            pass
+    assert exc.value.status_code == 409
+
+    for user_id, upload_id in ((2, session.id), (1, "../../etc/passwd"), (1, "0" * 32)):
+        with pytest.raises(HTTPException) as exc:
+            await get_session(user_id, upload_id)
+        assert exc.value.status_code == 404
+
+    await remove_session(session)
+    with pytest.raises(HTTPException) as exc:
+        await append_chunk(session, 0, body(b"0"))
+    assert exc.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_cleanup_removes_abandoned_sessions(uploads_dir):
+    active = await create_session(1, "active.mp4", 10, {})
+    abandoned = await create_session(1, "abandoned.mp4", 10, {})
+    await append_chunk(abandoned, 0, body(b"0123"))
+    for name in os.listdir(uploads_dir):
+        if name.startswith(abandoned.id):
+            os.utime(uploads_dir / name, (0, 0))
+
+    assert await cleanup_sessions(ttl_seconds=3600) == [abandoned.id]
+    assert sorted(os.listdir(uploads_dir)) == [f"{active.id}.data", f"{active.id}.json"]
@@ -1,9 +1,17 @@
+import io
+import zipfile
 import pytest
-from unittest.mock import AsyncMock, patch
+import storage.uploads
+from datetime import datetime
+from unittest.mock import patch
+from sqlalchemy import select
 from starlette.exceptions import HTTPException
-from auth.models import User, Role
-from subjects.models import Subject
+from auth.models import User, Role, Student, Parent
+from outbox.models import EmailOutbox
+from subjects.models import Subject, SubjectMaterial, subject_students
+from storage.backends import media_storage
 from subjects.schemas import (
+    CreateMaterialUploadRequest,
     CreateSubjectRequest,
     AddStudentsRequest,
     RemoveStudentsRequest,
@@ -15,19 +23,26 @@ from subjects.service import (
     add_students,
     remove_students,
     change_status,
-    change_teacher
+    change_teacher,
+    build_subject_response,
+    build_upload_response,
+    create_material_upload,
+    upload_material_chunk,
+    complete_material_upload,
+    archive_names,
+    get_materials_archive,
+    stream_materials_archive
 )
 
 @pytest.mark.asyncio
 async def test_create_subject_success(mock_db, teacher_user, student_user):
-    with patch("subjects.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+    with patch("subjects.service.enqueue_email") as mock_enqueue:
 
         request = CreateSubjectRequest(name="Math", teacher_id=teacher_user.id, students_ids=[10])
 
         mock_db.get.return_value = teacher_user
-        mock_db.query().filter().first.return_value = None
-        mock_db.scalars().all.return_value = [student_user]
+        mock_db.scalars.return_value.first.return_value = None
+        mock_db.scalars.return_value.all.return_value = [student_user]
 
         result = await create_subject(teacher_user, request, mock_db)
 
@@ -35,7 +50,7 @@ async def test_create_subject_success(mock_db, teacher_user, student_user):
         assert result.teacher_id == teacher_user.id
         mock_db.add.assert_called_once()
         mock_db.commit.assert_called_once()
-        assert mock_fm.send_message.call_count == 2
+        assert mock_enqueue.call_count == 2
 
 @pytest.mark.asyncio
 async def test_create_subject_forbidden_wrong_teacher(mock_db):
@@ -50,7 +65,7 @@ async def test_create_subject_forbidden_wrong_teacher(mock_db):
 @pytest.mark.asyncio
 async def test_create_subject_duplicate(mock_db, teacher_user):
     request = CreateSubjectRequest(name="Math", teacher_id=teacher_user.id, students_ids=[])
-    mock_db.query().filter().first.return_value = Subject()
+    mock_db.scalars.return_value.first.return_value = Subject()
 
     with pytest.raises(HTTPException) as exc:
         await create_subject(teacher_user, request, mock_db)
@@ -62,7 +77,7 @@ async def test_create_subject_assigned_user_not_teacher(mock_db, principal_user)
     request = CreateSubjectRequest(name="Math", teacher_id=5, students_ids=[])
     student_role = User(id=5, role=Role.STUDENT)
 
-    mock_db.query().filter().first.return_value = None
+    mock_db.scalars.return_value.first.return_value = None
     mock_db.get.return_value = student_role
 
     with pytest.raises(HTTPException) as exc:
@@ -70,20 +85,47 @@ async def test_create_subject_assigned_user_not_teacher(mock_db, principal_user)
 
     assert exc.value.status_code == 400
 
+async def seed_roster(db, teacher_user, students=3, enrolled=1):
+    db.add(User(id=teacher_user.id, email=teacher_user.email, hashed_password="x", full_name="Teacher",
+                role=Role.TEACHER, date_of_birth=datetime(1980, 1, 1)))
+    children = [
+        Student(id=100 + i, email=f"s{i}@school.com", hashed_password="x", full_name=f"Student {i}",
+                date_of_birth=datetime(2010, 1, 1))
+        for i in range(students)
+    ]
+    subject = Subject(id=1, name="Math", teacher_id=teacher_user.id, students=children[:enrolled])
+    db.add_all([*children, subject])
+    await db.commit()
+    return children
+
+async def roster(db, subject_id=1):
+    statement = select(subject_students.c.user_id).where(subject_students.c.subject_id == subject_id)
+    return sorted((await db.scalars(statement)).all())
+
 @pytest.mark.asyncio
-async def test_add_students_success(mock_db, teacher_user, student_user, sample_subject):
-    with patch("subjects.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+async def test_add_students_success(sqlite_db, teacher_user):
+    await seed_roster(sqlite_db, teacher_user)
+    sqlite_db.add(User(id=50, email="other-teacher@school.com", hashed_password="x", full_name="Other",
+                       role=Role.TEACHER, date_of_birth=datetime(1980, 1, 1)))
+    await sqlite_db.commit()
 
-        request = AddStudentsRequest(students_ids=[student_user.id])
-        mock_db.get.return_value = sample_subject
-        mock_db.scalars().all.return_value = [student_user]
+    # 100 is already enrolled, 50 is not a student and 999 doesn't exist.
+    request = AddStudentsRequest(students_ids=[100, 101, 102, 50, 999])
+    await add_students(teacher_user, request, 1, sqlite_db)
 
-        await add_students(teacher_user, request, sample_subject.id, mock_db)
+    assert await roster(sqlite_db) == [100, 101, 102]
+    outbox = (await sqlite_db.scalars(select(EmailOutbox))).all()
+    assert len(outbox) == 1
+    assert sorted(outbox[0].recipients) == ["s1@school.com", "s2@school.com"]
 
-        assert student_user in sample_subject.students
-        mock_db.commit.assert_called_once()
-        mock_fm.send_message.assert_called_once()
+@pytest.mark.asyncio
+async def test_add_students_already_enrolled_sends_nothing(sqlite_db, teacher_user):
+    await seed_roster(sqlite_db, teacher_user, enrolled=3)
+
+    await add_students(teacher_user, AddStudentsRequest(students_ids=[100, 101]), 1, sqlite_db)
+
+    assert await roster(sqlite_db) == [100, 101, 102]
+    assert (await sqlite_db.scalars(select(EmailOutbox))).all() == []
 
 @pytest.mark.asyncio
 async def test_add_students_subject_not_found(mock_db, teacher_user):
@@ -96,26 +138,19 @@ async def test_add_students_subject_not_found(mock_db, teacher_user):
     assert exc.value.status_code == 404
 
 @pytest.mark.asyncio
-async def test_remove_students_success(mock_db, teacher_user, student_user, sample_subject):
-    with patch("subjects.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
-
-        sample_subject.students = [student_user]
-        mock_db.get.return_value = sample_subject
-        mock_db.scalars().all.return_value = [student_user]
+async def test_remove_students_success(sqlite_db, teacher_user):
+    await seed_roster(sqlite_db, teacher_user, enrolled=2)
 
-        request = RemoveStudentsRequest(students_ids=[student_user.id])
+    request = RemoveStudentsRequest(students_ids=[101, 102])
+    await remove_students(teacher_user, request, 1, sqlite_db)
 
-        await remove_students(teacher_user, request, sample_subject.id, mock_db)
-
-        assert student_user not in sample_subject.students
-        mock_db.commit.assert_called_once()
-        mock_fm.send_message.assert_called_once()
+    assert await roster(sqlite_db) == [100]
+    outbox = (await sqlite_db.scalars(select(EmailOutbox))).all()
+    assert [o.recipients for o in outbox] == [["s1@school.com"]]
 
 @pytest.mark.asyncio
 async def test_change_status_archive_success(mock_db, teacher_user, sample_subject):
-    with patch("subjects.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+    with patch("subjects.service.enqueue_email") as mock_enqueue:
 
         mock_db.get.return_value = sample_subject
         request = StatusRequest(status=True)
@@ -129,7 +164,7 @@ async def test_change_status_archive_success(mock_db, teacher_user, sample_subje
 async def test_change_status_unarchive_duplicate(mock_db, teacher_user, sample_subject):
     sample_subject.archived = True
     mock_db.get.return_value = sample_subject
-    mock_db.query().filter().first.return_value = Subject(id=200)
+    mock_db.scalars.return_value.first.return_value = Subject(id=200)
 
     request = StatusRequest(status=False)
 
@@ -140,12 +175,11 @@ async def test_change_status_unarchive_duplicate(mock_db, teacher_user, sample_s
 
 @pytest.mark.asyncio
 async def test_change_teacher_success(mock_db, sample_subject):
-    with patch("subjects.service.fm") as mock_fm:
-        mock_fm.send_message = AsyncMock()
+    with patch("subjects.service.enqueue_email") as mock_enqueue:
 
         new_teacher = User(id=5, email="new@test.com", full_name="New T", role=Role.TEACHER)
         mock_db.get.side_effect = [sample_subject, new_teacher]
-        mock_db.query().filter().first.return_value = None
+        mock_db.scalars.return_value.first.return_value = None
 
         request = TeacherRequest(teacher_id=5)
 
@@ -153,17 +187,143 @@ async def test_change_teacher_success(mock_db, sample_subject):
 
         assert result.teacher_id == 5
         mock_db.commit.assert_called_once()
-        mock_fm.send_message.assert_called_once()
+        assert mock_enqueue.call_count == 2
 
 @pytest.mark.asyncio
 async def test_change_teacher_duplicate_assignment(mock_db, sample_subject):
     new_teacher = User(id=5, role=Role.TEACHER)
     mock_db.get.side_effect = [sample_subject, new_teacher]
-    mock_db.query().filter().first.return_value = Subject()
+    mock_db.scalars.return_value.first.return_value = Subject()
 
     request = TeacherRequest(teacher_id=5)
 
     with pytest.raises(HTTPException) as exc:
         await change_teacher(request, sample_subject.id, mock_db)
 
-    assert exc.value.status_code == 400
\ No newline at end of file
+    assert exc.value.status_code == 400
+
+async def seed_subject(db, students=30):
+    roster = [
+        Student(id=100 + i, email=f"s{i}@school.com", hashed_password="x", full_name=f"Student {i}",
+                date_of_birth=datetime(2010, 1, 1))
+        for i in range(students)
+    ]
+    parents = [
+        Parent(id=1000 + i, email=f"p{i}@school.com", hashed_password="x", full_name=f"Parent {i}",
+               date_of_birth=datetime(1980, 1, 1), children=[s])
+        for i, s in enumerate(roster)
+    ]
+    db.add_all([
+        User(id=1, email="teacher@school.com", hashed_password="x", full_name="Teacher", role=Role.TEACHER,
+             date_of_birth=datetime(1980, 1, 1)),
+        *roster, *parents,
+        Subject(id=1, name="Math", teacher_id=1, students=roster),
+        SubjectMaterial(id=7, title="Notes", file_path="materials/notes.pdf", subject_id=1),
+    ])
+    await db.commit()
+    db.expunge_all()
+
+@pytest.mark.asyncio
+async def test_loading_subject_and_parent_does_not_pull_rosters(sqlite_db, sql_statements):
+    await seed_subject(sqlite_db)
+    sql_statements.clear()
+
+    await sqlite_db.get(Subject, 1)
+    await sqlite_db.get(User, 1000)
+
+    assert len(sql_statements) == 2
+
+@pytest.mark.asyncio
+async def test_build_subject_response_uses_id_queries(sqlite_db, sql_statements):
+    await seed_subject(sqlite_db)
+    subject = await sqlite_db.get(Subject, 1)
+    sql_statements.clear()
+
+    response = await build_subject_response(subject, sqlite_db)
+
+    assert sorted(response.students_ids) == list(range(100, 130))
+    assert response.materials_ids == [7]
+    assert len(sql_statements) == 2
+    assert not any("FROM users" in s for s in sql_statements)
+
+
+async def chunks(*parts: bytes):
+    for part in parts:
+        yield part
+
+@pytest.mark.asyncio
+async def test_resumable_material_upload(sqlite_db, teacher_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_storage, "root", str(tmp_path / "media"))
+    monkeypatch.setattr(storage.uploads, "MEDIA_UPLOADS_PATH", str(tmp_path / "uploads"))
+    await seed_roster(sqlite_db, teacher_user)
+    data = b"recording" * 1000
+
+    request = CreateMaterialUploadRequest(title="Lecture 1", filename="lecture.mp4", length=len(data))
+    session = await create_material_upload(teacher_user, request, 1, sqlite_db)
+    await upload_material_chunk(teacher_user, 1, session.id, 0, chunks(data[:4000]))
+    await upload_material_chunk(teacher_user, 1, session.id, 4000, chunks(data[4000:]))
+    assert (await build_upload_response(session)).offset == len(data)
+
+    material = await complete_material_upload(teacher_user, 1, session.id, sqlite_db)
+
+    assert material.title == "Lecture 1"
+    assert (tmp_path / "media" / material.file_path).read_bytes() == data
+    assert (await sqlite_db.scalars(select(EmailOutbox))).all()
+    with pytest.raises(HTTPException) as exc:
+        await complete_material_upload(teacher_user, 1, session.id, sqlite_db)
+    assert exc.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_resumable_upload_belongs_to_its_subject(sqlite_db, teacher_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(storage.uploads, "MEDIA_UPLOADS_PATH", str(tmp_path))
+    await seed_roster(sqlite_db, teacher_user)
+    sqlite_db.add(Subject(id=2, name="Art", teacher_id=teacher_user.id))
+    await sqlite_db.commit()
+
+    request = CreateMaterialUploadRequest(title="Lecture 1", filename="lecture.mp4", length=10)
+    session = await create_material_upload(teacher_user, request, 1, sqlite_db)
+    with pytest.raises(HTTPException) as exc:
+        await upload_material_chunk(teacher_user, 2, session.id, 0, chunks(b"0123456789"))
+    assert exc.value.status_code == 404
+
+def test_archive_names_are_unique_and_flat():
+    materials = [
+        SubjectMaterial(id=1, title="Notes", file_path="blobs/aa/aa.pdf"),
+        SubjectMaterial(id=2, title="notes.PDF", file_path="blobs/bb/bb.pdf"),
+        SubjectMaterial(id=3, title="../week 1/slides", file_path="blobs/cc/cc.pptx"),
+        SubjectMaterial(id=4, title=" ", file_path="blobs/dd/dd.txt"),
+    ]
+    assert archive_names(materials) == ["Notes.pdf", "notes (2).pdf", ".._week 1_slides.pptx", "material-4.txt"]
+
+@pytest.mark.asyncio
+async def test_materials_archive_streams_every_file(sqlite_db, teacher_user, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_storage, "root", str(tmp_path))
+    await seed_roster(sqlite_db, teacher_user)
+    (tmp_path / "blobs").mkdir()
+    (tmp_path / "blobs" / "notes.txt").write_bytes(b"notes " * 1000)
+    (tmp_path / "blobs" / "slides.pdf").write_bytes(b"%PDF-1.4 slides")
+    sqlite_db.add_all([
+        SubjectMaterial(id=1, title="Notes", file_path="blobs/notes.txt", subject_id=1, uploaded_at=datetime(2025, 1, 1)),
+        SubjectMaterial(id=2, title="Slides", file_path="blobs/slides.pdf", subject_id=1, uploaded_at=datetime(2025, 1, 2)),
+        SubjectMaterial(id=3, title="Lost", file_path="blobs/lost.pdf", subject_id=1, uploaded_at=datetime(2025, 1, 3)),
+    ])
+    await sqlite_db.commit()
+
+    subject, materials = await get_materials_archive(teacher_user, 1, sqlite_db)
+    data = b"".join([chunk async for chunk in stream_materials_archive(materials)])
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert subject.name == "Math"
+    assert archive.namelist() == ["Notes.txt", "Slides.pdf"]
+    assert archive.read("Notes.txt") == b"notes " * 1000
+    assert archive.getinfo("Notes.txt").compress_type == zipfile.ZIP_DEFLATED
+    assert archive.getinfo("Slides.pdf").compress_type == zipfile.ZIP_STORED
+
+@pytest.mark.asyncio
+async def test_materials_archive_requires_subject_access(sqlite_db, teacher_user):
+    await seed_roster(sqlite_db, teacher_user)
+    outsider = User(id=555, role=Role.TEACHER)
+
+    with pytest.raises(HTTPException) as exc:
+        await get_materials_archive(outsider, 1, sqlite_db)
+    assert exc.value.status_code == 403
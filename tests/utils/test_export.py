@@ -0,0 +1,53 @@
+import csv
+import io
+import json
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from database import Base
+from grades.models import Grade, GradeType
+from grades.schemas import GradeFilters
+from grades.service import export_grades_statement
+from utils.export import ExportFormat, export_rows
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Grade), [
+            {"id": i, "student_id": 1 + i % 2, "subject_id": 1, "grade": 5.0, "grade_type": GradeType.EXAM,
+             "created_at": datetime(2025, 1, 1, 8, 0, i)}
+            for i in range(1, 6)
+        ])
+    yield async_sessionmaker(bind=engine)
+    await engine.dispose()
+
+
+async def collect(statement, export_format, session_factory) -> list[str]:
+    return [chunk async for chunk in export_rows(statement, export_format, session_factory, batch_size=2)]
+
+
+@pytest.mark.asyncio
+async def test_export_grades_ndjson_streams_in_batches(session_factory):
+    chunks = await collect(export_grades_statement(GradeFilters()), ExportFormat.NDJSON, session_factory)
+
+    assert len(chunks) == 3
+    rows = [json.loads(line) for line in "".join(chunks).splitlines()]
+    assert [r["id"] for r in rows] == [1, 2, 3, 4, 5]
+    assert rows[0] == {"id": 1, "student_id": 2, "subject_id": 1, "grade": 5.0, "type": "EXAM",
+                       "created_at": "2025-01-01T08:00:01"}
+
+
+@pytest.mark.asyncio
+async def test_export_grades_csv_applies_filters(session_factory):
+    chunks = await collect(export_grades_statement(GradeFilters(student_id=1)), ExportFormat.CSV, session_factory)
+
+    rows = list(csv.reader(io.StringIO("".join(chunks))))
+    assert rows[0] == ["id", "student_id", "subject_id", "grade", "type", "created_at"]
+    assert [r[0] for r in rows[1:]] == ["2", "4"]
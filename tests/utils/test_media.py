@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import FastAPI, Request, UploadFile
+from fastapi.testclient import TestClient
+from starlette.exceptions import HTTPException
+
+import utils.media
+from storage.backends import media_storage
+from utils.media import save_file, media_response
+
+
+@pytest.fixture
+def media_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(media_storage, "root", str(tmp_path))
+    return tmp_path
+
+@pytest.mark.asyncio
+async def test_save_file_streams_and_hashes(media_dir):
+    data = os.urandom(10_000)
+    upload = UploadFile(file=io.BytesIO(data), filename="notes.pdf")
+
+    saved = await save_file(upload, "materials", chunk_bytes=1024)
+
+    sha256 = hashlib.sha256(data).hexdigest()
+    assert saved.path == f"materials/{sha256[:2]}/{sha256}.pdf"
+    assert saved.size == len(data)
+    assert saved.sha256 == sha256
+    assert saved.written
+    assert (media_dir / saved.path).read_bytes() == data
+    assert os.listdir(media_dir / "materials" / sha256[:2]) == [os.path.basename(saved.path)]
+
+@pytest.mark.asyncio
+async def test_save_file_skips_known_content(media_dir):
+    data = os.urandom(10_000)
+    first = await save_file(UploadFile(file=io.BytesIO(data), filename="notes.pdf"), "materials")
+    os.utime(media_dir / first.path, (0, 0))
+
+    second = await save_file(UploadFile(file=io.BytesIO(data), filename="copy.PDF"), "materials")
+
+    assert second.path == first.path
+    assert not second.written
+    assert os.path.getmtime(media_dir / first.path) == 0
+
+@pytest.mark.asyncio
+async def test_save_file_rejects_oversized_stream(media_dir):
+    upload = UploadFile(file=io.BytesIO(b"x" * 5000), filename="big.pdf")
+
+    with pytest.raises(HTTPException) as exc:
+        await save_file(upload, "materials", max_bytes=4096, chunk_bytes=1024)
+
+    assert exc.value.status_code == 413
+    assert not (media_dir / "materials").exists()
+    assert upload.file.closed
+
+@pytest.mark.asyncio
+async def test_save_file_rejects_declared_size(media_dir):
+    upload = UploadFile(file=io.BytesIO(b"x"), filename="big.pdf", size=10_000)
+
+    with pytest.raises(HTTPException) as exc:
+        await save_file(upload, "materials", max_bytes=4096)
+
+    assert exc.value.status_code == 413
+    assert not (media_dir / "materials").exists()
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_uploads(media_dir):
+    data = os.urandom(100_000)
+
+    saved = await asyncio.gather(*(save_file(UploadFile(file=io.BytesIO(data), filename="a.pdf"), "materials",
+                                             chunk_bytes=1024) for _ in range(4)))
+
+    assert len({s.path for s in saved}) == 1
+    assert (media_dir / saved[0].path).read_bytes() == data
+    assert len(os.listdir((media_dir / saved[0].path).parent)) == 1
+
+@pytest.fixture
+def media_client(media_dir):
+    app = FastAPI()
+
+    @app.get("/media/{file_path:path}")
+    async def media(request: Request, file_path: str):
+        return await media_response(request, file_path)
+
+    return TestClient(app)
+
+@pytest.mark.asyncio
+async def test_media_content_addressed_etag_and_304(media_dir, media_client):
+    data = os.urandom(5000)
+    saved = await save_file(UploadFile(file=io.BytesIO(data), filename="lecture.pdf"), "blobs")
+
+    response = media_client.get(f"/media/{saved.path}")
+    assert response.status_code == 200
+    assert response.content == data
+    assert response.headers["etag"] == f'"{saved.sha256}"'
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    response = media_client.get(f"/media/{saved.path}", headers={"If-None-Match": f'W/"x", "{saved.sha256}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == f'"{saved.sha256}"'
+
+    last_modified = media_client.get(f"/media/{saved.path}").headers["last-modified"]
+    assert media_client.get(f"/media/{saved.path}", headers={"If-Modified-Since": last_modified}).status_code == 304
+
+def test_media_ranges(media_dir, media_client):
+    (media_dir / "materials").mkdir()
+    (media_dir / "materials" / "video.mp4").write_bytes(bytes(range(256)) * 4)
+
+    response = media_client.get("/media/materials/video.mp4", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == bytes(range(10, 20))
+    assert response.headers["content-range"] == "bytes 10-19/1024"
+    etag = response.headers["etag"]
+
+    response = media_client.get("/media/materials/video.mp4", headers={"Range": "bytes=1000-", "If-Range": etag})
+    assert response.status_code == 206 and len(response.content) == 24
+
+    response = media_client.get("/media/materials/video.mp4", headers={"Range": "bytes=0-1", "If-Range": '"stale"'})
+    assert response.status_code == 200 and len(response.content) == 1024
+
+    response = media_client.get("/media/materials/video.mp4", headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+
+def test_media_rejects_paths_outside_media_root(media_dir, media_client, tmp_path_factory):
+    secret = tmp_path_factory.mktemp("outside") / "secret.txt"
+    secret.write_text("secret")
+    (media_dir / "materials").mkdir()
+    (media_dir / "materials" / "link.txt").symlink_to(secret)
+    (media_dir / "materials" / "upload.pdf.part").write_bytes(b"half")
+
+    assert media_client.get(f"/media/..%2F{secret.parent.name}%2Fsecret.txt").status_code == 404
+    assert media_client.get(f"/media/{secret}").status_code == 404
+    assert media_client.get("/media/materials/link.txt").status_code == 404
+    assert media_client.get("/media/materials/upload.pdf.part").status_code == 404
+    assert media_client.get("/media/materials").status_code == 404
+    assert media_client.get("/media/materials/missing.pdf").status_code == 404
+
+@pytest.mark.asyncio
+async def test_signed_media_is_privately_cached_until_expiry(media_dir, monkeypatch):
+    saved = await save_file(UploadFile(file=io.BytesIO(b"notes"), filename="notes.pdf"), "blobs")
+    app = FastAPI()
+
+    @app.get("/media/{file_path:path}")
+    async def media(request: Request, file_path: str, expires: int):
+        return await media_response(request, file_path, expires)
+
+    monkeypatch.setattr(utils.media.time, "time", lambda: 1000)
+    response = TestClient(app).get(f"/media/{saved.path}", params={"expires": 1600})
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == "private, max-age=600, immutable"
@@ -0,0 +1,59 @@
+import io
+import os
+import zipfile
+from datetime import datetime
+
+import pytest
+
+import utils.zipstream
+from utils.zipstream import ZipMember, stream_zip
+
+
+def member(name: str, data: bytes, compress: bool = True, chunk: int = 1000) -> ZipMember:
+    async def chunks():
+        for i in range(0, len(data), chunk):
+            yield data[i:i + chunk]
+
+    return ZipMember(name=name, modified=datetime(2025, 3, 14, 15, 9, 26), size=len(data), chunks=chunks,
+                     compress=compress)
+
+async def build(*members: ZipMember) -> bytes:
+    async def listed():
+        for item in members:
+            yield item
+
+    return b"".join([chunk async for chunk in stream_zip(listed())])
+
+@pytest.mark.asyncio
+async def test_stream_zip_is_readable():
+    text = b"lesson notes\n" * 5000
+    video = os.urandom(20000)
+    archive = zipfile.ZipFile(io.BytesIO(await build(
+        member("notes.txt", text),
+        member("Лекция.mp4", video, compress=False),
+        member("empty.txt", b""),
+    )))
+
+    assert archive.testzip() is None
+    assert archive.namelist() == ["notes.txt", "Лекция.mp4", "empty.txt"]
+    assert archive.read("notes.txt") == text
+    assert archive.read("Лекция.mp4") == video
+    assert archive.read("empty.txt") == b""
+
+    notes, lecture, _ = archive.infolist()
+    assert notes.compress_type == zipfile.ZIP_DEFLATED and notes.compress_size < len(text) // 10
+    assert lecture.compress_type == zipfile.ZIP_STORED and lecture.compress_size == len(video)
+    assert notes.date_time == (2025, 3, 14, 15, 9, 26)
+
+@pytest.mark.asyncio
+async def test_stream_zip_uses_zip64_past_the_limits(monkeypatch):
+    # The real limits need 4 GiB of data; lowering them exercises the same records.
+    monkeypatch.setattr(utils.zipstream, "ZIP64_LIMIT", 1000)
+    monkeypatch.setattr(utils.zipstream, "ZIP64_COUNT_LIMIT", 2)
+    files = {f"part-{i}.bin": os.urandom(1500) for i in range(3)}
+    data = await build(*(member(name, content, compress=False) for name, content in files.items()))
+
+    archive = zipfile.ZipFile(io.BytesIO(data))
+    assert archive.testzip() is None
+    assert {name: archive.read(name) for name in archive.namelist()} == files
+    assert b"PK\x06\x06" in data
@@ -0,0 +1,76 @@
+import csv
+import enum
+import io
+import json
+import os
+from datetime import datetime
+from typing import AsyncIterator, List
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.responses import StreamingResponse
+
+from database import ReadSessionLocal
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+
+class ExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _plain(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.name
+    return value
+
+
+def encode_ndjson(columns: List[str], rows) -> str:
+    return "".join(
+        json.dumps(dict(zip(columns, map(_plain, row))), separators=(",", ":")) + "\n"
+        for row in rows
+    )
+
+
+def encode_csv(rows) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_plain(value) for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+async def export_rows(
+        statement: Select,
+        export_format: ExportFormat,
+        session_factory: async_sessionmaker = ReadSessionLocal,
+        batch_size: int = EXPORT_BATCH_SIZE,
+) -> AsyncIterator[str]:
+    # Column-only selects come back as plain tuples, so no ORM identity map or per-row validation is involved.
+    columns = [column.name for column in statement.selected_columns]
+    if export_format == ExportFormat.CSV:
+        yield encode_csv([columns])
+
+    # The request's session is gone by the time the body streams, so the export holds its own connection.
+    async with session_factory() as db:
+        result = await db.stream(statement.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            if export_format == ExportFormat.CSV:
+                yield encode_csv(rows)
+            else:
+                yield encode_ndjson(columns, rows)
+
+
+def export_response(statement: Select, export_format: ExportFormat, name: str) -> StreamingResponse:
+    return StreamingResponse(
+        export_rows(statement, export_format),
+        media_type=MEDIA_TYPES[export_format],
+        headers={"Content-Disposition": f'attachment; filename="{name}.{export_format.value}"'},
+    )
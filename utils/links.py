@@ -0,0 +1,45 @@
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import Select, Table, delete, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+_UPSERT_INSERTS = {
+    "sqlite": sqlite.insert,
+    "postgresql": postgresql.insert,
+}
+
+
+def upsert_insert(db: AsyncSession, table: Table):
+    # The dialect's INSERT with ON CONFLICT support, or None where the backend has none.
+    dialect = getattr(db.bind, "dialect", None)
+    dialect_insert = _UPSERT_INSERTS.get(getattr(dialect, "name", None))
+    return dialect_insert(table) if dialect_insert is not None else None
+
+
+def _insert(db: AsyncSession, table: Table):
+    statement = upsert_insert(db, table)
+    if statement is None:
+        return insert(table)
+    return statement.on_conflict_do_nothing()
+
+
+async def add_links(db: AsyncSession, table: Table, pairs: Select) -> List[Tuple[int, int]]:
+    # `pairs` selects candidate rows in the table's column order; only the rows that were actually inserted come back.
+    left, right = table.c
+    candidates = pairs.subquery()
+    candidate_left, candidate_right = candidates.c
+    linked = select(left).where(left == candidate_left, right == candidate_right).exists()
+
+    # NOT EXISTS skips existing links on every backend; ON CONFLICT covers a concurrent writer where available.
+    statement = _insert(db, table).from_select(
+        [left.name, right.name],
+        select(candidate_left, candidate_right).distinct().where(~linked)
+    ).returning(left, right)
+    return [(row[0], row[1]) for row in (await db.execute(statement)).all()]
+
+
+async def remove_links(db: AsyncSession, table: Table, left_id: int, right_ids: Iterable[int]) -> List[int]:
+    left, right = table.c
+    statement = delete(table).where(left == left_id, right.in_(list(right_ids))).returning(right)
+    return list((await db.scalars(statement)).all())
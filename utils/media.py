@@ -1,31 +1,216 @@
+import asyncio
+import hashlib
+import mimetypes
 import os
-import shutil
-import uuid
+import re
+import time
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from typing import BinaryIO
 
 from fastapi import UploadFile
 from starlette import status
 from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
 
-UPLOAD_DIR = os.getenv("MEDIA_PATH", "./media")
+from storage.backends import StorageBackend, ObjectInfo, media_storage
 
+MEDIA_MAX_UPLOAD_BYTES = int(os.getenv("MEDIA_MAX_UPLOAD_BYTES", 50 * 1024 * 1024))
+MEDIA_UPLOAD_CHUNK_BYTES = int(os.getenv("MEDIA_UPLOAD_CHUNK_BYTES", 1024 * 1024))
+# Files that aren't content-addressed can in principle be replaced, so they are cached for a bounded time.
+MEDIA_CACHE_MAX_AGE_SECONDS = int(os.getenv("MEDIA_CACHE_MAX_AGE_SECONDS", 86400))
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
-async def save_file(file: UploadFile, folder: str) -> str:
-    os.makedirs(os.path.join(UPLOAD_DIR, folder), exist_ok=True)
+_CONTENT_ADDRESSED = re.compile(r"^(?P<sha256>[0-9a-f]{64})(\.[^./]*)?$")
+_BYTE_RANGE = re.compile(r"^bytes=(?P<start>\d*)-(?P<end>\d*)$")
 
-    original_filename = file.filename or "unknown_file"
-    extension = os.path.splitext(original_filename)[1]
-    unique_filename = f"{uuid.uuid4()}{extension}"
-    file_path = os.path.join(UPLOAD_DIR, folder, unique_filename)
 
+@dataclass(frozen=True)
+class SavedFile:
+    path: str
+    size: int
+    sha256: str
+    # False when a file with the same content was already stored and nothing was written.
+    written: bool = True
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+        detail=f"File is larger than {max_bytes} bytes"
+    )
+
+def _hash(source: BinaryIO, max_bytes: int, chunk_bytes: int) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    size = 0
+    while chunk := source.read(chunk_bytes):
+        size += len(chunk)
+        if size > max_bytes:
+            raise _too_large(max_bytes)
+        digest.update(chunk)
+    return size, digest.hexdigest()
+
+def content_path(folder: str, sha256: str, extension: str) -> str:
+    return f"{folder}/{sha256[:2]}/{sha256}{extension}"
+
+async def save_file(
+        file: UploadFile,
+        folder: str,
+        max_bytes: int = MEDIA_MAX_UPLOAD_BYTES,
+        chunk_bytes: int = MEDIA_UPLOAD_CHUNK_BYTES,
+        storage: StorageBackend | None = None,
+) -> SavedFile:
+    storage = storage or media_storage
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Could not save file: {str(e)}"
-        )
+        if file.size is not None and file.size > max_bytes:
+            raise _too_large(max_bytes)
+
+        try:
+            # Hashing runs in a worker thread, so the event loop isn't blocked by disk I/O.
+            # The upload is already spooled locally; hashing it first means a duplicate is never written again.
+            size, sha256 = await asyncio.to_thread(_hash, file.file, max_bytes, chunk_bytes)
+
+            extension = os.path.splitext(file.filename or "")[1].lower()
+            relative_path = content_path(folder, sha256, extension)
+            if await storage.head(relative_path) is not None:
+                return SavedFile(path=relative_path, size=size, sha256=sha256, written=False)
+
+            file.file.seek(0)
+            await storage.put(relative_path, file.file, size, sha256)
+        except HTTPException:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Could not save file: {str(e)}"
+            )
     finally:
         await file.close()
 
-    return os.path.join(folder, unique_filename)
\ No newline at end of file
+    return SavedFile(path=relative_path, size=size, sha256=sha256)
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="File was not found"
+    )
+
+def _check_key(relative_path: str) -> None:
+    parts = relative_path.split("/")
+    # Keys are plain relative paths; unfinished uploads aren't served either.
+    if relative_path.startswith("/") or "" in parts or ".." in parts or "." in parts \
+            or relative_path.endswith(".part"):
+        raise _not_found()
+
+def _validators(relative_path: str, info: ObjectInfo, expires: int | None) -> tuple[str, str]:
+    name = relative_path.rsplit("/", 1)[-1]
+    match = _CONTENT_ADDRESSED.match(name)
+    immutable = bool(match) and relative_path.split("/")[-2:-1] == [name[:2]]
+    if immutable:
+        etag = f'"{match.group("sha256")}"'
+    else:
+        etag = f'"{info.size:x}-{int(info.modified * 1_000_000):x}"'
+
+    if expires is None:
+        return etag, IMMUTABLE_CACHE_CONTROL if immutable else f"public, max-age={MEDIA_CACHE_MAX_AGE_SECONDS}"
+
+    # A signed link is a per-user grant: shared caches must not keep it, and nobody may reuse it past its expiry.
+    max_age = max(0, min(expires - int(time.time()), 31536000 if immutable else MEDIA_CACHE_MAX_AGE_SECONDS))
+    return etag, f"private, max-age={max_age}" + (", immutable" if immutable else "")
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison.
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag in candidates
+
+def _not_modified(request: Request, etag: str, info: ObjectInfo) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(info.modified) <= since
+
+def _byte_range(request: Request, headers: dict, size: int) -> tuple[int, int] | None:
+    range_header = request.headers.get("range")
+    if range_header is None:
+        return None
+    # A stale If-Range means the client's partial copy is outdated, so it gets the whole file.
+    if_range = request.headers.get("if-range")
+    if if_range is not None and if_range not in (headers["etag"], headers["last-modified"]):
+        return None
+
+    # Only single ranges are served; anything else is answered with the whole file, which the RFC allows.
+    match = _BYTE_RANGE.match(range_header.strip())
+    if match is None:
+        return None
+    first, last = match.group("start"), match.group("end")
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+        if last and end < start:
+            return None
+    elif last:
+        # "bytes=-N" asks for the last N bytes.
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        return None
+    end = min(end, size - 1)
+
+    if start >= size:
+        raise HTTPException(
+            status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+            detail="Requested range is not satisfiable",
+            headers={"content-range": f"bytes */{size}"}
+        )
+    return start, end
+
+async def media_response(
+        request: Request,
+        relative_path: str,
+        expires: int | None = None,
+        storage: StorageBackend | None = None,
+) -> Response:
+    storage = storage or media_storage
+    _check_key(relative_path)
+    try:
+        info = await storage.head(relative_path)
+    except FileNotFoundError:
+        info = None
+    if info is None:
+        raise _not_found()
+
+    etag, cache_control = _validators(relative_path, info, expires)
+    headers = {
+        "etag": etag,
+        "cache-control": cache_control,
+        "last-modified": formatdate(info.modified, usegmt=True),
+        "accept-ranges": "bytes",
+    }
+    if request.method in ("GET", "HEAD") and _not_modified(request, etag, info):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    byte_range = _byte_range(request, headers, info.size)
+    status_code = status.HTTP_200_OK
+    start, end = 0, info.size - 1
+    if byte_range is not None:
+        status_code = status.HTTP_206_PARTIAL_CONTENT
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{info.size}"
+    headers["content-length"] = str(end - start + 1)
+
+    media_type = mimetypes.guess_type(relative_path)[0] or "application/octet-stream"
+    if request.method == "HEAD" or end < start:
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    # The body is streamed from the backend chunk by chunk, so large files are never held in memory.
+    return StreamingResponse(storage.stream(relative_path, start, end), status_code=status_code,
+                             headers=headers, media_type=media_type)
@@ -0,0 +1,33 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Tuple
+
+from starlette import status
+from starlette.exceptions import HTTPException
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    payload = json.dumps([created_at.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        ) from e
+
+
+def split_page(rows: list[Any], limit: int, sort_key: str = "created_at") -> Tuple[list[Any], str | None]:
+    # Callers fetch limit + 1 rows; the extra row only tells us whether there is a next page.
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(getattr(last, sort_key), last.id)
@@ -0,0 +1,135 @@
+import asyncio
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, Callable, List
+
+# Sizes and offsets at or above this need the ZIP64 extensions.
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+# Data descriptor after each entry, and UTF-8 names.
+_FLAGS = 0x0808
+_STORED = 0
+_DEFLATED = 8
+
+
+@dataclass(frozen=True)
+class ZipMember:
+    name: str
+    modified: datetime
+    size: int
+    chunks: Callable[[], AsyncIterator[bytes]]
+    # Already-compressed formats are stored as they are; deflating them again only costs CPU.
+    compress: bool = True
+
+
+@dataclass(frozen=True)
+class _Written:
+    name: bytes
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    size: int
+    offset: int
+
+
+def _dos_timestamp(modified: datetime) -> tuple[int, int]:
+    modified = max(modified, datetime(1980, 1, 1))
+    dos_date = (modified.year - 1980) << 9 | modified.month << 5 | modified.day
+    dos_time = modified.hour << 11 | modified.minute << 5 | modified.second // 2
+    return dos_time, dos_date
+
+def _local_header(name: bytes, method: int, dos_time: int, dos_date: int, zip64: bool) -> bytes:
+    # Sizes and CRC aren't known before the data has gone out, so they follow it in the data descriptor.
+    extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+    placeholder = 0xFFFFFFFF if zip64 else 0
+    return struct.pack(
+        "<IHHHHHIIIHH", 0x04034B50, 45 if zip64 else 20, _FLAGS, method, dos_time, dos_date,
+        0, placeholder, placeholder, len(name), len(extra),
+    ) + name + extra
+
+def _data_descriptor(crc: int, compressed_size: int, size: int, zip64: bool) -> bytes:
+    if zip64:
+        return struct.pack("<IIQQ", 0x08074B50, crc, compressed_size, size)
+    return struct.pack("<IIII", 0x08074B50, crc, compressed_size, size)
+
+def _central_header(entry: _Written) -> bytes:
+    fields = []
+    size, compressed_size, offset = entry.size, entry.compressed_size, entry.offset
+    if size >= ZIP64_LIMIT:
+        fields.append(size)
+        size = 0xFFFFFFFF
+    if compressed_size >= ZIP64_LIMIT:
+        fields.append(compressed_size)
+        compressed_size = 0xFFFFFFFF
+    if offset >= ZIP64_LIMIT:
+        fields.append(offset)
+        offset = 0xFFFFFFFF
+    extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields) if fields else b""
+    version = 45 if fields else 20
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII", 0x02014B50, 3 << 8 | version, version, _FLAGS, entry.method,
+        entry.dos_time, entry.dos_date, entry.crc, compressed_size, size, len(entry.name), len(extra),
+        0, 0, 0, 0o100644 << 16, offset,
+    ) + entry.name + extra
+
+def _end_records(count: int, directory_size: int, directory_offset: int) -> bytes:
+    records = b""
+    if count >= ZIP64_COUNT_LIMIT or directory_size >= ZIP64_LIMIT or directory_offset >= ZIP64_LIMIT:
+        zip64_offset = directory_offset + directory_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0,
+                               count, count, directory_size, directory_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1)
+    records += struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+        min(directory_size, 0xFFFFFFFF), min(directory_offset, 0xFFFFFFFF), 0,
+    )
+    return records
+
+async def stream_zip(members: AsyncIterator[ZipMember]) -> AsyncIterator[bytes]:
+    # Only the central directory (one small record per member) is kept; file data passes straight through.
+    written: List[_Written] = []
+    offset = 0
+    async for member in members:
+        name = member.name.encode()
+        # Deflate output can be slightly larger than its input, so entries near the limit are stored instead.
+        method = _DEFLATED if member.compress and member.size < ZIP64_LIMIT // 2 else _STORED
+        zip64 = member.size >= ZIP64_LIMIT
+        dos_time, dos_date = _dos_timestamp(member.modified)
+
+        header = _local_header(name, method, dos_time, dos_date, zip64)
+        yield header
+
+        crc = 0
+        size = 0
+        compressed_size = 0
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) if method == _DEFLATED else None
+        async for chunk in member.chunks():
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            if compressor is not None:
+                chunk = await asyncio.to_thread(compressor.compress, chunk)
+            if chunk:
+                compressed_size += len(chunk)
+                yield chunk
+        if compressor is not None:
+            tail = compressor.flush()
+            compressed_size += len(tail)
+            yield tail
+
+        descriptor = _data_descriptor(crc, compressed_size, size, zip64)
+        yield descriptor
+
+        written.append(_Written(name, method, dos_time, dos_date, crc, compressed_size, size, offset))
+        offset += len(header) + compressed_size + len(descriptor)
+
+    directory_size = 0
+    for entry in written:
+        record = _central_header(entry)
+        directory_size += len(record)
+        yield record
+    yield _end_records(len(written), directory_size, offset)